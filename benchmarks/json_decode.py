@@ -0,0 +1,102 @@
+"""
+Micro-benchmark for Graph page decoding.
+
+Compares the previous response.json() + dict.get row building with
+utils.graph_json.decode_page on the stdlib json backend and, when installed,
+on orjson.
+
+Usage (from the repository root):
+    python benchmarks/json_decode.py [recorded_page.json ...]
+
+Recorded pages are raw /auditLogs/signIns response bodies. Without any, a
+synthetic 999-record page is used.
+"""
+import json
+import os
+import sys
+import timeit
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import graph_json
+from utils.data_fetcher import _signin_record_row
+
+REPEAT = 5
+NUMBER = 20
+
+def synthetic_page(records=999):
+    """
+    Build a sign-in page body shaped like a $select-ed Graph response.
+
+    Args:
+        records (int): Number of sign-in records
+
+    Returns:
+        bytes: JSON response body
+    """
+    return json.dumps({
+        "@odata.context": "https://graph.microsoft.com/v1.0/$metadata#auditLogs/signIns(id,userId,userDisplayName,createdDateTime)",
+        "@odata.nextLink": "https://graph.microsoft.com/v1.0/auditLogs/signIns?$skiptoken=abc",
+        "value": [
+            {
+                "id": f"{index:08x}-0000-0000-0000-000000000000",
+                "userId": f"{index % 5000:08x}-1111-1111-1111-111111111111",
+                "userDisplayName": f"User {index % 5000}",
+                "createdDateTime": f"2025-04-{1 + index % 28:02d}T{index % 24:02d}:{index % 60:02d}:03Z",
+            }
+            for index in range(records)
+        ],
+    }).encode("utf-8")
+
+def decode_stdlib_get(response):
+    """Previous path: decode with the stdlib, then rebuild each row with dict.get."""
+    data = json.loads(response.content)
+    return [
+        {
+            "id": signin.get("id", ""),
+            "userId": signin.get("userId", "N/A"),
+            "userDisplayName": signin.get("userDisplayName", "N/A"),
+            "signInDateTime": signin.get("createdDateTime", "N/A"),
+        }
+        for signin in data.get("value", [])
+    ], data.get("@odata.nextLink")
+
+def decode_with(backend):
+    """Return a decode_page call bound to one backend."""
+    def decode(response):
+        saved = graph_json.orjson
+        graph_json.orjson = backend
+        try:
+            return graph_json.decode_page(response, _signin_record_row)
+        finally:
+            graph_json.orjson = saved
+    return decode
+
+def main(paths):
+    if paths:
+        pages = []
+        for path in paths:
+            with open(path, mode="rb") as file:
+                pages.append((os.path.basename(path), file.read()))
+    else:
+        pages = [("synthetic", synthetic_page())]
+
+    candidates = [("json + dict.get", decode_stdlib_get), ("decode_page (json)", decode_with(None))]
+    if graph_json.orjson is not None:
+        candidates.append(("decode_page (orjson)", decode_with(graph_json.orjson)))
+    else:
+        print("orjson is not installed; pip install -r requirements.txt to include it")
+
+    for name, content in pages:
+        response = SimpleNamespace(content=content)
+        records = len(json.loads(content).get("value", []))
+        print(f"\n{name}: {len(content) / 1024:.0f} KiB, {records} records")
+        baseline = None
+        for label, decode in candidates:
+            best = min(timeit.repeat(lambda: decode(response), repeat=REPEAT, number=NUMBER)) / NUMBER
+            baseline = baseline or best
+            print(f"  {label:<22} {best * 1000:8.2f} ms/page  {baseline / best:5.2f}x")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
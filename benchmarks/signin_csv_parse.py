@@ -0,0 +1,91 @@
+"""
+Benchmark for reducing signin_logs.csv to the latest sign-in per user.
+
+Compares the previous csv.DictReader row loop (with its per-row debug
+logging disabled, so only parsing is measured) with the vectorized
+utils.ai_analyzer._read_signin_csv, and checks that both return the same
+mapping.
+
+Usage (from the repository root):
+    python benchmarks/signin_csv_parse.py [signin_logs.csv]
+
+Without a file, 1,000,000 synthetic sign-ins in the current column schema
+are written to a temporary file.
+"""
+import csv
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.ai_analyzer import _read_signin_csv
+
+SYNTHETIC_ROWS = 1000000
+
+def write_synthetic_csv(path, rows=SYNTHETIC_ROWS):
+    """
+    Write a sign-in CSV shaped like the fetcher's output.
+
+    Args:
+        path (str): Output file path
+        rows (int): Number of sign-ins
+    """
+    with open(path, mode="w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["id", "userId", "userDisplayName", "signInDateTime", "collectionDate"])
+        for index in range(rows):
+            writer.writerow([
+                f"{index:08x}-0000-0000-0000-000000000000",
+                f"{index % 20000:08x}-1111-1111-1111-111111111111",
+                f"User {index % 20000}",
+                f"2025-04-{1 + index % 28:02d}T{index % 24:02d}:{index % 60:02d}:{index % 59:02d}Z",
+                "2025-04-30T00:00:00Z",
+            ])
+
+def legacy_read(csv_file):
+    """Previous read_signin_logs CSV loop, without logging."""
+    signin_data = {}
+    with open(csv_file, mode="r", newline="", encoding="utf-8") as file:
+        for row in list(csv.DictReader(file)):
+            user_id = row.get("User ID", row.get("userId"))
+            if not user_id:
+                continue
+            signin_time = row.get("Sign-In Date", row.get("signInDateTime"))
+            if signin_time == "N/A":
+                continue
+            try:
+                if "Z" in signin_time:
+                    signin_date = datetime.strptime(signin_time, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+                else:
+                    signin_date = datetime.fromisoformat(signin_time.replace("Z", "+00:00"))
+            except ValueError:
+                continue
+            if user_id not in signin_data or signin_date > signin_data[user_id]:
+                signin_data[user_id] = signin_date
+    return signin_data
+
+def timed(read, csv_file):
+    """Run a reader once and return (result, seconds)."""
+    started = time.perf_counter()
+    result = read(csv_file)
+    return result, time.perf_counter() - started
+
+def main(paths):
+    if paths:
+        csv_file = paths[0]
+    else:
+        csv_file = os.path.join(tempfile.mkdtemp(), "signin_logs.csv")
+        write_synthetic_csv(csv_file)
+
+    legacy, legacy_seconds = timed(legacy_read, csv_file)
+    vectorized, vectorized_seconds = timed(_read_signin_csv, csv_file)
+    assert vectorized == legacy, "vectorized result differs from the legacy parser"
+    print(f"{os.path.getsize(csv_file) / 1024 / 1024:.0f} MiB, {len(legacy)} users")
+    print(f"  csv.DictReader loop  {legacy_seconds:7.2f} s")
+    print(f"  _read_signin_csv     {vectorized_seconds:7.2f} s  {legacy_seconds / vectorized_seconds:5.1f}x")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,83 @@
+"""
+Memory benchmark for the users_data representation.
+
+Compares a list of users_data dictionaries with utils.user_table.UserTable,
+both built from the same decoded JSON, using tracemalloc.
+
+Usage (from the repository root):
+    python benchmarks/user_table_memory.py [users_snapshot.json]
+
+Without a snapshot, 100,000 synthetic users are used.
+"""
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.user_table import UserTable
+
+SYNTHETIC_USERS = 100000
+
+def synthetic_users(count=SYNTHETIC_USERS):
+    """
+    Build users_data rows with repeating departments, titles, types and groups.
+
+    Args:
+        count (int): Number of users
+
+    Returns:
+        bytes: JSON array of user data dictionaries
+    """
+    departments = [f"Department {index}" for index in range(40)]
+    titles = [f"Job Title {index}" for index in range(300)]
+    groups = [f"Group {index}" for index in range(500)]
+    return json.dumps([
+        {
+            "User ID": f"{index:08x}-1111-1111-1111-111111111111",
+            "User Principal Name": f"user{index}@contoso.onmicrosoft.com",
+            "Display Name": f"User {index}",
+            "Job Title": titles[index % len(titles)],
+            "Department": departments[index % len(departments)],
+            "Account Enabled": "false" if index % 7 == 0 else "true",
+            "User Type": "Guest" if index % 11 == 0 else "Member",
+            "Groups": ", ".join(groups[(index * step) % len(groups)] for step in range(1, 1 + index % 6)) or "No groups",
+        }
+        for index in range(count)
+    ]).encode("utf-8")
+
+def measure(build, content):
+    """
+    Measure the memory retained by a users_data representation.
+
+    Args:
+        build (callable): Builds the representation from decoded JSON
+        content (bytes): JSON array of user data dictionaries
+
+    Returns:
+        tuple: (representation, retained bytes)
+    """
+    tracemalloc.start()
+    representation = build(json.loads(content))
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return representation, retained
+
+def main(paths):
+    if paths:
+        with open(paths[0], mode="rb") as file:
+            content = json.dumps(json.load(file)["users"]).encode("utf-8")
+    else:
+        content = synthetic_users()
+
+    users, dict_bytes = measure(lambda users: users, content)
+    table, table_bytes = measure(UserTable.from_users, content)
+    count = len(users)
+    assert table.to_dicts() == users
+    print(f"{count} users, {table.group_count} groups")
+    print(f"  list of dicts  {dict_bytes / count:8.0f} bytes/user")
+    print(f"  UserTable      {table_bytes / count:8.0f} bytes/user  {dict_bytes / table_bytes:5.2f}x smaller")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,6 +1,11 @@
 import streamlit as st
 import pandas as pd
-from utils.data_fetcher import fetch_signin_logs, fetch_users
+from utils.data_fetcher import fetch_signin_logs, sync_users, save_users_delta_link, fetch_group_memberships
+from utils.graph_client import get_graph_client
+from utils.fetch_orchestrator import run_fetches
+from utils.membership_index import get_membership_index
+from utils.signin_store import SignInStore
+from utils.user_snapshot import get_snapshot_registry, get_users_data, publish_users, show_snapshot_freshness
 from utils.logger import setup_logger
 import os
 from dotenv import load_dotenv
@@ -18,35 +23,174 @@ logger = setup_logger("fetch_data", "logs/app.log")
 st.title("Fetch Data")
 st.markdown("Fetch user and sign-in data from Microsoft Graph to begin analysis.")
 
-# Session state initialization
-if "users_data" not in st.session_state:
-    st.session_state.users_data = []
-    logger.debug("Initialized users_data in session state")
+# Session state initialization: start from the persisted user snapshot, if any
+get_users_data()
+logger.debug(f"Initialized users_data in session state: {len(st.session_state.users_data)} users")
+show_snapshot_freshness(refresh_link=False)
+
+# Fetch options
+fetch_mode = st.radio(
+    "Fetch mode:",
+    options=["Incremental sync", "Full refresh"],
+    index=0,
+    help="Incremental sync downloads only users added, changed or deleted since the last fetch. Full refresh re-downloads the whole directory."
+)
+with st.expander("Advanced fetch options"):
+    user_partitions = st.number_input(
+        "User fetch partitions:",
+        min_value=1,
+        max_value=26,
+        value=1,
+        help="Split the user directory into this many userPrincipalName ranges and fetch them in parallel. Use 1 for a serial fetch."
+    )
+    max_workers = st.number_input(
+        "Maximum parallel requests:",
+        min_value=1,
+        max_value=16,
+        value=4,
+        help="Upper bound on concurrent Microsoft Graph requests, split evenly between the sign-in, user and group fetches that run together (each gets at least one). Lower this if you see throttling (HTTP 429) errors."
+    )
+    signin_shard_hours = st.number_input(
+        "Sign-in shard size (hours, 0 = no sharding):",
+        min_value=0,
+        max_value=720,
+        value=0,
+        help="Split the sign-in log window into time shards of this many hours and fetch them in parallel. Sharded fetches cannot be resumed if interrupted."
+    )
+    summarize_signins = st.checkbox(
+        "Store only a per-user sign-in summary",
+        value=False,
+        help="Reduce sign-in logs to each user's latest sign-in, first sign-in and sign-in count while fetching, instead of storing every sign-in event. Use 'Sign-in summary' as the source on the Inactive Users page."
+    )
+    include_signin_activity = st.checkbox(
+        "Include last sign-in activity with users",
+        value=False,
+        help="Request each user's signInActivity (requires Entra ID P1). The Inactive Users page can then skip downloading sign-in logs. Incremental syncs refresh it in a separate pass over all users; syncing without it drops the stored values."
+    )
+    fetch_groups_separately = st.checkbox(
+        "Fetch group memberships from groups",
+        value=False,
+        help="Enumerate groups and their members in parallel instead of expanding memberOf on every user. Faster on large tenants and not limited by Graph's expand caps."
+    )
 
 # Fetch data
 if st.button("Fetch Data"):
     logger.info("Fetch Data button clicked")
     with st.spinner("Fetching data from Microsoft Graph..."):
-        fetch_success = fetch_signin_logs(TENANT_ID, CLIENT_ID, CLIENT_SECRET)
-        if fetch_success:
+        # Changes are applied to the latest shared snapshot, which may be newer than this session's;
+        # a full refresh is a sync with no existing users, which also re-seeds the deltaLink
+        latest_users, _ = get_snapshot_registry().latest()
+        existing_users = latest_users if fetch_mode == "Incremental sync" and latest_users else []
+        # The fetches run side by side, so they share the parallel request budget
+        task_workers = max(1, int(max_workers) // (3 if fetch_groups_separately else 2))
+        # Latest per-shard progress, written by the sign-in fetch and drawn by this thread
+        shard_progress = {"shards": None}
+
+        def report_shards(report, shards):
+            shard_progress["shards"] = shards
+            report(
+                f"{sum(shard['status'] == 'done' for shard in shards)}/{len(shards)} shards done "
+                f"({sum(shard['records'] for shard in shards)} new records so far)"
+            )
+
+        def fetch_signins_task(report):
+            return fetch_signin_logs(
+                TENANT_ID, CLIENT_ID, CLIENT_SECRET,
+                incremental=True,
+                progress_callback=lambda pages, records: report(f"wrote page {pages} ({records} new records so far)"),
+                shard_hours=int(signin_shard_hours),
+                max_workers=task_workers,
+                shard_progress_callback=lambda shards: report_shards(report, shards),
+                aggregate=summarize_signins
+            )
+
+        def fetch_users_task(report):
+            report("syncing users" if existing_users else "fetching all users")
+            return sync_users(
+                TENANT_ID, CLIENT_ID, CLIENT_SECRET,
+                existing_users,
+                partitions=int(user_partitions),
+                max_workers=task_workers,
+                include_signin_activity=include_signin_activity,
+                expand_groups=not fetch_groups_separately
+            )
+
+        # Sign-ins, users and group memberships are independent collections, so fetch them together
+        tasks = {"Sign-in logs": fetch_signins_task, "Users": fetch_users_task}
+        if fetch_groups_separately:
+            tasks["Group memberships"] = lambda report: fetch_group_memberships(
+                TENANT_ID, CLIENT_ID, CLIENT_SECRET, max_workers=task_workers
+            )
+        fetch_progress = st.empty()
+        signin_shards = st.empty()
+
+        def show_progress(progress):
+            fetch_progress.dataframe(pd.DataFrame(progress))
+            # Which sign-in day windows are still loading
+            if shard_progress["shards"]:
+                signin_shards.dataframe(pd.DataFrame(shard_progress["shards"]))
+
+        results = run_fetches(tasks, progress_callback=show_progress)
+
+        if results["Sign-in logs"]:
             logger.info("Successfully fetched and created new sign-in logs file")
         else:
-            logger.warning("Failed to fetch sign-in logs, proceeding with user fetch")
-        st.session_state.users_data = fetch_users(TENANT_ID, CLIENT_ID, CLIENT_SECRET)
-        if st.session_state.users_data:
-            logger.info(f"Successfully retrieved {len(st.session_state.users_data)} users")
-            st.success(f"✅ Successfully retrieved {len(st.session_state.users_data)} users!")
-        else:
+            logger.warning("Failed to fetch sign-in logs")
+        users, users_delta_link = results["Users"] or (None, None)
+        # Without a fetched index, groups come from memberOf on each user and any index on disk is removed
+        membership_index = results["Group memberships"] if fetch_groups_separately else None
+        if users is None:
+            # Nothing is published, so the current snapshot and its user database stay as they are
             logger.error("Failed to retrieve user data")
             st.error("❌ Failed to retrieve user data.")
+        elif fetch_groups_separately and membership_index is None:
+            # The users were fetched without memberOf, so publishing them would drop every membership
+            logger.error("Failed to fetch group memberships; the user snapshot was not updated")
+            st.error("❌ Failed to fetch group memberships. The user snapshot was not updated.")
+        else:
+            logger.info(f"Successfully retrieved {len(users)} users")
+            st.success(f"✅ Successfully retrieved {len(users)} users!")
+            try:
+                # Keep users as a compact table shared with other sessions; memberships come from the index when one was fetched
+                published = publish_users(users, membership_index)
+                # The next sync replays changes from here onto this snapshot version only
+                if users_delta_link:
+                    save_users_delta_link(users_delta_link, published.version)
+            except Exception as e:
+                logger.error(f"Error saving the user snapshot: {str(e)}")
+                st.error(f"Error saving the user snapshot: {str(e)}")
+        graph_stats = get_graph_client().get_stats()
+        if graph_stats["requests"]:
+            logger.info(f"Graph request stats: {graph_stats}")
+            st.caption(
+                f"Graph requests: {graph_stats['requests']} in {graph_stats['total_seconds']:.1f}s | "
+                f"first request {graph_stats['first_seconds'] * 1000:.0f} ms | "
+                f"mean after first {graph_stats['mean_after_first_seconds'] * 1000:.0f} ms | "
+                f"throttled responses {graph_stats['throttled']} | "
+                f"concurrency limit {graph_stats['concurrency_limit']}"
+            )
+
+# Export sign-in logs from the columnar store
+signin_store = SignInStore()
+if signin_store.exists() and st.button("Export Sign-In Logs to CSV", help="Write every stored sign-in to signin_logs.csv."):
+    logger.info("Export Sign-In Logs button clicked")
+    try:
+        exported = signin_store.export_csv("signin_logs.csv")
+        st.success(f"Exported {exported} sign-in logs to signin_logs.csv.")
+    except Exception as e:
+        logger.error(f"Error exporting sign-in logs: {str(e)}")
+        st.error(f"Error exporting sign-in logs: {str(e)}")
 
 # Display fetched users
 if st.session_state.users_data:
-    df_users = pd.DataFrame(st.session_state.users_data)
-    all_groups = [g for user in st.session_state.users_data for g in user["Groups"].split(", ") if user["Groups"] != "No groups"]
-    unique_groups = set(all_groups)
-    logger.debug(f"Total users: {len(df_users)}, Total groups: {len(unique_groups)}")
-    st.write(f"**Total Users**: {len(df_users)} | **Total Groups**: {len(unique_groups)}")
+    df_users = pd.DataFrame(st.session_state.users_data.to_dicts())
+    membership_index = get_membership_index()
+    if membership_index is not None:
+        total_groups = membership_index.group_count
+    else:
+        total_groups = st.session_state.users_data.group_count
+    logger.debug(f"Total users: {len(df_users)}, Total groups: {total_groups}")
+    st.write(f"**Total Users**: {len(df_users)} | **Total Groups**: {total_groups}")
     st.subheader("User Details")
     st.dataframe(df_users)
 else:
@@ -1,8 +1,10 @@
 import streamlit as st
-import pandas as pd
 import matplotlib.pyplot as plt
-from utils.data_fetcher import fetch_signin_logs
-from utils.ai_analyzer import analyze_inactive_users
+from utils.data_fetcher import fetch_signin_logs, fetch_users_by_id, carry_users_delta_link
+from utils.ai_analyzer import SIGNIN_SOURCE_LABELS, analyze_inactive_users, build_signin_index, signin_sources
+from utils.membership_index import get_membership_index
+from utils import user_db
+from utils.user_snapshot import get_users_data, publish_users, show_snapshot_freshness
 from utils.logger import setup_logger
 import os
 from dotenv import load_dotenv
@@ -36,11 +38,17 @@ if "last_analysis_params" not in st.session_state:
 if "analysis_metrics" not in st.session_state:
     st.session_state.analysis_metrics = None
     logger.debug("Initialized analysis_metrics in session state")
+if "signin_index" not in st.session_state:
+    st.session_state.signin_index = None
+    st.session_state.signin_index_params = None
+    logger.debug("Initialized signin_index in session state")
 
-# Check if users_data exists
-if "users_data" not in st.session_state or not st.session_state.users_data:
+# Check if users_data exists, loading the persisted user snapshot in new sessions
+if not get_users_data():
     st.warning("No user data available. Please fetch data from the 'Fetch Data' page first.")
 else:
+    show_snapshot_freshness()
+
     # Input for inactivity days
     st.session_state.inactivity_days = st.number_input(
         "Enter the number of days for inactivity analysis (e.g., 30):",
@@ -50,6 +58,18 @@ else:
         help="Specify the number of days to consider a user inactive. For example, 30 days means users who haven't signed in for 30 days or more."
     )
 
+    # Last sign-in source, shared with the NLP Query page: signInActivity is only available if it was fetched with the users
+    signin_source_options = signin_sources(st.session_state.users_data)
+    selected_source = st.session_state.get("signin_source")
+    signin_source = st.radio(
+        "Last sign-in source:",
+        options=signin_source_options,
+        index=signin_source_options.index(selected_source) if selected_source in signin_source_options else 0,
+        format_func=SIGNIN_SOURCE_LABELS.get,
+        help="User signInActivity reads the last sign-in fetched with each user and needs no sign-in log download. The sign-in audit log covers only the last 30 days. Sign-in summary reads the same audit log but stores only each user's latest sign-in."
+    )
+    st.session_state.signin_source = signin_source
+
     # Columns for buttons
     col1, col2 = st.columns([1, 1])
     with col1:
@@ -63,42 +83,59 @@ else:
         st.session_state.inactive_users = None
         st.session_state.last_analysis_params = None
         st.session_state.analysis_metrics = None
+        st.session_state.signin_index = None
+        st.session_state.signin_index_params = None
         st.success("Analysis reset successfully. You can start a new analysis.")
         st.rerun()
 
+    # The sign-in index depends on the source and the user snapshot but not on the threshold
+    index_params = {
+        "signin_source": signin_source,
+        "dataset_version": st.session_state.users_data.dataset_version
+    }
+    current_params = {"inactivity_days": st.session_state.inactivity_days, **index_params}
+    index_ready = (st.session_state.signin_index is not None and
+                   st.session_state.signin_index_params == index_params)
+    start_time = time.time()
+
     # Analyze inactive users
     if analyze_button:
         logger.info("Analyze Inactive Users button clicked")
         
         # Check if we can use cached results
-        current_params = {"inactivity_days": st.session_state.inactivity_days}
-        if (st.session_state.inactive_users is not None and 
-            st.session_state.last_analysis_params == current_params):
+        if index_ready:
             st.info("Using cached analysis results. Click 'Reset Analysis' to start a new analysis.")
         else:
-            # Fetch sign-in logs with retry logic
-            max_retries = 3
-            fetch_success = False
-            for attempt in range(max_retries):
-                with st.spinner(f"Fetching recent sign-in logs (Attempt {attempt + 1}/{max_retries})..."):
+            if signin_source == "signin_activity":
+                # Last sign-ins come with the users, so there is nothing to download
+                fetch_success = True
+            else:
+                # Throttling and transient errors are retried per page by the Graph client
+                with st.spinner("Fetching new sign-in logs..."):
                     try:
-                        fetch_success = fetch_signin_logs(TENANT_ID, CLIENT_ID, CLIENT_SECRET)
+                        signin_progress = st.empty()
+                        fetch_success = fetch_signin_logs(
+                            TENANT_ID, CLIENT_ID, CLIENT_SECRET,
+                            incremental=True,
+                            progress_callback=lambda pages, records: signin_progress.text(
+                                f"Sign-in logs: wrote page {pages} ({records} new records so far)"
+                            ),
+                            aggregate=signin_source == "audit_summary"
+                        )
+                        signin_progress.empty()
                         if fetch_success:
                             logger.info("Successfully fetched sign-in logs")
-                            break
                         else:
-                            logger.warning(f"Attempt {attempt + 1}: Failed to fetch sign-in logs")
+                            logger.warning("Failed to fetch sign-in logs")
                     except Exception as e:
-                        logger.error(f"Attempt {attempt + 1}: Error fetching sign-in logs: {str(e)}")
-                time.sleep(2)  # Wait before retrying
+                        fetch_success = False
+                        logger.error(f"Error fetching sign-in logs: {str(e)}")
 
             if not fetch_success:
-                st.error("Failed to fetch sign-in logs after multiple attempts. Please check your credentials and network connection.")
-                logger.error("Failed to fetch sign-in logs after all retries")
+                st.error("Failed to fetch sign-in logs. Please check your credentials and network connection.")
+                logger.error("Failed to fetch sign-in logs")
             else:
-                # Analyze inactive users
-                start_time = time.time()
-                total_users = len(st.session_state.users_data)
+                # Index users by last sign-in
                 progress_bar = st.progress(0)
                 status_text = st.empty()
                 
@@ -109,38 +146,53 @@ else:
                     time.sleep(0.01)  # Simulate work
                 
                 try:
-                    st.session_state.inactive_users = analyze_inactive_users(
-                        st.session_state.users_data,
-                        inactivity_days=st.session_state.inactivity_days
-                    )
-                    st.session_state.last_analysis_params = current_params
-                    
-                    # Compute analysis metrics
-                    analysis_time = time.time() - start_time
-                    inactive_count = len(st.session_state.inactive_users) if st.session_state.inactive_users else 0
-                    inactive_percentage = (inactive_count / total_users * 100) if total_users > 0 else 0
-                    st.session_state.analysis_metrics = {
-                        "total_users": total_users,
-                        "inactive_count": inactive_count,
-                        "inactive_percentage": inactive_percentage,
-                        "analysis_time": analysis_time
-                    }
-                    logger.info(f"Analysis completed: {inactive_count} inactive users out of {total_users} total users in {analysis_time:.2f} seconds")
+                    st.session_state.signin_index = build_signin_index(st.session_state.users_data, signin_source)
+                    st.session_state.signin_index_params = index_params
+                    index_ready = True
                 except Exception as e:
                     logger.error(f"Error analyzing inactive users: {str(e)}")
                     st.error(f"Error analyzing inactive users: {str(e)}")
+                    st.session_state.signin_index = None
                     st.session_state.inactive_users = None
                     st.session_state.analysis_metrics = None
                 finally:
                     progress_bar.empty()
                     status_text.empty()
 
+    # Any threshold is a binary search on the index, so results follow the inactivity days without refetching
+    if index_ready and st.session_state.last_analysis_params != current_params:
+        try:
+            total_users = len(st.session_state.users_data)
+            st.session_state.inactive_users = analyze_inactive_users(
+                st.session_state.users_data,
+                inactivity_days=st.session_state.inactivity_days,
+                signin_source=signin_source,
+                signin_index=st.session_state.signin_index
+            )
+            st.session_state.last_analysis_params = current_params
+            
+            # Compute analysis metrics
+            analysis_time = time.time() - start_time
+            inactive_count = len(st.session_state.inactive_users)
+            inactive_percentage = (inactive_count / total_users * 100) if total_users > 0 else 0
+            st.session_state.analysis_metrics = {
+                "total_users": total_users,
+                "inactive_count": inactive_count,
+                "inactive_percentage": inactive_percentage,
+                "analysis_time": analysis_time
+            }
+            logger.info(f"Analysis completed: {inactive_count} inactive users out of {total_users} total users in {analysis_time:.2f} seconds")
+        except Exception as e:
+            logger.error(f"Error analyzing inactive users: {str(e)}")
+            st.error(f"Error analyzing inactive users: {str(e)}")
+            st.session_state.inactive_users = None
+            st.session_state.analysis_metrics = None
+
     # Display analysis results
     if st.session_state.inactive_users is not None:
-        if st.session_state.inactive_users:
+        if not st.session_state.inactive_users.empty:
             try:
-                # Convert to DataFrame
-                df_inactive = pd.DataFrame(st.session_state.inactive_users)
+                df_inactive = st.session_state.inactive_users
                 
                 # Display metrics
                 metrics = st.session_state.analysis_metrics
@@ -151,6 +203,41 @@ else:
                 col3.metric("Inactive Percentage", f"{metrics['inactive_percentage']:.2f}%")
                 st.markdown(f"**Analysis Time:** {metrics['analysis_time']:.2f} seconds")
 
+                # Inactive user counts for every threshold the number input accepts
+                if index_ready:
+                    st.markdown("### Inactive Users by Threshold")
+                    st.line_chart(st.session_state.signin_index.threshold_curve())
+
+                # Re-check flagged users against Microsoft Graph in a few $batch calls
+                if st.button("Re-check Flagged Users", help="Fetch the current state of every flagged user from Microsoft Graph before acting on the results."):
+                    logger.info("Re-check Flagged Users button clicked")
+                    flagged_ids = df_inactive["User ID"].tolist()
+                    with st.spinner(f"Re-checking {len(flagged_ids)} flagged users..."):
+                        refreshed_users = fetch_users_by_id(
+                            TENANT_ID, CLIENT_ID, CLIENT_SECRET,
+                            flagged_ids,
+                            include_signin_activity=signin_source == "signin_activity"
+                        )
+                    # An incomplete lookup would publish stale rows as refreshed, so keep the current snapshot
+                    if refreshed_users is not None:
+                        # Snapshots are shared between sessions, so publish an updated copy instead of editing in place
+                        updated_users = []
+                        for user in st.session_state.users_data:
+                            refreshed = refreshed_users.get(user["User ID"])
+                            if refreshed:
+                                # Batch lookups do not include memberships, so keep the existing groups
+                                user = {**user, **{key: value for key, value in refreshed.items() if key != "Groups"}}
+                            updated_users.append(user)
+                        previous_version = st.session_state.users_data.version
+                        published = publish_users(updated_users, get_membership_index())
+                        # Re-fetched rows are newer than the stored deltaLink, so the next sync can continue from it
+                        carry_users_delta_link(previous_version, published.version)
+                        st.session_state.last_analysis_params = None
+                        st.success(
+                            f"Refreshed {len(refreshed_users)} of {len(flagged_ids)} flagged users. "
+                            "Click 'Analyze Inactive Users' to update the results."
+                        )
+
                 # Sorting and Filtering Options
                 st.markdown("### Inactive Users Table")
                 sort_by = st.selectbox(
@@ -160,36 +247,38 @@ else:
                 )
                 sort_ascending = st.checkbox("Sort Ascending", value=False)
                 
+                user_db_file = user_db.ensure_users(st.session_state.users_data, get_membership_index())
                 filter_department = st.multiselect(
                     "Filter by Department:",
-                    options=sorted(set(user.get("Department", "N/A") for user in st.session_state.users_data if user.get("Department"))),
+                    options=user_db.departments(user_db_file),
                     default=[]
                 )
 
                 # Apply sorting and filtering
                 df_filtered = df_inactive.copy()
+                user_dept_map = user_db.department_of(user_db_file, df_filtered["User ID"].tolist())
                 if filter_department:
-                    # Match user IDs with departments from users_data
-                    user_dept_map = {user["User ID"]: user.get("Department", "N/A") for user in st.session_state.users_data}
                     df_filtered["Department"] = df_filtered["User ID"].map(user_dept_map)
                     df_filtered = df_filtered[df_filtered["Department"].isin(filter_department)]
                 
                 if sort_by:
-                    # Handle sorting for "Days Since Last Sign-In"
-                    if sort_by == "Days Since Last Sign-In":
-                        df_filtered["Sort Key"] = df_filtered["Days Since Last Sign-In"].apply(
-                            lambda x: float('inf') if x == "No sign-in recorded" else int(x)
-                        )
-                        df_filtered = df_filtered.sort_values("Sort Key", ascending=sort_ascending)
-                        df_filtered = df_filtered.drop(columns=["Sort Key"])
-                    else:
-                        df_filtered = df_filtered.sort_values(sort_by, ascending=sort_ascending)
+                    # Users who never signed in have no days value and rank as the longest inactive
+                    df_filtered = df_filtered.sort_values(
+                        sort_by,
+                        ascending=sort_ascending,
+                        na_position="last" if sort_ascending else "first"
+                    )
 
                 st.write(
                     f"**Identified Inactive Users (No sign-ins in the last {st.session_state.inactivity_days} days):** "
-                    f"Showing {len(df_filtered)} out of {len(st.session_state.inactive_users)} users after filtering."
+                    f"Showing {len(df_filtered)} out of {len(df_inactive)} users after filtering."
+                )
+                st.dataframe(
+                    df_filtered,
+                    column_config={
+                        "Days Since Last Sign-In": st.column_config.NumberColumn(help="Empty when no sign-in is recorded")
+                    }
                 )
-                st.dataframe(df_filtered)
 
                 # Download button for CSV
                 csv_buffer = io.StringIO()
@@ -204,7 +293,6 @@ else:
                 # Visual Summary: Inactive Users by Department
                 if len(df_filtered) > 0:
                     st.markdown("### Inactive Users by Department")
-                    user_dept_map = {user["User ID"]: user.get("Department", "N/A") for user in st.session_state.users_data}
                     df_filtered["Department"] = df_filtered["User ID"].map(user_dept_map)
                     dept_counts = df_filtered["Department"].value_counts().reset_index()
                     dept_counts.columns = ["Department", "Inactive Users"]
@@ -1,5 +1,8 @@
 import streamlit as st
-from utils.ai_analyzer import read_signin_logs
+from utils.ai_analyzer import SIGNIN_SOURCE_LABELS, read_last_signins, signin_sources
+from utils.membership_index import get_membership_index
+from utils import user_db
+from utils.user_snapshot import get_users_data, show_snapshot_freshness
 from utils.logger import setup_logger
 import os
 from dotenv import load_dotenv
@@ -23,22 +26,44 @@ OPENAI_API_VERSION = os.getenv("OPENAI_API_VERSION")
 # Setup logger
 logger = setup_logger("nlp_query", "logs/app.log")
 
-# Initialize sign-in data and inactive users once
-if "signin_data" not in st.session_state:
-    st.session_state.signin_data = read_signin_logs()
-    logger.debug(f"Initialized sign-in data in session state: {len(st.session_state.signin_data)} records")
-
-if "inactive_users" not in st.session_state and "users_data" in st.session_state:
+# Mirror the session's users and last sign-ins into the database of its user snapshot for
+# indexed queries, loading the persisted user snapshot in new sessions
+user_db_file = None
+signin_source = None
+signin_data = {}
+signin_data_changed = False
+if get_users_data():
+    # Use the last sign-in source selected on the Inactive Users page, so both pages agree
+    available_sources = signin_sources(st.session_state.users_data)
+    signin_source = st.session_state.get("signin_source")
+    if signin_source not in available_sources:
+        signin_source = available_sources[0]
+    # Sign-in data is parsed once per version of its source and shared across sessions,
+    # so reading it on every rerun picks up new fetches at the cost of a cache lookup
+    signin_data = read_last_signins(st.session_state.users_data, signin_source)
+    signin_data_changed = st.session_state.get("signin_data") is not signin_data
+    if signin_data_changed:
+        logger.debug(f"Initialized {signin_source} sign-in data in session state: {len(signin_data)} records")
+    user_db_file = user_db.ensure_users(st.session_state.users_data, get_membership_index())
+    # The signins table is shared by every session on the snapshot, so it is only rewritten when the data changes
+    user_db.sync_signins(user_db_file, signin_data, signin_source)
+st.session_state.signin_data = signin_data
+
+# Inactive users are recomputed whenever the users or the sign-in data change, as pages 4 and 5
+# cache their results per dataset version
+if user_db_file is not None and (
+    signin_data_changed
+    or "nlp_inactive_users" not in st.session_state
+    or st.session_state.get("nlp_inactive_users_version") != st.session_state.users_data.dataset_version
+):
     cutoff_date = datetime.now(timezone.utc) - timedelta(days=30)
     logger.debug(f"Cutoff date for inactive users: {cutoff_date}")
-    inactive_users = []
-    for user in st.session_state.users_data:
-        user_id = user["User ID"]
-        last_signin = st.session_state.signin_data.get(user_id)
-        logger.debug(f"User {user_id}: Last sign-in = {last_signin}")
-        if last_signin is None or last_signin < cutoff_date:
-            inactive_users.append(user)
-    st.session_state.inactive_users = inactive_users
+    inactive_users = [
+        {key: row[column] for key, column in user_db.USER_COLUMNS.items()}
+        for row in user_db.inactive_users(user_db_file, cutoff_date, signin_source)
+    ]
+    st.session_state.nlp_inactive_users = inactive_users
+    st.session_state.nlp_inactive_users_version = st.session_state.users_data.dataset_version
     logger.info(f"Initialized {len(inactive_users)} inactive users in session state")
 
 # Helper function to normalize job titles
@@ -60,6 +85,13 @@ def is_valid_role(role):
         return False
     return True
 
+# Helper function to count unique groups, preferring the membership index
+def count_groups():
+    membership_index = get_membership_index()
+    if membership_index is not None:
+        return membership_index.group_count
+    return user_db.count_groups(user_db_file)
+
 # Custom tool to query user data
 @tool
 def query_user_data(query: str) -> str:
@@ -75,20 +107,17 @@ def query_user_data(query: str) -> str:
 
         # Handle queries for users who signed in today
         if "signed in today" in query_lower or "sign-in today" in query_lower or "signin today" in query_lower or "sign-in'ed today" in query_lower:
-            today = datetime.now(timezone.utc).date()
-            users_signed_in_today = set()
-            for user_id, last_signin in signin_data.items():
-                if last_signin and last_signin.date() == today:
-                    users_signed_in_today.add(user_id)
-            logger.debug(f"Users who signed in today: {len(users_signed_in_today)}")
-            return f"There are {len(users_signed_in_today)} users who signed in today."
+            today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+            users_signed_in_today = user_db.count_signed_in_since(user_db_file, today, signin_source)
+            logger.debug(f"Users who signed in today: {users_signed_in_today}")
+            return f"There are {users_signed_in_today} users who signed in today."
 
         # Handle natural language queries for inactive users
         if ("no sign-ins" in query_lower or 
             "haven't signed in" in query_lower or 
             "haven't sign-in" in query_lower or 
             "haven't signed-in" in query_lower) and ("last 30 days" in query_lower or "past 30 days" in query_lower):
-            inactive_users = st.session_state.inactive_users
+            inactive_users = st.session_state.nlp_inactive_users
             logger.debug(f"Inactive users count: {len(inactive_users)}")
             return f"There are {len(inactive_users)} users who have not signed in during the last 30 days."
 
@@ -97,25 +126,24 @@ def query_user_data(query: str) -> str:
             ("last_sign_in_date" in query_lower or "lastsignindate" in query_lower) and 
             "30 day" in query_lower and 
             any(op in query_lower for op in ["<", "<=", "is null", "date_sub", "now() - interval", "current_date - interval", "dateadd", "getdate() -"])):
-            inactive_users = st.session_state.inactive_users
+            inactive_users = st.session_state.nlp_inactive_users
             logger.debug(f"Inactive users count: {len(inactive_users)}")
             return f"There are {len(inactive_users)} users who have not signed in during the last 30 days."
 
         # Handle SQL-like queries for total users
         if "select count(*)" in query_lower and "from users" in query_lower and "last_sign_in_date" not in query_lower and "lastsignindate" not in query_lower and "department" not in query_lower and "status" not in query_lower:
-            total_users = len(st.session_state.users_data)
+            total_users = user_db.count_users(user_db_file)
             return f"There are {total_users} users in your tenant."
 
         # Total users in the tenant (natural language)
         if "total users" in query_lower or "how many users" in query_lower or "count all users" in query_lower:
-            total_users = len(st.session_state.users_data)
+            total_users = user_db.count_users(user_db_file)
             return f"There are a total of {total_users} users in your tenant."
 
         # Handle SQL-like queries for total roles (job titles)
         if "select count(distinct role)" in query_lower and "from roles" in query_lower:
             raw_roles = set()
-            for user in st.session_state.users_data:
-                job_title = user.get("Job Title", None)
+            for job_title in user_db.job_titles(user_db_file):
                 normalized_title = normalize_role(job_title)
                 if normalized_title:
                     raw_roles.add(normalized_title)
@@ -126,8 +154,7 @@ def query_user_data(query: str) -> str:
         # Handle natural language queries for total roles (job titles)
         if "how many total roles" in query_lower or "distinct roles" in query_lower:
             raw_roles = set()
-            for user in st.session_state.users_data:
-                job_title = user.get("Job Title", None)
+            for job_title in user_db.job_titles(user_db_file):
                 normalized_title = normalize_role(job_title)
                 if normalized_title:
                     raw_roles.add(normalized_title)
@@ -138,8 +165,7 @@ def query_user_data(query: str) -> str:
         # Handle queries to list all distinct roles
         if "list all distinct roles" in query_lower:
             raw_roles = set()
-            for user in st.session_state.users_data:
-                job_title = user.get("Job Title", None)
+            for job_title in user_db.job_titles(user_db_file):
                 normalized_title = normalize_role(job_title)
                 if normalized_title:
                     raw_roles.add(normalized_title)
@@ -151,68 +177,54 @@ def query_user_data(query: str) -> str:
 
         # Handle SQL-like queries for total groups
         if "select count(*)" in query_lower and "from groups" in query_lower:
-            all_groups = set()
-            for user in st.session_state.users_data:
-                groups = user.get("Groups", "").split(", ") if user.get("Groups") else []
-                all_groups.update(groups)
-            all_groups = sorted([group for group in all_groups if group])
-            return f"There are {len(all_groups)} unique groups in your tenant."
+            return f"There are {count_groups()} unique groups in your tenant."
 
         # Number of groups (natural language)
         if "groups are there" in query_lower or "how many total groups" in query_lower:
-            all_groups = set()
-            for user in st.session_state.users_data:
-                groups = user.get("Groups", "").split(", ") if user.get("Groups") else []
-                all_groups.update(groups)
-            all_groups = sorted([group for group in all_groups if group])
-            return f"There are {len(all_groups)} unique groups in your tenant."
+            return f"There are {count_groups()} unique groups in your tenant."
 
         # Handle SQL-like queries for total departments
         if "select count(distinct department)" in query_lower and "from users" in query_lower:
-            all_departments = set(user.get("Department") for user in st.session_state.users_data if user.get("Department"))
+            all_departments = user_db.departments(user_db_file)
             return f"There are {len(all_departments)} unique departments in your tenant."
 
         # Number of departments (natural language)
         if "how many total departments" in query_lower or "departments are there" in query_lower:
-            all_departments = set(user.get("Department") for user in st.session_state.users_data if user.get("Department"))
+            all_departments = user_db.departments(user_db_file)
             return f"There are {len(all_departments)} unique departments in your tenant."
 
         # Handle queries for disabled users (SQL-like)
         if "select count(*)" in query_lower and "from users" in query_lower and "status = 'disabled'" in query_lower:
-            disabled_users = [user for user in st.session_state.users_data if user['Account Enabled'] == 'false']
-            return f"There are {len(disabled_users)} disabled users in your tenant."
+            disabled_users = user_db.count_users(user_db_file, account_enabled=False)
+            return f"There are {disabled_users} disabled users in your tenant."
 
         # Handle queries for disabled users (natural language)
         if "how many disabled users" in query_lower or "active and disabled users" in query_lower:
-            active_users = [user for user in st.session_state.users_data if user['Account Enabled'] == 'true']
-            disabled_users = [user for user in st.session_state.users_data if user['Account Enabled'] == 'false']
+            active_users = user_db.count_users(user_db_file, account_enabled=True)
+            disabled_users = user_db.count_users(user_db_file, account_enabled=False)
             if "active and disabled users" in query_lower:
                 return (
                     f"The total number of active and disabled users in your tenant is as follows:\n"
-                    f"- Active Users: {len(active_users)}\n"
-                    f"- Disabled Users: {len(disabled_users)}"
+                    f"- Active Users: {active_users}\n"
+                    f"- Disabled Users: {disabled_users}"
                 )
-            return f"There are {len(disabled_users)} disabled users in your tenant."
+            return f"There are {disabled_users} disabled users in your tenant."
 
         # Handle SQL-like queries for users with a specific name (e.g., SELECT * FROM users WHERE user_principal_name LIKE '%santhosh%')
         if "select" in query_lower and "from users" in query_lower and "user_principal_name like" in query_lower:
             search_term = query_lower.split("like '%")[1].split("%'")[0]
             matching_users = []
-            for user in st.session_state.users_data:
-                if search_term.lower() in user['User Principal Name'].lower():
-                    user_id = user["User ID"]
-                    last_signin = signin_data.get(user_id)
-                    last_signin_date = last_signin.strftime("%Y-%m-%dT%H:%M:%SZ") if last_signin else "N/A"
-                    user_info = (
-                        f"User: {user['User Principal Name']}, "
-                        f"Department: {user['Department']}, "
-                        f"Job Title: {user['Job Title']}, "
-                        f"Account Enabled: {user['Account Enabled']}, "
-                        f"User Type: {user['User Type']}, "
-                        f"Last Sign-In Date: {last_signin_date}, "
-                        f"Groups: {user['Groups']}"
-                    )
-                    matching_users.append(user_info)
+            for user in user_db.search_users(user_db_file, search_term, signin_source):
+                user_info = (
+                    f"User: {user['upn']}, "
+                    f"Department: {user['department']}, "
+                    f"Job Title: {user['job_title']}, "
+                    f"Account Enabled: {user['account_enabled']}, "
+                    f"User Type: {user['user_type']}, "
+                    f"Last Sign-In Date: {user['last_signin'] or 'N/A'}, "
+                    f"Groups: {user['groups']}"
+                )
+                matching_users.append(user_info)
             if matching_users:
                 return f"Found {len(matching_users)} user(s) matching '{search_term}':\n" + "\n".join(matching_users)
             return f"No users found matching '{search_term}'."
@@ -225,7 +237,7 @@ def query_user_data(query: str) -> str:
             "30 day" in query_lower and 
             any(op in query_lower for op in ["<", "<=", "is null"])):
             search_term = query_lower.split("like '%")[1].split("%'")[0]
-            inactive_users = st.session_state.inactive_users
+            inactive_users = st.session_state.nlp_inactive_users
             matching_users = [
                 user for user in inactive_users
                 if search_term.lower() in user['User Principal Name'].lower()
@@ -257,19 +269,15 @@ def query_user_data(query: str) -> str:
                 days = int(query_lower.split("interval")[1].split("day")[0].strip())
             elif "dateadd" in query_lower or "getdate() -" in query_lower:
                 days = int(query_lower.split("day, -")[1].split(",")[0].strip())
-            cutoff_date = datetime.now(timezone.utc) - timedelta(days=days)
+            cutoff_date = user_db.format_timestamp(datetime.now(timezone.utc) - timedelta(days=days))
             matching_users = []
-            for user in st.session_state.users_data:
-                if search_term.lower() in user['User Principal Name'].lower():
-                    user_id = user["User ID"]
-                    last_signin = signin_data.get(user_id)
-                    if last_signin and last_signin >= cutoff_date:
-                        last_signin_date = last_signin.strftime("%Y-%m-%dT%H:%M:%SZ")
-                        user_info = (
-                            f"User: {user['User Principal Name']}, "
-                            f"Last Sign-In Date: {last_signin_date}"
-                        )
-                        matching_users.append(user_info)
+            for user in user_db.search_users(user_db_file, search_term, signin_source):
+                if user["last_signin"] and user["last_signin"] >= cutoff_date:
+                    user_info = (
+                        f"User: {user['upn']}, "
+                        f"Last Sign-In Date: {user['last_signin']}"
+                    )
+                    matching_users.append(user_info)
             if matching_users:
                 return f"Found {len(matching_users)} user(s) matching '{search_term}' who signed in within the last {days} days:\n" + "\n".join(matching_users)
             return f"No users matching '{search_term}' have signed in within the last {days} days."
@@ -282,21 +290,17 @@ def query_user_data(query: str) -> str:
                 search_term = query_lower.split("whcih department")[0].strip()
             search_term = search_term.replace("is ", "").strip()
             matching_users = []
-            for user in st.session_state.users_data:
-                if search_term.lower() in user['User Principal Name'].lower():
-                    user_id = user["User ID"]
-                    last_signin = signin_data.get(user_id)
-                    last_signin_date = last_signin.strftime("%Y-%m-%dT%H:%M:%SZ") if last_signin else "N/A"
-                    user_info = (
-                        f"User: {user['User Principal Name']}, "
-                        f"Department: {user['Department']}, "
-                        f"Job Title: {user['Job Title']}, "
-                        f"Account Enabled: {user['Account Enabled']}, "
-                        f"User Type: {user['User Type']}, "
-                        f"Last Sign-In Date: {last_signin_date}, "
-                        f"Groups: {user['Groups']}"
-                    )
-                    matching_users.append(user_info)
+            for user in user_db.search_users(user_db_file, search_term, signin_source):
+                user_info = (
+                    f"User: {user['upn']}, "
+                    f"Department: {user['department']}, "
+                    f"Job Title: {user['job_title']}, "
+                    f"Account Enabled: {user['account_enabled']}, "
+                    f"User Type: {user['user_type']}, "
+                    f"Last Sign-In Date: {user['last_signin'] or 'N/A'}, "
+                    f"Groups: {user['groups']}"
+                )
+                matching_users.append(user_info)
             if matching_users:
                 return f"Found {len(matching_users)} user(s) matching '{search_term}':\n" + "\n".join(matching_users)
             return f"No users found matching '{search_term}'."
@@ -307,28 +311,24 @@ def query_user_data(query: str) -> str:
             any(field in query_lower for field in ["name =", "username =", "email ="])):
             search_term = query_lower.split("= '")[1].split("'")[0]
             matching_users = []
-            for user in st.session_state.users_data:
-                if search_term.lower() in user['User Principal Name'].lower():
-                    user_id = user["User ID"]
-                    last_signin = signin_data.get(user_id)
-                    last_signin_date = last_signin.strftime("%Y-%m-%dT%H:%M:%SZ") if last_signin else "N/A"
-                    user_info = (
-                        f"User: {user['User Principal Name']}, "
-                        f"Department: {user['Department']}, "
-                        f"Job Title: {user['Job Title']}, "
-                        f"Account Enabled: {user['Account Enabled']}, "
-                        f"User Type: {user['User Type']}, "
-                        f"Last Sign-In Date: {last_signin_date}, "
-                        f"Groups: {user['Groups']}"
-                    )
-                    matching_users.append(user_info)
+            for user in user_db.search_users(user_db_file, search_term, signin_source):
+                user_info = (
+                    f"User: {user['upn']}, "
+                    f"Department: {user['department']}, "
+                    f"Job Title: {user['job_title']}, "
+                    f"Account Enabled: {user['account_enabled']}, "
+                    f"User Type: {user['user_type']}, "
+                    f"Last Sign-In Date: {user['last_signin'] or 'N/A'}, "
+                    f"Groups: {user['groups']}"
+                )
+                matching_users.append(user_info)
             if matching_users:
                 return f"Found {len(matching_users)} user(s) matching '{search_term}':\n" + "\n".join(matching_users)
             return f"No users found with name, username, or email matching '{search_term}'."
 
         # Detailed list of users with no sign-ins in the last 30 days
         if "list users" in query_lower and "no sign-ins" in query_lower and "last 30 days" in query_lower:
-            inactive_users = st.session_state.inactive_users
+            inactive_users = st.session_state.nlp_inactive_users
             if not inactive_users:
                 return "No users found with no sign-ins in the last 30 days."
             result = []
@@ -344,7 +344,7 @@ def query_user_data(query: str) -> str:
 
         # Top 10 users with no sign-ins
         if "top 10" in query_lower and "not signed in" in query_lower:
-            inactive_users = st.session_state.inactive_users
+            inactive_users = st.session_state.nlp_inactive_users
             if not inactive_users:
                 return "No users found with no sign-ins in the last 30 days."
             result = []
@@ -359,7 +359,7 @@ def query_user_data(query: str) -> str:
                 search_term = query_lower.split("is there any user named")[1].split("in that list")[0].strip()
             else:
                 search_term = query_lower.split("is ")[1].split(" in ")[0].strip()
-            inactive_users = st.session_state.inactive_users
+            inactive_users = st.session_state.nlp_inactive_users
             found = any(search_term.lower() in user['User Principal Name'].lower() for user in inactive_users)
             return f"{'Yes' if found else 'No'}, '{search_term}' {'is' if found else 'is not'} in the list of users who have not signed in during the last 30 days."
 
@@ -379,7 +379,7 @@ def query_user_data(query: str) -> str:
                 search_term = query_lower.split("name")[1].strip("'").strip()
 
             if search_term:
-                inactive_users = st.session_state.inactive_users
+                inactive_users = st.session_state.nlp_inactive_users
                 if not inactive_users:
                     return "No users found with no sign-ins in the last 30 days."
                 
@@ -415,30 +415,27 @@ def query_user_data(query: str) -> str:
                 search_term = query_lower.split("has ")[1].split(" signed in")[0].strip()
             
             if search_term:
-                cutoff_date = datetime.now(timezone.utc) - timedelta(days=30)
+                cutoff_date = user_db.format_timestamp(datetime.now(timezone.utc) - timedelta(days=30))
                 matching_users = []
-                for user in st.session_state.users_data:
-                    if search_term.lower() in user['User Principal Name'].lower():
-                        user_id = user["User ID"]
-                        last_signin = signin_data.get(user_id)
-                        if last_signin:
-                            last_signin_date = last_signin.strftime("%Y-%m-%dT%H:%M:%SZ")
-                            if last_signin >= cutoff_date:
-                                user_info = (
-                                    f"User: {user['User Principal Name']}, "
-                                    f"Last Sign-In Date: {last_signin_date} (within the last 30 days)"
-                                )
-                            else:
-                                user_info = (
-                                    f"User: {user['User Principal Name']}, "
-                                    f"Last Sign-In Date: {last_signin_date} (more than 30 days ago)"
-                                )
+                for user in user_db.search_users(user_db_file, search_term, signin_source):
+                    last_signin_date = user["last_signin"]
+                    if last_signin_date:
+                        if last_signin_date >= cutoff_date:
+                            user_info = (
+                                f"User: {user['upn']}, "
+                                f"Last Sign-In Date: {last_signin_date} (within the last 30 days)"
+                            )
                         else:
                             user_info = (
-                                f"User: {user['User Principal Name']}, "
-                                f"Last Sign-In Date: N/A (never signed in)"
+                                f"User: {user['upn']}, "
+                                f"Last Sign-In Date: {last_signin_date} (more than 30 days ago)"
                             )
-                        matching_users.append(user_info)
+                    else:
+                        user_info = (
+                            f"User: {user['upn']}, "
+                            f"Last Sign-In Date: N/A (never signed in)"
+                        )
+                    matching_users.append(user_info)
                 if matching_users:
                     return f"Sign-in status for user(s) matching '{search_term}':\n" + "\n".join(matching_users)
                 return f"No users found matching '{search_term}'."
@@ -532,6 +529,9 @@ agent_executor = AgentExecutor(
 # Page UI
 st.title("Chat with User Data AI Agent")
 st.markdown("Ask questions about user data (e.g., 'How many users have no sign-ins in the last 30 days?' or 'List the top 10 inactive users').")
+show_snapshot_freshness()
+if signin_source is not None:
+    st.caption(f"Last sign-ins from: {SIGNIN_SOURCE_LABELS[signin_source]}. Change the source on the Inactive Users page.")
 
 # Display chat history
 for message in st.session_state.chat_history.messages:
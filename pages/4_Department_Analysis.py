@@ -2,6 +2,9 @@ import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
 from utils.logger import setup_logger
+from utils.membership_index import get_membership_index
+from utils import user_db
+from utils.user_snapshot import get_users_data, show_snapshot_freshness
 import os
 from dotenv import load_dotenv
 import time
@@ -64,9 +67,9 @@ st.markdown('<div class="description">Analyze the departments in your organizati
 if "department_metrics" not in st.session_state:
     st.session_state.department_metrics = None
     logger.debug("Initialized department_metrics in session state")
-if "last_analysis_data" not in st.session_state:
-    st.session_state.last_analysis_data = None
-    logger.debug("Initialized last_analysis_data in session state")
+if "department_analysis_version" not in st.session_state:
+    st.session_state.department_analysis_version = None
+    logger.debug("Initialized department_analysis_version in session state")
 if "analysis_metrics" not in st.session_state:
     st.session_state.analysis_metrics = None
     logger.debug("Initialized analysis_metrics in session state")
@@ -75,10 +78,14 @@ if "analysis_metrics" not in st.session_state:
 def safe_str(value, default="N/A"):
     return str(value).strip().lower() if value is not None else default.strip().lower()
 
-# Check if users_data exists
-if "users_data" not in st.session_state or not st.session_state.users_data:
+# Check if users_data exists, loading the persisted user snapshot in new sessions
+if not get_users_data():
     st.warning("No user data available. Please fetch data from the 'Fetch Data' page first.")
 else:
+    show_snapshot_freshness()
+    # Each user snapshot has its own database, so results cached per dataset version match the rows they came from
+    user_db_file = user_db.ensure_users(st.session_state.users_data, get_membership_index())
+
     # Columns for buttons
     col1, col2 = st.columns([1, 1])
     with col1:
@@ -90,7 +97,7 @@ else:
     if reset_button:
         logger.info("Reset Analysis button clicked")
         st.session_state.department_metrics = None
-        st.session_state.last_analysis_data = None
+        st.session_state.department_analysis_version = None
         st.session_state.analysis_metrics = None
         st.success("Analysis reset successfully. You can start a new analysis.")
         st.rerun()
@@ -100,9 +107,10 @@ else:
         logger.info("Analyze Departments button clicked")
         
         # Check if we can use cached results
-        current_data = str(st.session_state.users_data)  # Convert to string for comparison
+        # Results are cached per dataset version, which is an O(1) comparison
+        current_version = st.session_state.users_data.dataset_version
         if (st.session_state.department_metrics is not None and 
-            st.session_state.last_analysis_data == current_data):
+            st.session_state.department_analysis_version == current_version):
             st.info("Using cached analysis results. Click 'Reset Analysis' to start a new analysis.")
         else:
             start_time = time.time()
@@ -116,49 +124,41 @@ else:
                 time.sleep(0.01)  # Simulate work
             
             try:
-                # Extract departments directly from users_data without lowercase normalization
-                identified_departments = sorted(set(
-                    user.get("Department", "N/A") 
-                    for user in st.session_state.users_data 
-                    if user.get("Department") and user.get("Department") != "N/A"
-                ))
+                # Extract departments from the user database without lowercase normalization
+                identified_departments = user_db.departments(user_db_file)
                 logger.debug(f"Identified departments: {identified_departments}")
                 
-                # Compute department metrics
+                # Compute department metrics; case variants are counted under the first variant in sorted order
                 department_counts = {dept: 0 for dept in identified_departments}
                 enabled_counts = {dept: 0 for dept in identified_departments}
-                user_dept_mapping = []
-                
-                for user in st.session_state.users_data:
-                    dept = user.get("Department", "N/A")
-                    if dept and dept != "N/A":  # Only count users with valid departments
-                        # Normalize for counting, but preserve original department for display
-                        dept_normalized = safe_str(dept)
-                        # Map normalized department back to original department
-                        found_dept = None
-                        for orig_dept in identified_departments:
-                            if safe_str(orig_dept) == dept_normalized:
-                                found_dept = orig_dept
-                                break
-                        if found_dept:
-                            department_counts[found_dept] += 1
-                            enabled = user.get("Account Enabled", False)
-                            if isinstance(enabled, str):
-                                enabled = enabled.lower() == "true"
-                            if enabled:
-                                enabled_counts[found_dept] += 1
-                            user_dept_mapping.append({
-                                "user_principal_name": safe_str(user.get("User Principal Name", "N/A"), "N/A"),
-                                "display_name": safe_str(user.get("Display Name", "N/A"), "N/A"),
-                                "department": found_dept,  # Use original department name
-                                "job_title": safe_str(user.get("Job Title", "N/A"), "N/A"),
-                                "account_enabled": enabled
-                            })
-                        else:
-                            logger.debug(f"Department '{dept}' not found in identified departments")
+                department_rows = user_db.query(
+                    user_db_file,
+                    "SELECT MIN(department) AS department, LOWER(TRIM(department)) AS normalized, COUNT(*) AS users, "
+                    "SUM(account_enabled = 'true') AS enabled FROM users "
+                    "WHERE department IS NOT NULL AND department NOT IN ('', 'N/A') GROUP BY normalized"
+                )
+                found_departments = {}
+                for row in department_rows:
+                    department_counts[row["department"]] = row["users"]
+                    enabled_counts[row["department"]] = row["enabled"]
+                    found_departments[row["normalized"]] = row["department"]
+                user_dept_mapping = [
+                    {
+                        "user_principal_name": safe_str(user["upn"], "N/A"),
+                        "display_name": safe_str(user["display_name"], "N/A"),
+                        "department": found_departments[user["normalized"]],  # Use original department name
+                        "job_title": safe_str(user["job_title"], "N/A"),
+                        "account_enabled": user["account_enabled"] == "true"
+                    }
+                    for user in user_db.query(
+                        user_db_file,
+                        "SELECT upn, display_name, LOWER(TRIM(department)) AS normalized, job_title, account_enabled FROM users "
+                        "WHERE department IS NOT NULL AND department NOT IN ('', 'N/A') ORDER BY rowid"
+                    )
+                ]
                 
                 # Compute additional metrics
-                total_users = len(st.session_state.users_data)
+                total_users = user_db.count_users(user_db_file)
                 users_with_dept = sum(department_counts.values())
                 dept_percentages = {dept: (count / users_with_dept * 100) if users_with_dept > 0 else 0 
                                   for dept, count in department_counts.items()}
@@ -172,7 +172,7 @@ else:
                     "enabled_percentages": enabled_percentages,
                     "user_mapping": user_dept_mapping
                 }
-                st.session_state.last_analysis_data = current_data
+                st.session_state.department_analysis_version = current_version
                 
                 # Analysis metrics
                 analysis_time = time.time() - start_time
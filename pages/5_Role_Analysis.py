@@ -1,5 +1,8 @@
 import streamlit as st
 from utils.logger import setup_logger
+from utils.membership_index import get_membership_index
+from utils import user_db
+from utils.user_snapshot import get_users_data, show_snapshot_freshness
 import pandas as pd
 import matplotlib.pyplot as plt
 import time
@@ -62,9 +65,9 @@ if "identified_roles" not in st.session_state:
 if "role_metrics" not in st.session_state:
     st.session_state.role_metrics = None
     logger.debug("Initialized role_metrics in session state")
-if "last_analysis_data" not in st.session_state:
-    st.session_state.last_analysis_data = None
-    logger.debug("Initialized last_analysis_data in session state")
+if "role_analysis_version" not in st.session_state:
+    st.session_state.role_analysis_version = None
+    logger.debug("Initialized role_analysis_version in session state")
 if "analysis_metrics" not in st.session_state:
     st.session_state.analysis_metrics = None
     logger.debug("Initialized analysis_metrics in session state")
@@ -95,10 +98,14 @@ def is_valid_role(role):
         return False
     return True
 
-# Check if users_data exists
-if "users_data" not in st.session_state or not st.session_state.users_data:
+# Check if users_data exists, loading the persisted user snapshot in new sessions
+if not get_users_data():
     st.warning("No user data available. Please fetch data from the 'Fetch Data' page first.")
 else:
+    show_snapshot_freshness()
+    # Each user snapshot has its own database, so results cached per dataset version match the rows they came from
+    user_db_file = user_db.ensure_users(st.session_state.users_data, get_membership_index())
+
     # Columns for buttons
     col1, col2 = st.columns([1, 1])
     with col1:
@@ -111,7 +118,7 @@ else:
         logger.info("Reset Analysis button clicked")
         st.session_state.identified_roles = None
         st.session_state.role_metrics = None
-        st.session_state.last_analysis_data = None
+        st.session_state.role_analysis_version = None
         st.session_state.analysis_metrics = None
         st.success("Analysis reset successfully. You can start a new analysis.")
         st.rerun()
@@ -121,9 +128,10 @@ else:
         logger.info("Analyze Roles button clicked")
         
         # Check if we can use cached results
-        current_data = str(st.session_state.users_data)
+        # Results are cached per dataset version, which is an O(1) comparison
+        current_version = st.session_state.users_data.dataset_version
         if (st.session_state.identified_roles is not None and 
-            st.session_state.last_analysis_data == current_data):
+            st.session_state.role_analysis_version == current_version):
             st.info("Using cached analysis results. Click 'Reset Analysis' to start a new analysis.")
         else:
             start_time = time.time()
@@ -131,11 +139,10 @@ else:
             status_text = st.empty()
             status_text.text("Extracting roles from user data...")
 
-            # Extract distinct roles from Job Title field
+            # Extract distinct roles from the distinct job titles in the user database
             raw_roles = set()
-            for user in st.session_state.users_data:
-                job_title = safe_str(user.get("Job Title", None), default=None)
-                normalized_title = normalize_role(job_title)
+            for job_title in user_db.job_titles(user_db_file):
+                normalized_title = normalize_role(safe_str(job_title, default=None))
                 if normalized_title:  # Only add non-None normalized job titles
                     raw_roles.add(normalized_title)
             
@@ -161,13 +168,13 @@ else:
             unassigned_users = []
             
             # Map users to roles based on Job Title
-            for user in st.session_state.users_data:
+            for user in user_db.users(user_db_file, "upn, display_name, job_title, department, groups"):
                 user_info = {
-                    "user_principal_name": safe_str(user.get("User Principal Name", "N/A")),
-                    "display_name": safe_str(user.get("Display Name", "N/A")),
-                    "job_title": safe_str(user.get("Job Title", "N/A")),
-                    "department": safe_str(user.get("Department", "N/A")),
-                    "groups": safe_str(user.get("Groups", "N/A"))
+                    "user_principal_name": safe_str(user["upn"]),
+                    "display_name": safe_str(user["display_name"]),
+                    "job_title": safe_str(user["job_title"]),
+                    "department": safe_str(user["department"]),
+                    "groups": safe_str(user["groups"])
                 }
                 assigned_role = None
                 job_title = normalize_role(user_info["job_title"])
@@ -194,7 +201,7 @@ else:
                 st.warning(f"{len(unassigned_users)} users were not assigned to any role and have been categorized as 'Unassigned'.")
             
             # Compute additional metrics
-            total_users = len(st.session_state.users_data)
+            total_users = user_db.count_users(user_db_file)
             users_with_role = sum(role_counts[role] for role in role_counts if role != "Unassigned")
             role_percentages = {role: (count / total_users * 100) if total_users > 0 else 0 
                               for role, count in role_counts.items()}
@@ -204,7 +211,7 @@ else:
                 "percentages": role_percentages,
                 "user_mapping": user_role_mapping
             }
-            st.session_state.last_analysis_data = current_data
+            st.session_state.role_analysis_version = current_version
             
             # Analysis metrics
             analysis_time = time.time() - start_time
@@ -0,0 +1,80 @@
+import csv
+from datetime import datetime, timezone
+import pytest
+from utils.ai_analyzer import _read_signin_csv
+
+def read_signin_csv_row_by_row(csv_file):
+    """The per-row parser _read_signin_csv replaced, kept as the reference semantics."""
+    signin_data = {}
+    with open(csv_file, mode="r", newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            user_id = row.get("User ID", row.get("userId"))
+            if not user_id:
+                continue
+            signin_time = row.get("Sign-In Date", row.get("signInDateTime"))
+            if signin_time == "N/A":
+                continue
+            try:
+                if "Z" in signin_time:
+                    signin_date = datetime.strptime(signin_time, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+                else:
+                    signin_date = datetime.fromisoformat(signin_time.replace("Z", "+00:00"))
+            except ValueError:
+                continue
+            if user_id not in signin_data or signin_date > signin_data[user_id]:
+                signin_data[user_id] = signin_date
+    return signin_data
+
+# (user ID, sign-in time) rows covering every branch of the row-by-row parser
+SIGNIN_ROWS = [
+    ("u1", "2025-04-20T10:00:00Z"),
+    ("u1", "2025-04-22T08:30:00Z"),
+    ("u1", "2025-04-21T23:59:59Z"),
+    # Fractional seconds do not match the fetcher's format and are skipped
+    ("u2", "2025-04-23T10:00:00.5Z"),
+    ("u2", "2025-04-19T07:00:00Z"),
+    ("u3", "2025-04-24T10:00:00.1234567Z"),
+    ("u4", "N/A"),
+    ("u4", "2025-04-18T06:00:00Z"),
+    ("u5", "N/A"),
+    ("", "2025-04-25T10:00:00Z"),
+    ("", "N/A"),
+    # Values without "Z" go through fromisoformat, with or without fractional seconds
+    ("u6", "2025-04-20T10:00:00+00:00"),
+    ("u6", "2025-04-26T10:00:00.250+00:00"),
+    ("u7", "2025-04-20T10:00:00+02:00"),
+    ("u7", "2025-04-20T09:00:00Z"),
+    ("u8", "not a date"),
+    ("u8", ""),
+    ("u9", "2025-04-31T10:00:00Z"),
+]
+
+def write_signin_csv(path, user_column, time_column, rows):
+    with open(path, mode="w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["id", user_column, "userDisplayName", time_column])
+        for index, (user_id, signin_time) in enumerate(rows):
+            writer.writerow([f"s{index}", user_id, f"User {user_id}", signin_time])
+
+@pytest.mark.parametrize("user_column, time_column", [
+    ("userId", "signInDateTime"),
+    ("User ID", "Sign-In Date"),
+])
+def test_read_signin_csv_matches_the_row_by_row_parser(tmp_path, user_column, time_column):
+    csv_file = tmp_path / "signin_logs.csv"
+    write_signin_csv(csv_file, user_column, time_column, SIGNIN_ROWS)
+
+    signin_data = _read_signin_csv(str(csv_file))
+
+    assert signin_data == read_signin_csv_row_by_row(csv_file)
+    assert signin_data["u1"] == datetime(2025, 4, 22, 8, 30, tzinfo=timezone.utc)
+    assert signin_data["u2"] == datetime(2025, 4, 19, 7, 0, tzinfo=timezone.utc)
+    assert signin_data["u7"] == datetime(2025, 4, 20, 9, 0, tzinfo=timezone.utc)
+    assert not {"", "u3", "u5", "u8", "u9"} & set(signin_data)
+
+def test_read_signin_csv_without_a_user_column_returns_nothing(tmp_path):
+    csv_file = tmp_path / "signin_logs.csv"
+    with open(csv_file, mode="w", newline="", encoding="utf-8") as file:
+        file.write("id,signInDateTime\ns1,2025-04-20T10:00:00Z\n")
+
+    assert _read_signin_csv(str(csv_file)) == read_signin_csv_row_by_row(csv_file) == {}
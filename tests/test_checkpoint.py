@@ -0,0 +1,85 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+from utils.checkpoint import FetchCheckpoint
+
+@pytest.fixture(autouse=True)
+def checkpoint_dir(tmp_path, monkeypatch):
+    # CHECKPOINT_DIR is relative to the working directory
+    monkeypatch.chdir(tmp_path)
+
+def rewrite_state(checkpoint, **changes):
+    with open(checkpoint.state_file, mode="r", encoding="utf-8") as file:
+        state = json.load(file)
+    state.update(changes)
+    with open(checkpoint.state_file, mode="w", encoding="utf-8") as file:
+        json.dump(state, file)
+
+def test_resume_returns_state_and_completed_rows():
+    checkpoint = FetchCheckpoint("users", "query-1")
+    checkpoint.append_rows([{"id": 1}, {"id": 2}])
+    checkpoint.save("https://graph/next?page=2", 1, total=2)
+
+    state = FetchCheckpoint("users", "query-1").load()
+
+    assert state["nextLink"] == "https://graph/next?page=2"
+    assert state["pages"] == 1
+    assert state["total"] == 2
+    assert checkpoint.load_rows(state) == [{"id": 1}, {"id": 2}]
+
+def test_partially_written_page_is_dropped_on_resume():
+    checkpoint = FetchCheckpoint("users", "query-1")
+    checkpoint.append_rows([{"id": 1}])
+    checkpoint.save("https://graph/next?page=2", 1)
+    # The run died while appending the second page
+    with open(checkpoint.rows_file, mode="a", encoding="utf-8") as file:
+        file.write('{"id": 2}\n{"id"')
+
+    state = checkpoint.load()
+
+    assert checkpoint.load_rows(state) == [{"id": 1}]
+    # The resumed run appends after the last completed page
+    checkpoint.append_rows([{"id": 2}])
+    checkpoint.save("https://graph/next?page=3", 2)
+    assert checkpoint.load_rows(checkpoint.load()) == [{"id": 1}, {"id": 2}]
+
+def test_checkpoint_for_another_query_is_discarded():
+    FetchCheckpoint("users", "query-1").save("https://graph/next?page=2", 1)
+
+    checkpoint = FetchCheckpoint("users", "query-2")
+
+    assert checkpoint.load() is None
+    assert not checkpoint.exists()
+
+def test_expired_checkpoint_is_discarded():
+    checkpoint = FetchCheckpoint("users", "query-1", max_age=timedelta(hours=1))
+    checkpoint.append_rows([{"id": 1}])
+    checkpoint.save("https://graph/next?page=2", 1)
+    rewrite_state(checkpoint, savedAt=(datetime.utcnow() - timedelta(hours=2)).isoformat() + "Z")
+
+    assert checkpoint.load() is None
+    assert not checkpoint.exists()
+
+def test_checkpoint_without_save_time_is_discarded():
+    checkpoint = FetchCheckpoint("users", "query-1")
+    checkpoint.save("https://graph/next?page=2", 1)
+    rewrite_state(checkpoint, savedAt=None)
+
+    assert checkpoint.load() is None
+
+def test_unreadable_checkpoint_is_discarded():
+    checkpoint = FetchCheckpoint("users", "query-1")
+    checkpoint.save("https://graph/next?page=2", 1)
+    with open(checkpoint.state_file, mode="w", encoding="utf-8") as file:
+        file.write("{")
+
+    assert checkpoint.load() is None
+    assert not checkpoint.exists()
+
+def test_completed_checkpoint_is_resumable_until_cleared():
+    checkpoint = FetchCheckpoint("users", "query-1")
+    checkpoint.save(None, 3)
+
+    assert checkpoint.load()["complete"] is True
+    checkpoint.clear()
+    assert checkpoint.load() is None
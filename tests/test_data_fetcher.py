@@ -0,0 +1,233 @@
+import csv
+import json
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+from utils import data_fetcher
+from utils.checkpoint import FetchCheckpoint
+from utils.data_fetcher import (
+    SIGNIN_SUMMARY_FIELDNAMES,
+    _apply_user_changes,
+    _fetch_signin_shards,
+    _fetch_users_partitioned,
+    _merge_signin_summary,
+    _reduce_signin_rows,
+    _signin_page_rows,
+    _signin_shard_windows,
+    _user_partition_filters,
+    _write_signin_summary,
+    batch_get,
+)
+
+RETENTION_START = datetime(2025, 4, 1)
+
+def signin(signin_id, user_id, signin_time, display_name=None):
+    """Build a decoded sign-in row the way decode_page does with _signin_record_row."""
+    return {
+        "id": signin_id,
+        "userId": user_id,
+        "userDisplayName": display_name or f"User {user_id}",
+        "signInDateTime": signin_time,
+    }
+
+def summary_row(user_id, last, first, count, display_name=None):
+    return {
+        "userId": user_id,
+        "userDisplayName": display_name or f"User {user_id}",
+        "lastSignInDateTime": last,
+        "firstSignInDateTime": first,
+        "signInCount": count,
+    }
+
+def read_summary(path):
+    with open(path, mode="r", newline="", encoding="utf-8") as file:
+        rows = list(csv.DictReader(file))
+    for row in rows:
+        row["signInCount"] = int(row["signInCount"])
+    return {row["userId"]: row for row in rows}
+
+def reduce_pages(pages, known_ids=()):
+    tracker = {"watermark": None, "overlapStart": "", "boundaryIds": {}}
+    summary = {}
+    for page in pages:
+        _reduce_signin_rows(summary, _signin_page_rows(page, set(known_ids), tracker, "2025-04-30T00:00:00Z", {"records": 0}))
+    return summary
+
+def test_reduce_is_independent_of_page_order():
+    newer = [signin("a", "u1", "2025-04-20T10:00:00Z", "New name"), signin("b", "u2", "2025-04-19T08:00:00Z")]
+    older = [signin("c", "u1", "2025-04-10T09:00:00Z", "Old name"), signin("d", "u1", "2025-04-15T09:00:00Z")]
+
+    in_order = reduce_pages([newer, older])
+    out_of_order = reduce_pages([older, newer])
+
+    assert in_order == out_of_order
+    assert in_order["u1"] == summary_row("u1", "2025-04-20T10:00:00Z", "2025-04-10T09:00:00Z", 3, "New name")
+    assert in_order["u2"]["signInCount"] == 1
+
+def test_reduce_skips_known_ids_from_the_overlap_window():
+    page = [signin("seen", "u1", "2025-04-20T09:55:00Z"), signin("new", "u1", "2025-04-20T10:05:00Z")]
+
+    summary = reduce_pages([page], known_ids={"seen"})
+
+    assert summary["u1"]["signInCount"] == 1
+    assert summary["u1"]["lastSignInDateTime"] == "2025-04-20T10:05:00Z"
+
+def test_merge_keeps_the_later_existing_last_sign_in(tmp_path):
+    csv_file = tmp_path / "signin_summary.csv"
+    _write_signin_summary(csv_file, {"u1": summary_row("u1", "2025-04-20T10:00:00Z", "2025-04-02T08:00:00Z", 5, "Current name")})
+    # A late-arriving sign-in from the overlap window, older than the stored latest sign-in
+    late = {"u1": summary_row("u1", "2025-04-20T09:50:00Z", "2025-04-20T09:50:00Z", 1, "Old name")}
+
+    _merge_signin_summary(csv_file, late, RETENTION_START)
+
+    merged = read_summary(csv_file)["u1"]
+    assert merged["lastSignInDateTime"] == "2025-04-20T10:00:00Z"
+    assert merged["userDisplayName"] == "Current name"
+    assert merged["firstSignInDateTime"] == "2025-04-02T08:00:00Z"
+    assert merged["signInCount"] == 6
+
+def test_merge_takes_newer_sign_ins_and_expires_old_users(tmp_path):
+    csv_file = tmp_path / "signin_summary.csv"
+    _write_signin_summary(csv_file, {
+        "u1": summary_row("u1", "2025-04-20T10:00:00Z", "2025-04-02T08:00:00Z", 5),
+        "u2": summary_row("u2", "2025-04-18T07:00:00Z", "2025-04-18T07:00:00Z", 2),
+        "gone": summary_row("gone", "2025-03-20T07:00:00Z", "2025-03-01T07:00:00Z", 4),
+    })
+    new = {"u1": summary_row("u1", "2025-04-25T12:00:00Z", "2025-04-21T09:00:00Z", 3, "Renamed")}
+
+    kept, expired = _merge_signin_summary(csv_file, new, RETENTION_START)
+
+    merged = read_summary(csv_file)
+    assert (kept, expired) == (2, 1)
+    assert set(merged) == {"u1", "u2"}
+    assert merged["u1"] == summary_row("u1", "2025-04-25T12:00:00Z", "2025-04-02T08:00:00Z", 8, "Renamed")
+    assert merged["u2"]["signInCount"] == 2
+    assert list(read_summary(csv_file)["u1"]) == SIGNIN_SUMMARY_FIELDNAMES
+
+def user_row(user_id, display_name, department="Sales", groups="Staff"):
+    return {
+        "User ID": user_id,
+        "User Principal Name": f"{user_id}@example.com",
+        "Display Name": display_name,
+        "Job Title": "Engineer",
+        "Department": department,
+        "Account Enabled": "true",
+        "User Type": "Member",
+        "Groups": groups,
+    }
+
+def test_apply_user_changes_adds_updates_and_removes():
+    users = [user_row("u1", "One"), user_row("u2", "Two"), user_row("u3", "Three")]
+    changes = [
+        {"id": "u1", "department": "Finance"},
+        {"id": "u2", "@removed": {"reason": "deleted"}},
+        {"id": "u4", "userPrincipalName": "u4@example.com", "displayName": "Four", "accountEnabled": False},
+        {"id": "missing", "@removed": {"reason": "deleted"}},
+        {"displayName": "No ID"},
+    ]
+
+    updated, added, changed, removed = _apply_user_changes(users, changes)
+
+    by_id = {user["User ID"]: user for user in updated}
+    assert (added, changed, removed) == (1, 1, 1)
+    assert list(by_id) == ["u1", "u3", "u4"]
+    # Only the properties in the change record are replaced; groups are kept
+    assert by_id["u1"] == {**user_row("u1", "One"), "Department": "Finance"}
+    assert by_id["u4"]["Account Enabled"] == "false"
+    assert by_id["u4"]["Groups"] == "No groups"
+    # The existing rows are not modified in place
+    assert users[0]["Department"] == "Sales"
+
+def test_user_partition_filters_cover_the_key_space():
+    assert _user_partition_filters(1) == [None]
+    assert _user_partition_filters(0) == [None]
+    assert _user_partition_filters(2) == [
+        "userPrincipalName le 'n'",
+        "userPrincipalName ge 'n'",
+    ]
+    filters = _user_partition_filters(4)
+    assert filters[0] == "userPrincipalName le 'g'"
+    assert filters[1] == "userPrincipalName ge 'g' and userPrincipalName le 'n'"
+    assert filters[-1] == "userPrincipalName ge 'u'"
+
+def test_user_partition_filters_are_capped_at_one_per_letter():
+    filters = _user_partition_filters(100)
+
+    assert len(filters) == 26
+    assert filters[0] == "userPrincipalName le 'b'"
+    assert filters[-1] == "userPrincipalName ge 'z'"
+
+def test_batch_get_reports_lookups_that_never_got_a_response(monkeypatch):
+    sent = []
+
+    def send_batch(headers, token_provider, chunk):
+        sent.append([key for key, _ in chunk])
+        # "lost" is never in the $batch response; "slow" is throttled once
+        return [(key, 429 if key == "slow" and len(sent) == 1 else 200, {"id": key}, 0)
+                for key, _ in chunk if key != "lost"]
+
+    monkeypatch.setattr(data_fetcher, "_send_batch", send_batch)
+
+    results = batch_get({}, None, {"ok": "/users/ok", "slow": "/users/slow", "lost": "/users/lost"}, max_retries=2)
+
+    assert results["ok"] == {"status": 200, "body": {"id": "ok"}}
+    assert results["slow"] == {"status": 200, "body": {"id": "slow"}}
+    assert results["lost"] == {"status": None, "body": {}}
+    assert len(sent) == 3
+
+def test_failed_partitioned_fetch_keeps_every_segment_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    def fetch_segment(headers, token_provider, params, label, include_signin_activity, keep_checkpoint):
+        if label == "segment_2_of_2":
+            raise RuntimeError("segment failed")
+        checkpoint = FetchCheckpoint(f"users_{label}", json.dumps(params, sort_keys=True))
+        checkpoint.append_rows([{"User ID": "u1"}])
+        checkpoint.save(None, 1)
+        return [{"User ID": "u1"}]
+
+    monkeypatch.setattr(data_fetcher, "_fetch_user_segment", fetch_segment)
+
+    with pytest.raises(RuntimeError):
+        _fetch_users_partitioned({}, None, {}, 2, max_workers=1)
+
+    finished = FetchCheckpoint("users_segment_1_of_2", json.dumps({"$filter": _user_partition_filters(2)[0], "$count": "true"}, sort_keys=True))
+    assert finished.load()["complete"] is True
+
+def test_signin_shard_windows_are_half_open_except_the_newest():
+    windows = _signin_shard_windows(datetime(2025, 4, 1), datetime(2025, 4, 1, 5), 2)
+
+    assert windows == [
+        ("2025-04-01T00:00:00Z", "2025-04-01T02:00:00Z", "lt"),
+        ("2025-04-01T02:00:00Z", "2025-04-01T04:00:00Z", "lt"),
+        ("2025-04-01T04:00:00Z", "2025-04-01T05:00:00Z", "le"),
+    ]
+
+def test_failed_shard_stops_the_running_shards(tmp_path, monkeypatch):
+    first_page_sent = threading.Event()
+    requests_sent = {"endless": 0}
+
+    def get(url, headers=None, params=None, token_provider=None):
+        if params and "2025-04-01T00:00:00Z" in params["$filter"]:
+            # Fail only once the other shard is paging
+            first_page_sent.wait(timeout=5)
+            return SimpleNamespace(status_code=500, text="server error", content=b"")
+        requests_sent["endless"] += 1
+        first_page_sent.set()
+        time.sleep(0.01)
+        next_link = "next" if requests_sent["endless"] < 200 else None
+        return SimpleNamespace(status_code=200, text="", content=json.dumps({"value": [], "@odata.nextLink": next_link}).encode())
+
+    monkeypatch.setattr(data_fetcher, "get_graph_client", lambda: SimpleNamespace(get=get))
+    output_file = tmp_path / "signin_logs.csv"
+    output_file.write_text("")
+
+    with pytest.raises(RuntimeError):
+        _fetch_signin_shards({}, None, datetime(2025, 4, 1), datetime(2025, 4, 1, 2), 1, 2, str(output_file),
+                             set(), {"watermark": None, "overlapStart": "", "boundaryIds": {}}, "2025-04-30T00:00:00Z",
+                             {"records": 0})
+
+    assert requests_sent["endless"] < 50
+    assert not list(tmp_path.glob("*.shard*"))
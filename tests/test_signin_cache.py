@@ -0,0 +1,67 @@
+import threading
+import pytest
+from utils.signin_cache import SignInCache
+
+def test_hit_returns_the_same_read_only_map():
+    cache = SignInCache()
+
+    first = cache.get(("store",), lambda: {"u1": 1})
+    second = cache.get(("store",), lambda: {"u1": 2})
+
+    assert first is second
+    assert (cache.hits, cache.misses) == (1, 1)
+    with pytest.raises(TypeError):
+        first["u2"] = 3
+
+def test_concurrent_misses_share_one_load_without_blocking_other_keys():
+    cache = SignInCache()
+    started = threading.Event()
+    release = threading.Event()
+    loads = []
+
+    def slow_loader():
+        loads.append("slow")
+        started.set()
+        release.wait(timeout=5)
+        return {"u1": 1}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(("slow",), slow_loader))) for _ in range(3)]
+    threads[0].start()
+    started.wait(timeout=5)
+    for thread in threads[1:]:
+        thread.start()
+    # Another key is served while the slow load is in flight
+    assert cache.get(("fast",), lambda: {"u2": 2}) == {"u2": 2}
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert loads == ["slow"]
+    assert len(results) == 3
+    assert all(result is results[0] for result in results)
+
+def test_loader_errors_are_not_cached():
+    cache = SignInCache()
+
+    def failing_loader():
+        raise ValueError("unreadable")
+
+    with pytest.raises(ValueError):
+        cache.get(("store",), failing_loader)
+    assert cache.get(("store",), lambda: {"u1": 1}) == {"u1": 1}
+
+def test_file_keys_of_evicted_entries_are_pruned(tmp_path):
+    cache = SignInCache(max_versions=2)
+    for index in range(4):
+        path = tmp_path / f"signins_{index}.csv"
+        path.write_text(str(index))
+        cache.get_file(str(path), lambda path, source: {path: source}, "audit_log")
+
+    assert len(cache._entries) == 2
+    assert len(cache._file_keys) == 2
+
+    # A rewritten file replaces the identity of its path
+    path.write_text("rewritten")
+    cache.get_file(str(path), lambda path, source: {path: source}, "audit_log")
+    assert len(cache._file_keys) == 1
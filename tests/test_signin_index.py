@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta, timezone
+from utils.signin_index import LastSignInIndex
+
+NOW = datetime(2025, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+def build_index():
+    users = [{"User ID": user_id, "Display Name": f"User {user_id}"} for user_id in ("recent", "never", "old", "older", "edge")]
+    signins = {
+        "recent": NOW - timedelta(days=2),
+        "old": NOW - timedelta(days=40),
+        "older": NOW - timedelta(days=70, hours=6),
+        "edge": NOW - timedelta(days=30),
+    }
+    return LastSignInIndex(users, signins)
+
+def test_inactive_count_includes_users_who_never_signed_in():
+    index = build_index()
+
+    assert len(index) == 5
+    assert index.signed_in_count == 4
+    assert index.inactive_count(1, now=NOW.timestamp()) == 5
+    assert index.inactive_count(3, now=NOW.timestamp()) == 4
+    assert index.inactive_count(30, now=NOW.timestamp()) == 3
+    assert index.inactive_count(60, now=NOW.timestamp()) == 2
+    assert index.inactive_count(365, now=NOW.timestamp()) == 1
+
+def test_inactive_users_are_longest_inactive_first_then_never_signed_in():
+    frame = build_index().inactive_users(30, now=NOW.timestamp())
+
+    assert list(frame["User ID"]) == ["older", "old", "never"]
+    assert list(frame["Display Name"]) == ["User older", "User old", "User never"]
+    assert list(frame["Days Since Last Sign-In"][:2]) == [70, 40]
+    assert frame["Days Since Last Sign-In"].isna().tolist() == [False, False, True]
+    assert frame["Last Sign-In"].isna().tolist() == [False, False, True]
+    assert frame["Last Sign-In"].iloc[1] == NOW - timedelta(days=40)
+
+def test_threshold_curve_matches_inactive_count():
+    index = build_index()
+
+    curve = index.threshold_curve(max_days=90, now=NOW.timestamp())
+
+    assert len(curve) == 90
+    for days in (1, 2, 3, 30, 31, 70, 71, 90):
+        assert curve.loc[days, "Inactive Users"] == index.inactive_count(days, now=NOW.timestamp())
@@ -0,0 +1,36 @@
+from datetime import datetime, timezone
+from types import MappingProxyType
+import pytest
+from utils import user_db
+from utils.user_snapshot import SnapshotRegistry
+from utils.user_table import UserTable
+
+@pytest.fixture
+def user_db_file(tmp_path, monkeypatch):
+    # Snapshot and database files are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    table = UserTable.from_users([
+        {"User ID": "u1", "Display Name": "User 1", "Department": "Sales", "Groups": "No groups"},
+        {"User ID": "u2", "Display Name": "User 2", "Department": "N/A", "Groups": "No groups"},
+        {"User ID": "u3", "Display Name": "User 3", "Department": "", "Groups": "No groups"},
+    ])
+    SnapshotRegistry().publish(table)
+    return user_db.write_users(table)
+
+def test_departments_exclude_missing_values(user_db_file):
+    assert user_db.departments(user_db_file) == ["Sales"]
+
+def test_sync_signins_writes_each_shared_map_once(user_db_file, monkeypatch):
+    writes = []
+    write_signins = user_db.write_signins
+    monkeypatch.setattr(user_db, "write_signins", lambda *args: writes.append(args[2]) or write_signins(*args))
+    signin_data = MappingProxyType({"u1": datetime(2025, 4, 20, 10, 0, tzinfo=timezone.utc)})
+
+    assert user_db.sync_signins(user_db_file, signin_data, "audit_log") is True
+    # A new session reading the same cached map does not rewrite the table
+    assert user_db.sync_signins(user_db_file, signin_data, "audit_log") is False
+    assert user_db.sync_signins(user_db_file, signin_data, "audit_summary") is True
+    assert user_db.sync_signins(user_db_file, MappingProxyType(dict(signin_data)), "audit_log") is True
+
+    assert writes == ["audit_log", "audit_summary", "audit_log"]
+    assert user_db.count_signed_in_since(user_db_file, datetime(2025, 4, 1, tzinfo=timezone.utc), "audit_log") == 1
@@ -0,0 +1,43 @@
+import threading
+import pytest
+from utils.membership_index import MembershipIndex
+from utils.user_snapshot import SnapshotRegistry, load_snapshot_metadata
+from utils.user_table import UserTable
+
+@pytest.fixture(autouse=True)
+def snapshot_dir(tmp_path, monkeypatch):
+    # The snapshot and membership index files are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+
+def user_table(user_ids):
+    return UserTable.from_users([{"User ID": user_id, "Display Name": user_id, "Groups": "No groups"} for user_id in user_ids])
+
+def test_concurrent_publishes_get_distinct_versions():
+    registry = SnapshotRegistry()
+    tables = [user_table([f"u{index}"]) for index in range(8)]
+    barrier = threading.Barrier(len(tables))
+    versions = []
+
+    def publish(table):
+        barrier.wait()
+        versions.append(registry.publish(table)["version"])
+
+    threads = [threading.Thread(target=publish, args=(table,)) for table in tables]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(versions) == list(range(1, 9))
+    assert sorted(table.version for table in tables) == list(range(1, 9))
+    assert load_snapshot_metadata()["version"] == 8
+    assert registry.latest_version() == 8
+
+def test_membership_index_is_saved_with_its_snapshot_version():
+    registry = SnapshotRegistry()
+    index = MembershipIndex(["g1"], ["Group 1"], [["u1"]])
+
+    metadata = registry.publish(user_table(["u1"]), index)
+
+    assert MembershipIndex.load(metadata["version"]) is not None
+    assert MembershipIndex.load(metadata["version"] + 1) is None
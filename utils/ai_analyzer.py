@@ -1,60 +1,182 @@
 import csv
-from datetime import datetime, timezone, timedelta
-import pytz
+from datetime import datetime, timezone
 import logging
 import sys
 import httpx
 from openai import AzureOpenAI
 import streamlit as st
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+from utils.signin_store import SignInStore
+from utils.signin_cache import get_signin_cache
+from utils.signin_index import LastSignInIndex
 from utils.logger import setup_logger
 
 # Configure logging for ai_analyzer.py
 logger = setup_logger("ai_analyzer", "logs/ai.log")
 logger.info("Starting ai_analyzer module")
 
-# Function to read sign-in logs from a fixed CSV file
-def read_signin_logs():
+# Sign-in CSV column names, current schema first: (user ID column, sign-in time column)
+SIGNIN_CSV_COLUMNS = (("User ID", "Sign-In Date"), ("userId", "signInDateTime"))
+# Timestamp format written by the fetcher; other values are parsed with datetime.fromisoformat
+SIGNIN_CSV_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+def _signin_csv_columns(csv_file):
+    """
+    Pick the user ID and sign-in time columns of a sign-in CSV.
+
+    A legacy "User ID" / "Sign-In Date" column takes precedence over
+    "userId" / "signInDateTime", as it always has.
+
+    Args:
+        csv_file (str): CSV file path
+
+    Returns:
+        tuple: (user ID column, sign-in time column); either is None if absent
     """
-    Read sign-in logs from signin_logs.csv.
+    with open(csv_file, mode="r", newline="", encoding="utf-8") as file:
+        header = next(csv.reader(file), [])
+    user_column = next((user for user, _ in SIGNIN_CSV_COLUMNS if user in header), None)
+    time_column = next((time for _, time in SIGNIN_CSV_COLUMNS if time in header), None)
+    return user_column, time_column
+
+def _read_signin_csv(csv_file):
+    """
+    Reduce a sign-in CSV to the latest sign-in of every user in bulk.
+
+    Reads only the user ID and sign-in time columns with the pyarrow CSV
+    reader, parses fetcher-format timestamps in one vectorized pass and takes
+    the per-user maximum with a grouped reduction. The rare values the
+    vectorized pass cannot reproduce exactly go through datetime.strptime or
+    datetime.fromisoformat one by one, as every row used to.
+    Skipped rows are reported once per file instead of once per row.
+
+    Args:
+        csv_file (str): CSV file path
+
+    Returns:
+        dict: Mapping of user IDs to their latest sign-in times
+    """
+    user_column, time_column = _signin_csv_columns(csv_file)
+    if time_column is None:
+        raise ValueError(f"{csv_file} has no sign-in time column")
+    if user_column is None:
+        logger.warning(f"Skipping all sign-in logs in {csv_file}: no user ID column")
+        return {}
+    table = pa_csv.read_csv(
+        csv_file,
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=[user_column, time_column],
+            column_types={user_column: pa.string(), time_column: pa.string()},
+            strings_can_be_null=False,
+        ),
+    )
+    logger.debug(f"Read {table.num_rows} sign-in records from {csv_file}")
+    user_ids = table[user_column]
+    times = table[time_column]
+    has_user = pc.not_equal(user_ids, "")
+    has_time = pc.and_(has_user, pc.not_equal(times, "N/A"))
+    with_user = pc.sum(has_user).as_py() or 0
+    missing_users = table.num_rows - with_user
+    missing_times = with_user - (pc.sum(has_time).as_py() or 0)
+    if missing_users:
+        logger.warning(f"Skipping {missing_users} sign-in logs with missing user ID")
+    if missing_times:
+        logger.warning(f"Skipping {missing_times} sign-in logs with missing signInDateTime")
+
+    fetcher_format = pc.and_(has_time, pc.match_substring(times, "Z"))
+    fetcher_users = pc.filter(user_ids, fetcher_format)
+    fetcher_times = pc.filter(times, fetcher_format)
+    parsed = pc.cast(
+        pc.strptime(fetcher_times, format=SIGNIN_CSV_TIME_FORMAT, unit="s", error_is_null=True),
+        pa.timestamp("s", tz="UTC")
+    )
+    # pyarrow normalizes out-of-range fields (e.g. April 31st) that datetime.strptime rejects,
+    # so only values that format back to themselves are taken from the vectorized parse
+    exact = pc.fill_null(pc.equal(pc.strftime(parsed, format=SIGNIN_CSV_TIME_FORMAT), fetcher_times), False)
+    fetcher_rows = pa.table({"userId": pc.filter(fetcher_users, exact), "signInDateTime": pc.filter(parsed, exact)})
+    latest = fetcher_rows.group_by("userId").aggregate([("signInDateTime", "max")])
+    signin_data = dict(zip(latest["userId"].to_pylist(), latest["signInDateTime_max"].to_pylist()))
+
+    # The rest keep the historical datetime.strptime handling
+    unparseable = []
+    inexact = pc.invert(exact)
+    for user_id, signin_time in zip(pc.filter(fetcher_users, inexact).to_pylist(), pc.filter(fetcher_times, inexact).to_pylist()):
+        try:
+            signin_date = datetime.strptime(signin_time, SIGNIN_CSV_TIME_FORMAT).replace(tzinfo=timezone.utc)
+        except ValueError:
+            unparseable.append(signin_time)
+            continue
+        if user_id not in signin_data or signin_date > signin_data[user_id]:
+            signin_data[user_id] = signin_date
+    if unparseable:
+        logger.error(f"Skipping {len(unparseable)} sign-in logs with unparseable Sign-In Date, e.g. {unparseable[0]}")
+
+    # Values without "Z" keep the historical fromisoformat handling
+    other_format = pc.and_(has_time, pc.invert(pc.match_substring(times, "Z")))
+    for user_id, signin_time in zip(pc.filter(user_ids, other_format).to_pylist(), pc.filter(times, other_format).to_pylist()):
+        try:
+            signin_date = datetime.fromisoformat(signin_time)
+        except ValueError as e:
+            logger.error(f"Error parsing Sign-In Date for user {user_id}: {signin_time}, Error: {str(e)}")
+            continue
+        if user_id not in signin_data or signin_date > signin_data[user_id]:
+            signin_data[user_id] = signin_date
+    return signin_data
+
+def _read_signin_store(store, start_day):
+    """
+    Reduce the sign-in store to the latest sign-in of every user.
+
+    Args:
+        store (SignInStore): Sign-in store
+        start_day (str): "YYYY-MM-DD" of the first partition to load, or None for all
+
+    Returns:
+        dict: Mapping of user IDs to their latest sign-in times
+    """
+    start = datetime.strptime(start_day, "%Y-%m-%d") if start_day else None
+    latest = store.latest_signins(start=start)
+    # Timestamps are stored in nanoseconds; datetime holds microseconds
+    signin_times = pc.cast(latest["signInDateTime"], pa.timestamp("us", tz="UTC"), safe=False)
+    return dict(zip(latest["userId"].to_pylist(), signin_times.to_pylist()))
+
+# Function to read the latest sign-in per user from the sign-in store
+def read_signin_logs(start=None):
+    """
+    Read the latest sign-in of every user.
+
+    Uses the columnar sign-in store, loading only the date partitions from
+    start onwards. Falls back to signin_logs.csv when no store has been
+    written yet. Parsed results are shared across sessions until the store
+    or file changes.
+    
+    Args:
+        start (datetime, optional): Naive UTC time; date partitions before its day are not loaded
     
     Returns:
-        dict: Mapping of user IDs to their latest sign-in times (for compatibility with existing code)
-              or a list of sign-in entries (for detailed queries in the future)
+        Mapping: Read-only mapping of user IDs to their latest sign-in times
     """
+    store = SignInStore()
+    if store.exists():
+        try:
+            # The store is filtered by whole date partitions, so the start day is enough to key on
+            start_day = start.strftime("%Y-%m-%d") if start else None
+            signin_data = get_signin_cache().get_directory(
+                store.root, lambda day: _read_signin_store(store, day), start_day
+            )
+            logger.debug(f"Read latest sign-ins for {len(signin_data)} users from {store.root}")
+            return signin_data
+        except Exception as e:
+            logger.error(f"Error reading sign-in store: {str(e)}")
+            st.error(f"Error reading sign-in store: {str(e)}")
+            return {}
+
     csv_file = "signin_logs.csv"
-    signin_data = {}
     try:
-        with open(csv_file, mode="r", newline="", encoding="utf-8") as file:
-            reader = csv.DictReader(file)
-            data = list(reader)
-            logger.debug(f"Read {len(data)} sign-in records from {csv_file}")
-            for row in data:
-                # Handle both possible column names: "User ID" (existing) or "userId" (new)
-                user_id = row.get("User ID", row.get("userId"))
-                if not user_id:
-                    logger.warning("Skipping sign-in log with missing user ID")
-                    continue
-
-                # Handle both possible date fields: "Sign-In Date" (existing) or "signInDateTime" (new)
-                signin_time = row.get("Sign-In Date", row.get("signInDateTime"))
-                if signin_time == "N/A":
-                    logger.warning(f"Skipping sign-in log with missing signInDateTime for userId: {user_id}")
-                    continue
-
-                try:
-                    # Handle both formats: "2025-04-28T20:57:03Z" (existing) or ISO with "Z" replacement (new)
-                    if "Z" in signin_time:
-                        signin_date = datetime.strptime(signin_time, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
-                    else:
-                        signin_date = datetime.fromisoformat(signin_time.replace("Z", "+00:00"))
-                except ValueError as e:
-                    logger.error(f"Error parsing Sign-In Date for user {user_id}: {signin_time}, Error: {str(e)}")
-                    continue
-
-                # For compatibility with existing code, store as a single datetime
-                if user_id not in signin_data or signin_date > signin_data[user_id]:
-                    signin_data[user_id] = signin_date
-                logger.debug(f"Loaded sign-in for user {user_id}: {signin_date}")
+        signin_data = get_signin_cache().get_file(csv_file, _read_signin_csv)
+        logger.debug(f"Read latest sign-ins for {len(signin_data)} users from {csv_file}")
     except FileNotFoundError:
         logger.error(f"Sign-in logs file {csv_file} not found")
         st.warning(f"Sign-in logs file {csv_file} not found.")
@@ -65,6 +187,108 @@ def read_signin_logs():
         return {}
     return signin_data
 
+def _read_signin_summary_csv(csv_file):
+    """
+    Read the latest sign-in per user from a sign-in summary CSV.
+
+    Args:
+        csv_file (str): CSV file path
+
+    Returns:
+        dict: Mapping of user IDs to their latest sign-in times
+    """
+    signin_data = {}
+    with open(csv_file, mode="r", newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            user_id = row.get("userId")
+            signin_time = row.get("lastSignInDateTime")
+            if not user_id or not signin_time:
+                logger.warning("Skipping sign-in summary row with missing user ID or sign-in time")
+                continue
+            try:
+                signin_data[user_id] = datetime.fromisoformat(signin_time.replace("Z", "+00:00"))
+            except ValueError as e:
+                logger.error(f"Error parsing lastSignInDateTime for user {user_id}: {signin_time}, Error: {str(e)}")
+    return signin_data
+
+# Function to read the per-user sign-in summary written by aggregate fetches
+def read_signin_summary():
+    """
+    Read the latest sign-in per user from signin_summary.csv.
+
+    Parsed results are shared across sessions until the file changes.
+    
+    Returns:
+        Mapping: Read-only mapping of user IDs to their latest sign-in times
+    """
+    csv_file = "signin_summary.csv"
+    try:
+        signin_data = get_signin_cache().get_file(csv_file, _read_signin_summary_csv)
+        logger.debug(f"Read latest sign-ins for {len(signin_data)} users from {csv_file}")
+    except FileNotFoundError:
+        logger.error(f"Sign-in summary file {csv_file} not found")
+        st.warning(f"Sign-in summary file {csv_file} not found.")
+        return {}
+    except Exception as e:
+        logger.error(f"Error reading sign-in summary: {str(e)}")
+        st.error(f"Error reading sign-in summary: {str(e)}")
+        return {}
+    return signin_data
+
+# Last sign-in sources with their display labels, the default first
+SIGNIN_SOURCE_LABELS = {
+    "signin_activity": "User signInActivity",
+    "audit_log": "Sign-in audit log",
+    "audit_summary": "Sign-in summary",
+}
+
+def signin_sources(users_data):
+    """
+    List the last sign-in sources available for a set of users.
+
+    Args:
+        users_data (list): List of user data dictionaries
+
+    Returns:
+        list: Source names, the default first; signInActivity only if it was fetched with the users
+    """
+    has_activity = bool(users_data) and "Last Sign-In" in users_data[0]
+    return [source for source in SIGNIN_SOURCE_LABELS if source != "signin_activity" or has_activity]
+
+# Function to derive last sign-ins from the signInActivity columns of users_data
+def read_signin_activity(users_data):
+    """
+    Build the last sign-in mapping from users fetched with signInActivity.
+
+    Uses the later of the interactive and non-interactive last sign-in times,
+    so no sign-in log download is needed and there is no 30-day horizon.
+    
+    Args:
+        users_data (list): List of user data dictionaries fetched with include_signin_activity
+    
+    Returns:
+        dict: Mapping of user IDs to their latest sign-in times
+    """
+    signin_data = {}
+    for user in users_data:
+        user_id = user.get("User ID")
+        latest = None
+        for column in ("Last Sign-In", "Last Non-Interactive Sign-In"):
+            signin_time = user.get(column)
+            if not signin_time or signin_time == "N/A":
+                continue
+            try:
+                signin_date = datetime.fromisoformat(signin_time.replace("Z", "+00:00"))
+            except ValueError as e:
+                logger.error(f"Error parsing {column} for user {user_id}: {signin_time}, Error: {str(e)}")
+                continue
+            if latest is None or signin_date > latest:
+                latest = signin_date
+        if user_id and latest:
+            signin_data[user_id] = latest
+    logger.debug(f"Derived last sign-ins for {len(signin_data)} users from signInActivity")
+    return signin_data
+
 # Function to analyze departments with Azure OpenAI
 def analyze_departments(user_data, api_key, endpoint, deployment_name, api_version):
     """
@@ -293,43 +517,74 @@ def nlp_query(user_data, query, api_key, endpoint, deployment_name, api_version)
     finally:
         http_client.close()
 
+# Function to read the last sign-ins from a source
+def read_last_signins(users_data, signin_source="audit_log"):
+    """
+    Read the latest sign-in of every user from a source.
+
+    signInActivity maps of a published snapshot are shared across sessions
+    like the file-based sources, so the same data is always the same map.
+
+    Args:
+        users_data (list): List of user data dictionaries
+        signin_source (str): "audit_log" to read the sign-in store, "audit_summary" to read
+            signin_summary.csv, or "signin_activity" to use the signInActivity columns fetched with the users
+
+    Returns:
+        Mapping: Mapping of user IDs to their latest sign-in times
+    """
+    if signin_source == "signin_activity":
+        dataset_version = getattr(users_data, "dataset_version", None)
+        if dataset_version is None:
+            return read_signin_activity(users_data)
+        return get_signin_cache().get(("signin_activity", dataset_version), lambda: read_signin_activity(users_data))
+    if signin_source == "audit_log":
+        return read_signin_logs()
+    if signin_source == "audit_summary":
+        return read_signin_summary()
+    logger.critical(f"Invalid sign-in source: {signin_source}")
+    raise ValueError(f"Invalid sign-in source: {signin_source}")
+
+# Function to index users by their last sign-in
+def build_signin_index(users_data, signin_source="audit_log"):
+    """
+    Read the last sign-ins from a source and index users by them.
+
+    Args:
+        users_data (list): List of user data dictionaries
+        signin_source (str): "audit_log" to read the sign-in store, "audit_summary" to read
+            signin_summary.csv, or "signin_activity" to use the signInActivity columns fetched with the users
+
+    Returns:
+        LastSignInIndex: Users sorted by last sign-in
+    """
+    return LastSignInIndex(users_data, read_last_signins(users_data, signin_source))
+
 # Function to analyze inactive users
-def analyze_inactive_users(users_data, inactivity_days=30):
+def analyze_inactive_users(users_data, inactivity_days=30, signin_source="audit_log", signin_index=None):
     """
     Analyze inactive users based on sign-in logs.
+
+    Inactive users are a binary search and a slice of the last sign-in
+    index, so an existing index answers any threshold without re-reading
+    sign-ins.
     
     Args:
         users_data (list): List of user data dictionaries
         inactivity_days (int): Number of days to consider for inactivity
+        signin_source (str): "audit_log" to read the sign-in store, "audit_summary" to read
+            signin_summary.csv, or "signin_activity" to use the signInActivity columns fetched with the users
+        signin_index (LastSignInIndex, optional): Index from build_signin_index; built from
+            signin_source when not given
     
     Returns:
-        list: List of inactive user dictionaries
+        pandas.DataFrame: Inactive users with their last sign-in and days since it,
+            longest inactive first
     """
-    logger.info(f"Starting inactive users analysis for {inactivity_days} days")
-    signin_data = read_signin_logs()
-    current_date = datetime.now(pytz.UTC)
-    threshold_date = current_date - timedelta(days=inactivity_days)
-    logger.debug(f"Current date: {current_date}, Threshold date: {threshold_date}")
-    inactive_users = []
-
-    for user in users_data:
-        user_id = user["User ID"]
-        display_name = user["Display Name"]
-        last_signin = signin_data.get(user_id)
-
-        if not last_signin or last_signin < threshold_date:
-            if last_signin:
-                days_inactive = (current_date - last_signin).days
-                logger.debug(f"User {user_id} last signed in {days_inactive} days ago")
-            else:
-                days_inactive = "No sign-in recorded"
-                logger.debug(f"User {user_id} has no sign-in recorded")
-            inactive_users.append({
-                "User ID": user_id,
-                "Display Name": display_name,
-                "Days Since Last Sign-In": days_inactive
-            })
-
+    logger.info(f"Starting inactive users analysis for {inactivity_days} days using {signin_source}")
+    if signin_index is None:
+        signin_index = build_signin_index(users_data, signin_source)
+    inactive_users = signin_index.inactive_users(inactivity_days)
     logger.info(f"Found {len(inactive_users)} inactive users")
     return inactive_users
 
@@ -1,3 +1,5 @@
+import threading
+import time
 from azure.identity import ClientSecretCredential
 import streamlit as st
 from utils.logger import setup_logger
@@ -5,30 +7,134 @@ from utils.logger import setup_logger
 # Setup logger
 logger = setup_logger("auth", "logs/app.log")
 
+GRAPH_SCOPE = "https://graph.microsoft.com/.default"
+# Tokens are refreshed this many seconds before they expire
+TOKEN_REFRESH_MARGIN_SECONDS = 300
+
+class TokenProvider:
+    """
+    Cached access token for one (tenant, client, scope).
+
+    The token is reused until shortly before it expires. A background timer
+    refreshes it ahead of expiry if it has been used since the last refresh,
+    so callers rarely wait on the token endpoint. Long fetches pass the
+    provider to GraphClient, which reads the current token for every request
+    so refreshed tokens reach fetches already in flight. Safe to call from
+    multiple fetch threads.
+    """
+
+    def __init__(self, tenant_id, client_id, client_secret, scope=GRAPH_SCOPE,
+                 refresh_margin=TOKEN_REFRESH_MARGIN_SECONDS):
+        """
+        Create a token provider.
+
+        Args:
+            tenant_id (str): Azure tenant ID
+            client_id (str): Azure client ID
+            client_secret (str): Azure client secret
+            scope (str): Token scope
+            refresh_margin (int): Seconds before expiry at which the token is refreshed
+        """
+        self.scope = scope
+        self.client_secret = client_secret
+        self.refresh_margin = refresh_margin
+        self._credential = ClientSecretCredential(
+            tenant_id=tenant_id,
+            client_id=client_id,
+            client_secret=client_secret
+        )
+        self._token = None
+        self._used = False
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def get_token(self, rejected_token=None):
+        """
+        Get a valid access token, requesting a new one only when needed.
+
+        Args:
+            rejected_token (str, optional): Token that Graph answered with 401; it is
+                replaced unless another thread has already refreshed it
+
+        Returns:
+            str: Access token
+        """
+        with self._lock:
+            self._used = True
+            if (self._token is None or self._token.expires_on - time.time() <= self.refresh_margin
+                    or self._token.token == rejected_token):
+                self._refresh()
+            return self._token.token
+
+    def _refresh(self):
+        """Request a new token and schedule the next background refresh. Caller holds the lock."""
+        logger.debug(f"Requesting access token for scope: {self.scope}")
+        self._token = self._credential.get_token(self.scope)
+        self._used = False
+        logger.info("Successfully obtained access token")
+        if self._timer is not None:
+            self._timer.cancel()
+        delay = max(0, self._token.expires_on - time.time() - self.refresh_margin)
+        self._timer = threading.Timer(delay, self._refresh_in_background)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _refresh_in_background(self):
+        """Timer callback that refreshes the token ahead of expiry if it is still in use."""
+        with self._lock:
+            if not self._used:
+                logger.debug("Access token unused since last refresh, skipping background refresh")
+                self._timer = None
+                return
+            try:
+                self._refresh()
+            except Exception as e:
+                # The next get_token call retries synchronously
+                logger.warning(f"Background token refresh failed: {str(e)}")
+                self._timer = None
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+def get_token_provider(tenant_id, client_id, client_secret, scope=GRAPH_SCOPE):
+    """
+    Get the process-wide token provider for a (tenant, client, scope).
+
+    Providers live at module level, so they are shared by every Streamlit
+    session and survive reruns.
+
+    Args:
+        tenant_id (str): Azure tenant ID
+        client_id (str): Azure client ID
+        client_secret (str): Azure client secret
+        scope (str): Token scope
+
+    Returns:
+        TokenProvider: Cached token provider
+    """
+    key = (tenant_id, client_id, scope)
+    with _providers_lock:
+        provider = _providers.get(key)
+        if provider is None or provider.client_secret != client_secret:
+            provider = TokenProvider(tenant_id, client_id, client_secret, scope)
+            _providers[key] = provider
+        return provider
+
 def get_access_token(tenant_id, client_id, client_secret):
     """
     Get an access token for Microsoft Graph API.
-    
+
     Args:
         tenant_id (str): Azure tenant ID
         client_id (str): Azure client ID
         client_secret (str): Azure client secret
-    
+
     Returns:
         str: Access token, or None if failed
     """
-    scope = "https://graph.microsoft.com/.default"
-    logger.debug(f"Attempting to get access token for scope: {scope}")
     try:
-        credential = ClientSecretCredential(
-            tenant_id=tenant_id,
-            client_id=client_id,
-            client_secret=client_secret
-        )
-        token = credential.get_token(scope)
-        logger.info("Successfully obtained access token")
-        return token.token
+        return get_token_provider(tenant_id, client_id, client_secret).get_token()
     except Exception as e:
         logger.error(f"Error getting access token: {str(e)}")
         st.error(f"Error getting access token: {str(e)}")
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,144 @@
+import json
+import os
+from datetime import datetime, timedelta
+from utils.logger import setup_logger
+
+# Setup logger
+logger = setup_logger("checkpoint", "logs/app.log")
+
+# Directory holding in-progress fetch checkpoints
+CHECKPOINT_DIR = "checkpoints"
+# Checkpoints older than this are discarded instead of resumed, so stale partial
+# results are never merged with a fresh fetch
+CHECKPOINT_MAX_AGE = timedelta(hours=24)
+
+class FetchCheckpoint:
+    """
+    Resumable progress of one Graph pagination run.
+
+    The state file records the next page to fetch plus any caller metadata.
+    Callers that keep fetched rows in memory can also append each completed
+    page to a JSON-lines rows file; the state records how many bytes of it
+    belong to completed pages, so a page that was half written when the run
+    died is discarded on resume. A fingerprint of the query guards against
+    resuming a checkpoint written for different parameters, and checkpoints
+    older than max_age are discarded.
+    """
+
+    def __init__(self, name, fingerprint, max_age=CHECKPOINT_MAX_AGE):
+        """
+        Create a checkpoint handle.
+
+        Args:
+            name (str): Checkpoint name, used for the file names
+            fingerprint (str): Identifies the query; checkpoints with another fingerprint are discarded
+            max_age (timedelta): Age after which a saved checkpoint is discarded instead of resumed
+        """
+        self.name = name
+        self.fingerprint = fingerprint
+        self.max_age = max_age
+        self.state_file = os.path.join(CHECKPOINT_DIR, f"{name}.json")
+        self.rows_file = os.path.join(CHECKPOINT_DIR, f"{name}.jsonl")
+
+    def exists(self):
+        """
+        Check whether a checkpoint has been saved.
+
+        Returns:
+            bool: True if the state file exists
+        """
+        return os.path.exists(self.state_file)
+
+    def load(self):
+        """
+        Load the saved checkpoint state.
+
+        Returns:
+            dict: Saved state including "nextLink" (or "complete" once the last page
+                  is written), or None if there is nothing to resume or it has expired
+        """
+        try:
+            with open(self.state_file, mode="r", encoding="utf-8") as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            return None
+        except (ValueError, OSError) as e:
+            logger.warning(f"Discarding unreadable checkpoint {self.state_file}: {str(e)}")
+            self.clear()
+            return None
+        if state.get("fingerprint") != self.fingerprint or not (state.get("nextLink") or state.get("complete")):
+            logger.info(f"Discarding checkpoint {self.name} written for a different query")
+            self.clear()
+            return None
+        try:
+            age = datetime.utcnow() - datetime.fromisoformat(state["savedAt"].rstrip("Z"))
+        except (KeyError, AttributeError, TypeError, ValueError):
+            age = None
+        if age is None or age > self.max_age:
+            logger.info(f"Discarding checkpoint {self.name} saved {state.get('savedAt')}, older than {self.max_age}")
+            self.clear()
+            return None
+        logger.info(f"Found checkpoint {self.name} at page {state.get('pages')} saved {state.get('savedAt')}")
+        return state
+
+    def load_rows(self, state):
+        """
+        Load the rows of completed pages, dropping any partially written page.
+
+        Args:
+            state (dict): State returned by load()
+
+        Returns:
+            list: Saved rows
+        """
+        rows_bytes = state.get("rowsBytes", 0)
+        if not rows_bytes:
+            return []
+        with open(self.rows_file, mode="r+b") as file:
+            file.truncate(rows_bytes)
+            file.seek(0)
+            return [json.loads(line) for line in file if line.strip()]
+
+    def append_rows(self, rows):
+        """
+        Append the rows of one completed page to the rows file.
+
+        Args:
+            rows (list): JSON-serializable rows
+        """
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        with open(self.rows_file, mode="a", encoding="utf-8") as file:
+            for row in rows:
+                file.write(json.dumps(row))
+                file.write("\n")
+
+    def save(self, next_link, pages, **extra):
+        """
+        Record that every page before next_link has been written.
+
+        Args:
+            next_link (str): @odata.nextLink of the first page not yet fetched, or None when
+                all pages are written but the caller is not ready to discard the checkpoint
+            pages (int): Number of completed pages
+            **extra: Additional JSON-serializable state to restore on resume
+        """
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        state = dict(extra)
+        state.update({
+            "fingerprint": self.fingerprint,
+            "nextLink": next_link,
+            "complete": next_link is None,
+            "pages": pages,
+            "rowsBytes": os.path.getsize(self.rows_file) if os.path.exists(self.rows_file) else 0,
+            "savedAt": datetime.utcnow().isoformat() + "Z",
+        })
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, mode="w", encoding="utf-8") as file:
+            json.dump(state, file)
+        os.replace(tmp_file, self.state_file)
+
+    def clear(self):
+        """Discard the checkpoint once the run has finished or can no longer be resumed."""
+        for path in (self.state_file, self.rows_file):
+            if os.path.exists(path):
+                os.remove(path)
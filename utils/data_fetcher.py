@@ -1,22 +1,528 @@
 import streamlit as st
-import requests
 from datetime import datetime, timedelta
 import csv
+import json
 import os
-from utils.auth import get_access_token
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_EXCEPTION
+from contextlib import ExitStack
+from utils.auth import get_access_token, get_token_provider
+from utils.graph_client import get_graph_client, RETRY_STATUS_CODES, DEFAULT_MAX_RETRIES, backoff_seconds
+from utils.graph_json import decode_page, loads
+from utils.checkpoint import FetchCheckpoint
+from utils.signin_store import SignInStore
+from utils.membership_index import MembershipIndex
 from utils.logger import setup_logger
 
 # Setup logger
 logger = setup_logger("data_fetcher", "logs/app.log")
 
-def fetch_signin_logs(tenant_id, client_id, client_secret):
+# Leading letters used to split /users into userPrincipalName ranges; UPNs starting
+# with a digit are rare and sort before "a", so they fall into the first range
+USER_PARTITION_ALPHABET = "abcdefghijklmnopqrstuvwxyz"
+# Default concurrency for partitioned fetches; keep low to stay under Graph throttling limits
+DEFAULT_MAX_WORKERS = 4
+# Properties requested for every user, shared by full fetches and delta syncs
+USER_SELECT_FIELDS = "id,userPrincipalName,displayName,jobTitle,department,accountEnabled,userType"
+# Graph property -> users_data column, used to apply partial delta updates
+USER_FIELD_COLUMNS = {
+    "id": "User ID",
+    "userPrincipalName": "User Principal Name",
+    "displayName": "Display Name",
+    "jobTitle": "Job Title",
+    "department": "Department",
+    "accountEnabled": "Account Enabled",
+    "userType": "User Type",
+}
+# users_data columns filled from signInActivity
+SIGNIN_ACTIVITY_COLUMNS = ("Last Sign-In", "Last Non-Interactive Sign-In")
+# Local file holding the deltaLink from the last user sync
+USERS_DELTA_STATE_FILE = "users_delta_state.json"
+# Sign-ins are stored in the columnar SignInStore; this CSV is the staging/export format and the pre-store location
+SIGNIN_LOGS_FILE = "signin_logs.csv"
+# Watermark state used for incremental ingestion
+SIGNIN_STATE_FILE = "signin_logs_state.json"
+SIGNIN_FIELDNAMES = ["id", "userId", "userDisplayName", "signInDateTime", "collectionDate"]
+SIGNIN_SELECT_FIELDS = "id,userId,userDisplayName,createdDateTime"
+SIGNIN_RETENTION_DAYS = 30
+# Sign-ins can land in the audit log a few minutes late, so incremental runs re-read this much before the watermark
+SIGNIN_INGEST_OVERLAP = timedelta(minutes=15)
+# Per-user sign-in summary written instead of raw events in aggregate mode, with its own watermark state
+SIGNIN_SUMMARY_FILE = "signin_summary.csv"
+SIGNIN_SUMMARY_STATE_FILE = "signin_summary_state.json"
+SIGNIN_SUMMARY_FIELDNAMES = ["userId", "userDisplayName", "lastSignInDateTime", "firstSignInDateTime", "signInCount"]
+# Default write buffer for streaming sign-in pages to disk
+SIGNIN_WRITE_BUFFER_BYTES = 1024 * 1024
+
+# How often the calling thread reports shard progress while sharded sign-in fetches run
+SHARD_PROGRESS_INTERVAL_SECONDS = 0.5
+# Graph JSON batching accepts at most 20 sub-requests per call
+GRAPH_BATCH_LIMIT = 20
+
+class _FetchAborted(Exception):
+    """Raised inside a fetch after the failure has already been logged and reported."""
+
+def _load_signin_state(state_file):
+    """
+    Load the sign-in ingestion watermark state.
+
+    Args:
+        state_file (str): Path to the sign-in state file
+
+    Returns:
+        dict: State with "watermark" and "boundaryIds", or None if unavailable
+    """
+    try:
+        with open(state_file, mode="r", encoding="utf-8") as file:
+            state = json.load(file)
+        if not state.get("watermark"):
+            return None
+        return state
+    except FileNotFoundError:
+        return None
+    except (ValueError, OSError) as e:
+        logger.warning(f"Ignoring unreadable sign-in state file {state_file}: {str(e)}")
+        return None
+
+def _save_signin_state(state_file, watermark, boundary_ids):
+    """
+    Persist the sign-in ingestion watermark state.
+
+    Args:
+        state_file (str): Path to the sign-in state file
+        watermark (str): Newest createdDateTime ingested so far
+        boundary_ids (dict): Sign-in ID -> createdDateTime for records inside the overlap window
+    """
+    tmp_file = f"{state_file}.tmp"
+    with open(tmp_file, mode="w", encoding="utf-8") as file:
+        json.dump({"watermark": watermark, "boundaryIds": boundary_ids}, file)
+    os.replace(tmp_file, state_file)
+    logger.debug(f"Saved sign-in watermark {watermark} to {state_file}")
+
+def _parse_graph_datetime(value):
+    """
+    Parse a Graph ISO 8601 UTC timestamp such as "2025-04-28T20:57:03Z".
+
+    Args:
+        value (str): Timestamp string
+
+    Returns:
+        datetime: Naive UTC datetime
+    """
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+
+def _format_graph_datetime(value):
+    """
+    Format a naive UTC datetime for an OData $filter.
+
+    Args:
+        value (datetime): Naive UTC datetime
+
+    Returns:
+        str: Timestamp string such as "2025-04-28T20:57:03Z"
+    """
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def _signin_file_has_ids(csv_file):
+    """
+    Check whether an existing sign-in logs file carries sign-in IDs.
+
+    Files written before incremental ingestion have no "id" column and cannot
+    be deduplicated, so they are not migrated into the sign-in store.
+
+    Args:
+        csv_file (str): Path to the sign-in logs CSV
+
+    Returns:
+        bool: True if the file exists and has an "id" column
+    """
+    try:
+        with open(csv_file, mode="r", newline="", encoding="utf-8") as file:
+            header = next(csv.reader(file), [])
+        return "id" in header
+    except FileNotFoundError:
+        return False
+
+def _reduce_signin_rows(summary, rows):
+    """
+    Fold sign-in rows into a per-user summary in place.
+
+    Args:
+        summary (dict): User ID -> summary row with SIGNIN_SUMMARY_FIELDNAMES keys
+        rows (iterable): Sign-in log rows as produced by _signin_page_rows
+
+    Returns:
+        set: IDs of the users whose summary rows changed
+    """
+    changed = set()
+    for row in rows:
+        signin_time = row["signInDateTime"]
+        changed.add(row["userId"])
+        entry = summary.get(row["userId"])
+        if entry is None:
+            summary[row["userId"]] = {
+                "userId": row["userId"],
+                "userDisplayName": row["userDisplayName"],
+                "lastSignInDateTime": signin_time,
+                "firstSignInDateTime": signin_time,
+                "signInCount": 1
+            }
+            continue
+        # ISO 8601 UTC strings compare chronologically
+        if signin_time[:19] > entry["lastSignInDateTime"][:19]:
+            entry["lastSignInDateTime"] = signin_time
+            entry["userDisplayName"] = row["userDisplayName"]
+        if signin_time[:19] < entry["firstSignInDateTime"][:19]:
+            entry["firstSignInDateTime"] = signin_time
+        entry["signInCount"] += 1
+    return changed
+
+def _load_signin_summary(csv_file):
+    """
+    Load a per-user sign-in summary file.
+
+    Args:
+        csv_file (str): Path to the sign-in summary CSV
+
+    Returns:
+        dict: User ID -> summary row, or None if the file does not exist
+    """
+    try:
+        with open(csv_file, mode="r", newline="", encoding="utf-8") as file:
+            summary = {}
+            for row in csv.DictReader(file):
+                row["signInCount"] = int(row["signInCount"])
+                summary[row["userId"]] = row
+            return summary
+    except FileNotFoundError:
+        return None
+
+def _merge_signin_summary(csv_file, summary, retention_start):
+    """
+    Merge a newly reduced summary into the existing summary file.
+
+    Latest and first sign-ins take the max and min and counts are added, so
+    they accumulate from the last full fetch. Users whose latest sign-in has
+    left the retention window are dropped.
+
+    Args:
+        csv_file (str): Path to the sign-in summary CSV
+        summary (dict): Newly reduced User ID -> summary row
+        retention_start (datetime): Drop users whose latest sign-in is before this time
+
+    Returns:
+        tuple: (users kept from the existing file, users expired)
+    """
+    existing = _load_signin_summary(csv_file) or {}
+    cutoff = _format_graph_datetime(retention_start)[:19]
+    kept = expired = 0
+    for user_id, entry in existing.items():
+        new_entry = summary.get(user_id)
+        if new_entry is None:
+            if entry["lastSignInDateTime"][:19] < cutoff:
+                expired += 1
+                continue
+            summary[user_id] = entry
+        else:
+            if entry["lastSignInDateTime"][:19] > new_entry["lastSignInDateTime"][:19]:
+                new_entry["lastSignInDateTime"] = entry["lastSignInDateTime"]
+                new_entry["userDisplayName"] = entry["userDisplayName"]
+            if entry["firstSignInDateTime"][:19] < new_entry["firstSignInDateTime"][:19]:
+                new_entry["firstSignInDateTime"] = entry["firstSignInDateTime"]
+            new_entry["signInCount"] += entry["signInCount"]
+        kept += 1
+    _write_signin_summary(csv_file, summary)
+    return kept, expired
+
+def _write_signin_summary(csv_file, summary):
+    """
+    Write a per-user sign-in summary, replacing csv_file atomically.
+
+    Args:
+        csv_file (str): Path to the sign-in summary CSV
+        summary (dict): User ID -> summary row
+    """
+    tmp_file = f"{csv_file}.tmp"
+    with open(tmp_file, mode="w", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(file, fieldnames=SIGNIN_SUMMARY_FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(summary.values())
+    os.replace(tmp_file, csv_file)
+
+def _track_watermark(tracker, signin_id, signin_time):
+    """
+    Update the running watermark and overlap-window IDs with one sign-in.
+
+    Args:
+        tracker (dict): Running state with "watermark" and "boundaryIds"
+        signin_id (str): Sign-in ID
+        signin_time (str): Sign-in createdDateTime
+    """
+    if tracker["watermark"] is None or signin_time[:19] > tracker["watermark"][:19]:
+        tracker["watermark"] = signin_time
+        overlap_start = _format_graph_datetime(_parse_graph_datetime(signin_time) - SIGNIN_INGEST_OVERLAP)[:19]
+        tracker["overlapStart"] = overlap_start
+        tracker["boundaryIds"] = {
+            known_id: known_time for known_id, known_time in tracker["boundaryIds"].items()
+            if known_time[:19] >= overlap_start
+        }
+    if signin_id and signin_time[:19] >= tracker["overlapStart"]:
+        tracker["boundaryIds"][signin_id] = signin_time
+
+def _signin_record_row(signin):
+    """
+    Build a sign-in row from one decoded /auditLogs/signIns record.
+
+    Args:
+        signin (dict): Decoded Graph sign-in record
+
+    Returns:
+        dict: Sign-in row keyed by SIGNIN_FIELDNAMES (without collectionDate)
+    """
+    return {
+        "id": signin.get("id", ""),
+        "userId": signin.get("userId", "N/A"),
+        "userDisplayName": signin.get("userDisplayName", "N/A"),
+        "signInDateTime": signin.get("createdDateTime", "N/A"),
+    }
+
+def _signin_page_rows(signins, known_ids, tracker, collection_date, counter, lock=None):
+    """
+    Filter one decoded page of sign-ins into sign-in log rows.
+
+    Args:
+        signins (list): Sign-in rows decoded with _signin_record_row
+        known_ids (set): Sign-in IDs already stored, skipped
+        tracker (dict): Running watermark state updated with every row
+        collection_date (str): Collection timestamp stamped on every row
+        counter (dict): Running {"records": int} count of rows produced
+        lock (threading.Lock, optional): Guards tracker and counter when shards run concurrently
+
+    Yields:
+        dict: Sign-in log row
     """
-    Fetch sign-in logs from Microsoft Graph and save to signin_logs.csv.
+    for signin in signins:
+        signin_id = signin["id"]
+        signin_datetime = signin["signInDateTime"]
+        if signin_datetime == "N/A":
+            logger.warning(f"Skipping sign-in record with missing createdDateTime: {signin}")
+            continue
+        if signin_id in known_ids:
+            continue
+        if lock is not None:
+            with lock:
+                _track_watermark(tracker, signin_id, signin_datetime)
+                counter["records"] += 1
+        else:
+            _track_watermark(tracker, signin_id, signin_datetime)
+            counter["records"] += 1
+        signin["collectionDate"] = collection_date
+        yield signin
+
+def _signin_shard_windows(start_date, end_date, shard_hours):
+    """
+    Split a time window into consecutive shards.
+
+    Each shard is half-open (ge start, lt end) so no sign-in falls into two
+    shards or between them, whatever the precision of createdDateTime. The
+    newest shard keeps the closed upper bound of a serial fetch.
+
+    Args:
+        start_date (datetime): Window start (naive UTC)
+        end_date (datetime): Window end (naive UTC)
+        shard_hours (int): Shard length in hours
+
+    Returns:
+        list: (start string, end string, upper bound operator) filter bounds, oldest first
+    """
+    windows = []
+    shard_start = start_date
+    while shard_start < end_date:
+        shard_end = min(shard_start + timedelta(hours=shard_hours), end_date)
+        windows.append((_format_graph_datetime(shard_start), _format_graph_datetime(shard_end), "le" if shard_end == end_date else "lt"))
+        shard_start = shard_end
+    return windows
+
+def _fetch_signin_shard(headers, token_provider, shard, known_ids, tracker, collection_date, counter, lock, summary=None,
+                        stop=None):
+    """
+    Fetch the pagination chain of one sign-in shard into its own file.
+
+    Runs on a worker thread, so errors are raised rather than reported
+    through Streamlit. Once stop is set the shard gives up before its next
+    page.
+
+    Args:
+        headers (dict): Request headers
+        token_provider (TokenProvider): Supplies the bearer token for every request
+        shard (dict): Shard progress entry with "start", "end", "upper" and "file"; updated in place
+        known_ids (set): Sign-in IDs already stored, skipped
+        tracker (dict): Shared watermark state
+        collection_date (str): Collection timestamp stamped on every row
+        counter (dict): Shared {"records": int} count of rows produced
+        lock (threading.Lock): Guards tracker, counter, shard and summary
+        summary (dict, optional): Shared per-user summary to reduce rows into instead of writing them
+        stop (threading.Event, optional): Set when another shard failed
+
+    Returns:
+        int: Number of pages fetched
+    """
+    base_url = "https://graph.microsoft.com/v1.0"
+    url = f"{base_url}/auditLogs/signIns"
+    params = {
+        "$select": SIGNIN_SELECT_FIELDS,
+        "$filter": f"createdDateTime ge {shard['start']} and createdDateTime {shard['upper']} {shard['end']}",
+        "$top": 999
+    }
+    shard_counter = {"records": 0}
+    with lock:
+        shard["status"] = "loading"
+    with open(shard["file"], mode="w", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(file, fieldnames=SIGNIN_FIELDNAMES)
+        while url:
+            if stop is not None and stop.is_set():
+                with lock:
+                    shard["status"] = "cancelled"
+                logger.debug(f"Sign-in shard {shard['start']} - {shard['end']} stopped after {shard['pages']} pages")
+                return shard["pages"]
+            response = get_graph_client().get(url, headers=headers, params=params, token_provider=token_provider)
+            if response.status_code != 200:
+                raise RuntimeError(f"Error fetching sign-in shard {shard['start']} - {shard['end']}: {response.status_code} - {response.text}")
+            signins, next_link, _ = decode_page(response, _signin_record_row)
+            rows = _signin_page_rows(signins, known_ids, tracker, collection_date, shard_counter, lock)
+            if summary is not None:
+                rows = list(rows)
+                with lock:
+                    _reduce_signin_rows(summary, rows)
+            else:
+                writer.writerows(rows)
+            with lock:
+                shard["pages"] += 1
+                shard["records"] = shard_counter["records"]
+            url, params = next_link, None
+    with lock:
+        counter["records"] += shard_counter["records"]
+        shard["status"] = "done"
+    logger.debug(f"Sign-in shard {shard['start']} - {shard['end']}: {shard['records']} records in {shard['pages']} pages")
+    return shard["pages"]
+
+def _fetch_signin_shards(headers, token_provider, start_date, end_date, shard_hours, max_workers, output_file,
+                         known_ids, tracker, collection_date, counter, progress_callback=None, summary=None):
+    """
+    Fetch a sign-in window as concurrent time shards and append them to output_file.
+
+    When a summary is given the rows are reduced into it instead and
+    output_file is left untouched.
+
+    Args:
+        headers (dict): Request headers
+        token_provider (TokenProvider): Supplies the bearer token for every request
+        start_date (datetime): Window start (naive UTC)
+        end_date (datetime): Window end (naive UTC)
+        shard_hours (int): Shard length in hours
+        max_workers (int): Maximum number of shards fetched concurrently
+        output_file (str): CSV file, header already written, that the shards are appended to
+        known_ids (set): Sign-in IDs already stored, skipped
+        tracker (dict): Running watermark state
+        collection_date (str): Collection timestamp stamped on every row
+        counter (dict): Running {"records": int} count of rows produced
+        progress_callback (callable, optional): Called from this thread with the list of shard progress entries
+        summary (dict, optional): Per-user summary to reduce rows into
+
+    Returns:
+        int: Total number of pages fetched
+    """
+    lock = threading.Lock()
+    # Set on the first failure so running shards stop at their next page instead of finishing their chains
+    stop = threading.Event()
+    shards = [
+        {"start": start, "end": end, "upper": upper, "file": f"{output_file}.shard{index}", "pages": 0, "records": 0, "status": "queued"}
+        for index, (start, end, upper) in enumerate(_signin_shard_windows(start_date, end_date, shard_hours))
+    ]
+    logger.info(f"Fetching sign-in logs in {len(shards)} shards of {shard_hours}h with up to {max_workers} workers")
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(_fetch_signin_shard, headers, token_provider, shard, known_ids, tracker, collection_date, counter, lock,
+                                summary, stop)
+                for shard in shards
+            ]
+            pending = set(futures)
+            try:
+                while pending:
+                    done, pending = wait(pending, timeout=SHARD_PROGRESS_INTERVAL_SECONDS, return_when=FIRST_EXCEPTION)
+                    if progress_callback:
+                        with lock:
+                            snapshot = [{key: shard[key] for key in ("start", "end", "pages", "records", "status")} for shard in shards]
+                        progress_callback(snapshot)
+                    for future in done:
+                        if future.exception() is not None:
+                            raise future.exception()
+            except BaseException:
+                # Queued shards never start; running ones return before their next page
+                stop.set()
+                for future in pending:
+                    future.cancel()
+                raise
+
+        if summary is not None:
+            return sum(shard["pages"] for shard in shards)
+        # Newest shard first, matching the order of a serial fetch
+        with open(output_file, mode="a", newline="", encoding="utf-8") as output:
+            for shard in reversed(shards):
+                with open(shard["file"], mode="r", newline="", encoding="utf-8") as shard_file:
+                    shutil.copyfileobj(shard_file, output)
+        return sum(shard["pages"] for shard in shards)
+    finally:
+        for shard in shards:
+            if os.path.exists(shard["file"]):
+                os.remove(shard["file"])
+
+def fetch_signin_logs(tenant_id, client_id, client_secret, incremental=False, retention_days=SIGNIN_RETENTION_DAYS,
+                      buffer_size=SIGNIN_WRITE_BUFFER_BYTES, progress_callback=None, shard_hours=None,
+                      max_workers=DEFAULT_MAX_WORKERS, shard_progress_callback=None, aggregate=False):
+    """
+    Fetch sign-in logs from Microsoft Graph and save them to the sign-in store.
+
+    Each Graph page is parsed and written to disk as it arrives, so memory use
+    is bounded by one page plus the write buffer rather than the whole window.
+    After every page a checkpoint records the next page link, so a run that
+    dies partway is resumed from the last completed page on the next call.
+    Aggregate runs append the summary rows each page changed to the
+    checkpoint instead of rewriting the whole summary.
+
+    In incremental mode only sign-ins newer than the stored watermark are
+    requested (minus a small overlap for late-arriving records). They are
+    deduplicated on sign-in ID, appended to the store, and date partitions
+    outside the retention window are expired. Without usable state a full
+    fetch of the retention window replaces the store.
+
+    With shard_hours the window is split into sub-windows whose pagination
+    chains are fetched concurrently and then merged newest first, the same
+    order a serial fetch produces. Sharded runs are not checkpointed.
+
+    With aggregate each page is reduced as it arrives into a per-user summary
+    of latest sign-in, first sign-in and sign-in count, and only that summary
+    is written to signin_summary.csv, so memory and disk grow with the number
+    of users rather than the number of sign-ins. Incremental aggregate runs
+    keep their own watermark; first sign-ins and counts then accumulate from
+    the last full fetch.
     
     Args:
         tenant_id (str): Azure tenant ID
         client_id (str): Azure client ID
         client_secret (str): Azure client secret
+        incremental (bool): Fetch only sign-ins newer than the stored watermark
+        retention_days (int): Number of days of sign-ins to keep locally
+        buffer_size (int): Output file write buffer size in bytes
+        progress_callback (callable, optional): Called as progress_callback(pages, records) after each page is written
+        shard_hours (int, optional): Split the window into shards of this many hours and fetch them concurrently
+        max_workers (int): Maximum number of shards fetched concurrently
+        shard_progress_callback (callable, optional): Called from the calling thread as
+            shard_progress_callback(progress) with a list of per-shard progress dictionaries
+        aggregate (bool): Store a per-user summary in signin_summary.csv instead of every sign-in
     
     Returns:
         bool: True if successful, False otherwise
@@ -27,180 +533,932 @@ def fetch_signin_logs(tenant_id, client_id, client_secret):
         st.error("Failed to obtain access token for sign-in logs.")
         return False
 
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    headers = {"Content-Type": "application/json"}
+    token_provider = get_token_provider(tenant_id, client_id, client_secret)
     base_url = "https://graph.microsoft.com/v1.0"
-    
-    # Calculate date range for the last 30 days
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=30)
-    start_date_str = start_date.strftime("%Y-%m-%dT%H:%M:%SZ")
-    end_date_str = end_date.strftime("%Y-%m-%dT%H:%M:%SZ")
-    logger.debug(f"Fetching sign-in logs from {start_date_str} to {end_date_str}")
-
-    # Use a fixed filename
-    csv_file = "signin_logs.csv"
-    logger.info(f"Writing to sign-in logs file: {csv_file}")
-
-    # Fetch sign-in logs
-    new_logs = []
-    try:
-        filter_query = f"createdDateTime ge {start_date_str} and createdDateTime le {end_date_str}"
+    csv_file = SIGNIN_SUMMARY_FILE if aggregate else SIGNIN_LOGS_FILE
+    state_file = SIGNIN_SUMMARY_STATE_FILE if aggregate else SIGNIN_STATE_FILE
+    # New rows are streamed to a side file and only reach the store once the run completes
+    new_rows_file = f"{csv_file}.new"
+    store = SignInStore()
+    checkpoint = FetchCheckpoint("signin_summary" if aggregate else "signin_logs", SIGNIN_SELECT_FIELDS)
+    resume = checkpoint.load()
+    if resume and not aggregate and not (os.path.exists(new_rows_file) and os.path.getsize(new_rows_file) >= resume["outputBytes"]):
+        logger.warning("Sign-in checkpoint has no matching partial output, starting over")
+        checkpoint.clear()
+        resume = None
+
+    if resume:
+        # Restore the window and watermark tracking of the interrupted run
+        incremental = resume["incremental"]
+        retention_start = _parse_graph_datetime(resume["retentionStart"])
+        tracker = resume["tracker"]
+        # The watermark state is only rewritten when a run completes, so it still holds the IDs skipped at the start
+        state = _load_signin_state(state_file) if incremental else None
+        known_ids = set(state.get("boundaryIds", {})) if state else set()
+        collection_date = resume["collectionDate"]
+        page_count = resume["pages"]
+        counter = {"records": resume["records"]}
+        if aggregate:
+            # Later rows are newer versions of a user's summary row
+            summary = {row["userId"]: row for row in checkpoint.load_rows(resume)}
+        else:
+            summary = None
+            with open(new_rows_file, mode="r+b") as file:
+                file.truncate(resume["outputBytes"])
+        logger.info(f"Resuming sign-in fetch from page {page_count + 1} ({counter['records']} records already written)")
+        st.info(f"Resuming interrupted sign-in fetch from page {page_count + 1}.")
+        url, params = resume["nextLink"], None
+    else:
+        # Drop rows a run left behind before its first checkpoint
+        checkpoint.clear()
+        # Calculate date range for the retention window
+        end_date = datetime.utcnow()
+        retention_start = end_date - timedelta(days=retention_days)
+        start_date = retention_start
+        tracker = {"watermark": None, "overlapStart": "", "boundaryIds": {}}
+        if incremental:
+            state = _load_signin_state(state_file)
+            if not aggregate and not store.exists() and _signin_file_has_ids(csv_file):
+                # Carry a signin_logs.csv written before the sign-in store over, so its watermark stays usable
+                logger.info(f"Migrating {csv_file} into the sign-in store")
+                store.replace_from_csv(csv_file, "migrated")
+            store_usable = os.path.exists(csv_file) if aggregate else store.exists()
+            if state and store_usable and _parse_graph_datetime(state["watermark"]) >= retention_start:
+                start_date = _parse_graph_datetime(state["watermark"]) - SIGNIN_INGEST_OVERLAP
+                tracker["boundaryIds"] = state.get("boundaryIds", {})
+                _track_watermark(tracker, None, state["watermark"])
+                logger.info(f"Incremental sign-in fetch from watermark {state['watermark']}")
+            else:
+                logger.info("No usable sign-in watermark, performing a full sign-in fetch")
+                incremental = False
+        # IDs already stored from the previous overlap window; Graph does not repeat records within one query
+        known_ids = set(tracker["boundaryIds"])
+        collection_date = datetime.utcnow().isoformat() + "Z"
+        page_count = 0
+        counter = {"records": 0}
+        summary = {} if aggregate else None
+        start_date_str = _format_graph_datetime(start_date)
+        end_date_str = _format_graph_datetime(end_date)
+        logger.debug(f"Fetching sign-in logs from {start_date_str} to {end_date_str}")
+        url = f"{base_url}/auditLogs/signIns"
         params = {
-            "$select": "id,userId,userDisplayName,createdDateTime",
-            "$filter": filter_query,
+            "$select": SIGNIN_SELECT_FIELDS,
+            "$filter": f"createdDateTime ge {start_date_str} and createdDateTime le {end_date_str}",
             "$top": 999
         }
-        logger.debug(f"Sending request to {base_url}/auditLogs/signIns with params: {params}")
-        response = requests.get(f"{base_url}/auditLogs/signIns", headers=headers, params=params)
-        if response.status_code != 200:
-            logger.error(f"Error fetching sign-in logs: {response.status_code} - {response.text}")
-            st.error(f"Error fetching sign-in logs: {response.status_code} - {response.text}")
-            return False
-        data = response.json()
-        signins = data.get("value", [])
-        collection_date = datetime.utcnow().isoformat() + "Z"
-        logger.debug(f"Fetched {len(signins)} sign-in records in first page")
-
-        for signin in signins:
-            user_id = signin.get("userId", "N/A")
-            display_name = signin.get("userDisplayName", "N/A")
-            signin_datetime = signin.get("createdDateTime", "N/A")
-            if signin_datetime == "N/A":
-                logger.warning(f"Skipping sign-in record with missing createdDateTime: {signin}")
-                continue
-            new_logs.append({
-                "userId": user_id,
-                "userDisplayName": display_name,
-                "signInDateTime": signin_datetime,
-                "collectionDate": collection_date
-            })
-
-        # Handle pagination
-        next_link = data.get("@odata.nextLink")
-        page_count = 1
-        while next_link:
-            page_count += 1
-            logger.debug(f"Fetching page {page_count} of sign-in logs: {next_link}")
-            response = requests.get(next_link, headers=headers)
-            if response.status_code != 200:
-                logger.error(f"Error fetching paginated sign-in logs: {response.status_code} - {response.text}")
-                st.error(f"Error fetching paginated sign-in logs: {response.status_code} - {response.text}")
-                break
-            data = response.json()
-            signins = data.get("value", [])
-            for signin in signins:
-                user_id = signin.get("userId", "N/A")
-                display_name = signin.get("userDisplayName", "N/A")
-                signin_datetime = signin.get("createdDateTime", "N/A")
-                if signin_datetime == "N/A":
-                    logger.warning(f"Skipping sign-in record with missing createdDateTime: {signin}")
-                    continue
-                new_logs.append({
-                    "userId": user_id,
-                    "userDisplayName": display_name,
-                    "signInDateTime": signin_datetime,
-                    "collectionDate": collection_date
-                })
-            next_link = data.get("@odata.nextLink")
-
-        # Write new logs to signin_logs.csv
-        if new_logs:
-            with open(csv_file, mode="w", newline="", encoding="utf-8") as file:
-                writer = csv.DictWriter(file, fieldnames=["userId", "userDisplayName", "signInDateTime", "collectionDate"])
-                writer.writeheader()
-                for log in new_logs:
-                    writer.writerow(log)
-            logger.info(f"Wrote {len(new_logs)} sign-in logs to {csv_file}")
-            st.success(f"Wrote {len(new_logs)} sign-in logs to {csv_file}.")
+
+    logger.info("Reducing sign-in logs into a per-user summary" if aggregate else f"Streaming sign-in logs to {new_rows_file}")
+    try:
+        with ExitStack() as stack:
+            if aggregate:
+                file = None
+
+                def emit_rows(rows):
+                    # Checkpoint only the summary rows this page changed
+                    changed = _reduce_signin_rows(summary, rows)
+                    checkpoint.append_rows([summary[user_id] for user_id in changed])
+            else:
+                file = stack.enter_context(
+                    open(new_rows_file, mode="a" if resume else "w", newline="", encoding="utf-8", buffering=buffer_size)
+                )
+                writer = csv.DictWriter(file, fieldnames=SIGNIN_FIELDNAMES)
+                if not resume:
+                    writer.writeheader()
+                    file.flush()
+                emit_rows = writer.writerows
+            if shard_hours and not resume:
+                # Sharded runs write one file per shard and are not checkpointed
+                url = None
+                page_count = _fetch_signin_shards(
+                    headers, token_provider, start_date, end_date, shard_hours, max_workers,
+                    new_rows_file, known_ids, tracker, collection_date, counter, shard_progress_callback, summary
+                )
+            while url:
+                logger.debug(f"Fetching page {page_count + 1} of sign-in logs: {url} with params: {params}")
+                response = get_graph_client().get(url, headers=headers, params=params, token_provider=token_provider)
+                if response.status_code != 200:
+                    logger.error(f"Error fetching sign-in logs: {response.status_code} - {response.text}")
+                    st.error(f"Error fetching sign-in logs: {response.status_code} - {response.text}")
+                    if response.status_code not in RETRY_STATUS_CODES:
+                        # Not transient (e.g. an expired page link), so resuming would fail the same way
+                        checkpoint.clear()
+                    # Committing a partial run would leave gaps; keep the checkpoint to resume instead
+                    raise _FetchAborted()
+                page_count += 1
+                signins, next_link, _ = decode_page(response, _signin_record_row)
+                logger.debug(f"Fetched {len(signins)} sign-in records in page {page_count}")
+                emit_rows(_signin_page_rows(signins, known_ids, tracker, collection_date, counter))
+                if file:
+                    file.flush()
+                if progress_callback:
+                    progress_callback(page_count, counter["records"])
+
+                # Handle pagination
+                url, params = next_link, None
+                if url:
+                    output_state = {} if aggregate else {"outputBytes": os.path.getsize(new_rows_file)}
+                    checkpoint.save(
+                        url, page_count,
+                        **output_state,
+                        records=counter["records"],
+                        incremental=incremental,
+                        retentionStart=_format_graph_datetime(retention_start),
+                        tracker=tracker,
+                        collectionDate=collection_date
+                    )
+
+        # Move new logs into the sign-in store, or the reduced summary into signin_summary.csv
+        run_id = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        record_count = counter["records"]
+        if aggregate and incremental:
+            kept, expired = _merge_signin_summary(csv_file, summary, retention_start)
+            logger.info(f"Merged {record_count} new sign-ins into {csv_file} ({len(summary)} users, {expired} expired)")
+            st.success(f"Merged {record_count} new sign-ins into {csv_file}.")
+        elif aggregate:
+            _write_signin_summary(csv_file, summary)
+            logger.info(f"Summarized {record_count} sign-ins for {len(summary)} users to {csv_file} in {page_count} pages")
+            st.success(f"Summarized {record_count} sign-ins for {len(summary)} users to {csv_file}.")
+        elif incremental:
+            store.append_csv(new_rows_file, run_id)
+            expired = store.expire(retention_start)
+            os.remove(new_rows_file)
+            logger.info(f"Appended {record_count} new sign-in logs to {store.root} ({expired} partitions expired)")
+            st.success(f"Appended {record_count} new sign-in logs to {store.root}.")
+        elif record_count:
+            store.replace_from_csv(new_rows_file, run_id)
+            os.remove(new_rows_file)
+            logger.info(f"Wrote {record_count} sign-in logs to {store.root} in {page_count} pages")
+            st.success(f"Wrote {record_count} sign-in logs to {store.root}.")
         else:
+            os.remove(new_rows_file)
             logger.info("No sign-in logs to write")
             st.info("No sign-in logs to write.")
+
+        if tracker["watermark"]:
+            _save_signin_state(state_file, tracker["watermark"], tracker["boundaryIds"])
+        checkpoint.clear()
         return True
 
+    except _FetchAborted:
+        return False
     except Exception as e:
         logger.error(f"Exception when fetching sign-in logs: {str(e)}")
         st.error(f"Exception when fetching sign-in logs: {str(e)}")
         return False
+    finally:
+        # Partial output is kept only while a checkpoint can resume it
+        if os.path.exists(new_rows_file) and not checkpoint.exists():
+            os.remove(new_rows_file)
+
+def _parse_user(user, include_signin_activity=False):
+    """
+    Convert a raw Graph user object into a users_data row.
+
+    Args:
+        user (dict): User object from the Graph /users response
+        include_signin_activity (bool): Add the signInActivity last sign-in columns
+
+    Returns:
+        dict: User data dictionary
+    """
+    groups = []
+    if "memberOf" in user:
+        groups = [group["displayName"] for group in user["memberOf"] if group.get("displayName") is not None]
+    user_row = {
+        "User ID": user.get("id", "N/A"),
+        "User Principal Name": user.get("userPrincipalName", "N/A"),
+        "Display Name": user.get("displayName", "N/A"),
+        "Job Title": user.get("jobTitle", "N/A"),
+        "Department": user.get("department", "N/A"),
+        "Account Enabled": str(user.get("accountEnabled", "N/A")).lower(),
+        "User Type": user.get("userType", "N/A"),
+        "Groups": ", ".join(groups) if groups else "No groups",
+    }
+    if include_signin_activity:
+        activity = user.get("signInActivity") or {}
+        user_row["Last Sign-In"] = activity.get("lastSignInDateTime") or "N/A"
+        user_row["Last Non-Interactive Sign-In"] = activity.get("lastNonInteractiveSignInDateTime") or "N/A"
+    return user_row
+
+def _user_partition_filters(partitions):
+    """
+    Split the userPrincipalName key space into contiguous range filters.
+
+    Bounds are spread over the letters only; the first range is open-ended
+    below, so it also takes every UPN starting with a digit, and the last is
+    open-ended above, so every user falls into at least one segment.
+    Boundaries are inclusive on both sides, so a user whose UPN is exactly a
+    boundary value can appear twice; callers dedupe on user ID.
+
+    Args:
+        partitions (int): Number of segments to produce
+
+    Returns:
+        list: OData $filter strings, one per segment
+    """
+    partitions = max(1, min(partitions, len(USER_PARTITION_ALPHABET)))
+    if partitions == 1:
+        return [None]
+    step = len(USER_PARTITION_ALPHABET) / partitions
+    bounds = [USER_PARTITION_ALPHABET[round(i * step)] for i in range(1, partitions)]
+    filters = [f"userPrincipalName le '{bounds[0]}'"]
+    for lower, upper in zip(bounds, bounds[1:]):
+        filters.append(f"userPrincipalName ge '{lower}' and userPrincipalName le '{upper}'")
+    filters.append(f"userPrincipalName ge '{bounds[-1]}'")
+    return filters
+
+def _fetch_user_segment(headers, token_provider, params, label, include_signin_activity=False, keep_checkpoint=False):
+    """
+    Walk the @odata.nextLink chain for one segment of the /users collection.
+
+    Every completed page is checkpointed, so an interrupted segment resumes
+    from its last completed page on the next call. Runs on a worker thread in
+    partitioned mode, so errors are raised rather than reported through
+    Streamlit.
+
+    Args:
+        headers (dict): Request headers
+        token_provider (TokenProvider): Supplies the bearer token for every request
+        params (dict): Query parameters for the first page
+        label (str): Segment label used in log messages and the checkpoint name
+        include_signin_activity (bool): Parse the signInActivity last sign-in columns
+        keep_checkpoint (bool): Keep the finished segment's checkpoint so an interrupted
+            partitioned run does not refetch it on resume; the caller clears it afterwards
+
+    Returns:
+        list: User data dictionaries for this segment
+    """
+    base_url = "https://graph.microsoft.com/v1.0"
+    checkpoint = FetchCheckpoint(f"users_{label}", json.dumps(params, sort_keys=True))
+    resume = checkpoint.load()
+    if resume and resume.get("complete"):
+        segment_users = checkpoint.load_rows(resume)
+        logger.info(f"Users segment {label} already completed by an earlier run ({len(segment_users)} users)")
+        return segment_users
+    if resume:
+        segment_users = checkpoint.load_rows(resume)
+        page_count = resume["pages"]
+        url, page_params = resume["nextLink"], None
+        logger.info(f"Resuming users segment {label} from page {page_count + 1} ({len(segment_users)} users already fetched)")
+    else:
+        segment_users = []
+        page_count = 0
+        url, page_params = f"{base_url}/users", params
+    while url:
+        logger.debug(f"Fetching page {page_count + 1} of users for segment {label}: {url} with params: {page_params}")
+        response = get_graph_client().get(url, headers=headers, params=page_params, token_provider=token_provider)
+        if response.status_code != 200:
+            if response.status_code not in RETRY_STATUS_CODES:
+                # Not transient (e.g. an expired page link), so resuming would fail the same way
+                checkpoint.clear()
+            raise RuntimeError(f"Error fetching users for segment {label} (page {page_count + 1}): {response.status_code} - {response.text}")
+        page_count += 1
+        users, next_link, _ = decode_page(response)
+        page_users = [_parse_user(user, include_signin_activity) for user in users]
+        segment_users.extend(page_users)
+        url, page_params = next_link, None
+        if url or keep_checkpoint:
+            checkpoint.append_rows(page_users)
+            checkpoint.save(url, page_count)
+    if not keep_checkpoint:
+        checkpoint.clear()
+    logger.debug(f"Segment {label} returned {len(segment_users)} users in {page_count} pages")
+    return segment_users
 
-def fetch_users(tenant_id, client_id, client_secret):
+def _fetch_users_partitioned(headers, token_provider, params, partitions, max_workers, include_signin_activity=False):
+    """
+    Fetch the /users collection as independent UPN range segments in parallel.
+
+    If any segment fails, the checkpoints of all segments are kept and the
+    first error is raised, so a retry reuses finished segments and resumes
+    interrupted ones. The checkpoints are cleared once every segment finishes.
+
+    Args:
+        headers (dict): Request headers
+        token_provider (TokenProvider): Supplies the bearer token for every request
+        params (dict): Base query parameters shared by every segment
+        partitions (int): Number of segments to split the collection into
+        max_workers (int): Maximum number of segments fetched concurrently
+        include_signin_activity (bool): Parse the signInActivity last sign-in columns
+
+    Returns:
+        list: Merged, deduplicated user data dictionaries in segment order
+    """
+    filters = _user_partition_filters(partitions)
+    # Range filters on userPrincipalName are advanced queries in Graph
+    segment_headers = dict(headers, ConsistencyLevel="eventual")
+    results = [None] * len(filters)
+    checkpoints = []
+    failed = {}
+    logger.info(f"Fetching users in {len(filters)} segments with up to {max_workers} workers")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for index, segment_filter in enumerate(filters):
+            segment_params = dict(params, **{"$filter": segment_filter, "$count": "true"})
+            label = f"segment_{index + 1}_of_{len(filters)}"
+            checkpoints.append(FetchCheckpoint(f"users_{label}", json.dumps(segment_params, sort_keys=True)))
+            futures[executor.submit(_fetch_user_segment, segment_headers, token_provider, segment_params, label, include_signin_activity, True)] = index
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            if future.exception() is not None:
+                failed[futures[future]] = future.exception()
+                # Give up on segments that have not started yet
+                for other in futures:
+                    other.cancel()
+                continue
+            results[futures[future]] = future.result()
+    if failed:
+        # Every segment keeps its checkpoint, finished or not, so the next run resumes the whole
+        # partitioned fetch; segments that never started have none and are fetched from scratch
+        raise failed[min(failed)]
+    # Every segment finished, so the per-segment checkpoints are no longer needed
+    for checkpoint in checkpoints:
+        checkpoint.clear()
+
+    users_data = []
+    seen_ids = set()
+    for segment_users in results:
+        for user in segment_users:
+            if user["User ID"] in seen_ids:
+                continue
+            seen_ids.add(user["User ID"])
+            users_data.append(user)
+    return users_data
+
+def fetch_users(tenant_id, client_id, client_secret, partitions=1, max_workers=DEFAULT_MAX_WORKERS,
+                include_signin_activity=False, expand_groups=True):
     """
     Fetch users from Microsoft Graph.
+
+    With include_signin_activity the last interactive and non-interactive
+    sign-in times are requested alongside each user (requires Entra ID P1 and
+    AuditLog.Read.All), which lets inactivity analysis skip the sign-in log
+    download entirely.
     
     Args:
         tenant_id (str): Azure tenant ID
         client_id (str): Azure client ID
         client_secret (str): Azure client secret
+        partitions (int): Number of userPrincipalName ranges to fetch concurrently (1 = serial)
+        max_workers (int): Maximum number of concurrent Graph requests in partitioned mode
+        include_signin_activity (bool): Also request signInActivity for each user
+        expand_groups (bool): Expand memberOf on each user; disable when memberships come from fetch_group_memberships
     
     Returns:
-        list: List of user data dictionaries
+        list: List of user data dictionaries, or None if failed
     """
-    users_data = []
     token = get_access_token(tenant_id, client_id, client_secret)
     if not token:
         logger.error("Failed to obtain access token for user fetching")
         st.error("Failed to obtain access token.")
-        return []
+        return None
 
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    base_url = "https://graph.microsoft.com/v1.0"
+    headers = {"Content-Type": "application/json"}
+    token_provider = get_token_provider(tenant_id, client_id, client_secret)
     try:
-        params = {
-            "$select": "id,userPrincipalName,displayName,jobTitle,department,accountEnabled,userType",
-            "$expand": "memberOf($select=displayName)"
-        }
-        logger.debug(f"Sending request to {base_url}/users with params: {params}")
-        response = requests.get(f"{base_url}/users", headers=headers, params=params)
-        if response.status_code != 200:
-            logger.error(f"Error fetching users: {response.status_code} - {response.text}")
-            st.error(f"Error fetching users: {response.status_code} - {response.text}")
-            return []
-        data = response.json()
-        users = data.get("value", [])
-        for user in users:
-            groups = []
-            if "memberOf" in user:
-                groups = [group["displayName"] for group in user["memberOf"] if group.get("displayName") is not None]
-            users_data.append({
-                "User ID": user.get("id", "N/A"),
-                "User Principal Name": user.get("userPrincipalName", "N/A"),
-                "Display Name": user.get("displayName", "N/A"),
-                "Job Title": user.get("jobTitle", "N/A"),
-                "Department": user.get("department", "N/A"),
-                "Account Enabled": str(user.get("accountEnabled", "N/A")).lower(),
-                "User Type": user.get("userType", "N/A"),
-                "Groups": ", ".join(groups) if groups else "No groups",
-            })
-        next_link = data.get("@odata.nextLink")
-        page_count = 1
-        while next_link:
-            page_count += 1
-            logger.debug(f"Fetching page {page_count} of users: {next_link}")
-            response = requests.get(next_link, headers=headers)
-            if response.status_code != 200:
-                logger.error(f"Error fetching paginated users: {response.status_code} - {response.text}")
-                st.error(f"Error fetching paginated users: {response.status_code} - {response.text}")
-                break
-            data = response.json()
-            users = data.get("value", [])
-            for user in users:
-                groups = []
-                if "memberOf" in user:
-                    groups = [group["displayName"] for group in user["memberOf"] if group.get("displayName") is not None]
-                users_data.append({
-                    "User ID": user.get("id", "N/A"),
-                    "User Principal Name": user.get("userPrincipalName", "N/A"),
-                    "Display Name": user.get("displayName", "N/A"),
-                    "Job Title": user.get("jobTitle", "N/A"),
-                    "Department": user.get("department", "N/A"),
-                    "Account Enabled": str(user.get("accountEnabled", "N/A")).lower(),
-                    "User Type": user.get("userType", "N/A"),
-                    "Groups": ", ".join(groups) if groups else "No groups",
-                })
-            next_link = data.get("@odata.nextLink")
+        params = {"$select": USER_SELECT_FIELDS + (",signInActivity" if include_signin_activity else "")}
+        if expand_groups:
+            params["$expand"] = "memberOf($select=displayName)"
+        if partitions > 1:
+            users_data = _fetch_users_partitioned(headers, token_provider, params, partitions, max_workers, include_signin_activity)
+        else:
+            users_data = _fetch_user_segment(headers, token_provider, params, "all", include_signin_activity)
         logger.info(f"Fetched {len(users_data)} users successfully")
         st.success(f"Fetched {len(users_data)} users successfully.")
         return users_data
     except Exception as e:
         logger.error(f"Exception when fetching users: {str(e)}")
         st.error(f"Exception when fetching users: {str(e)}")
-        return []
\ No newline at end of file
+        return None
+
+def _load_delta_link(state_file, snapshot_version):
+    """
+    Load the persisted users deltaLink of a user snapshot.
+
+    A deltaLink only replays the changes made after the snapshot it was
+    stored with, so it is not returned for any other snapshot version.
+
+    Args:
+        state_file (str): Path to the delta state file
+        snapshot_version (int): Version of the snapshot the changes will be applied to
+
+    Returns:
+        str: deltaLink, or None if no usable state exists for snapshot_version
+    """
+    try:
+        with open(state_file, mode="r", encoding="utf-8") as file:
+            state = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (ValueError, OSError) as e:
+        logger.warning(f"Ignoring unreadable delta state file {state_file}: {str(e)}")
+        return None
+    if snapshot_version is None or state.get("snapshotVersion") != snapshot_version:
+        logger.info(f"Stored users deltaLink belongs to snapshot v{state.get('snapshotVersion')}, not v{snapshot_version}")
+        return None
+    return state.get("deltaLink")
+
+def save_users_delta_link(delta_link, snapshot_version, state_file=USERS_DELTA_STATE_FILE):
+    """
+    Persist the users deltaLink for the next sync of a published snapshot.
+
+    Args:
+        delta_link (str): deltaLink returned by sync_users
+        snapshot_version (int): Version the synced users were published as
+        state_file (str): Path to the delta state file
+    """
+    tmp_file = f"{state_file}.tmp"
+    with open(tmp_file, mode="w", encoding="utf-8") as file:
+        json.dump({
+            "deltaLink": delta_link,
+            "snapshotVersion": snapshot_version,
+            "savedAt": datetime.utcnow().isoformat() + "Z",
+        }, file)
+    os.replace(tmp_file, state_file)
+    logger.debug(f"Saved users deltaLink for snapshot v{snapshot_version} to {state_file}")
+
+def carry_users_delta_link(from_version, to_version, state_file=USERS_DELTA_STATE_FILE):
+    """
+    Store the deltaLink of a snapshot for a snapshot derived from it.
+
+    Only valid when every change in the derived snapshot was read from Graph
+    after the deltaLink was issued, e.g. users re-fetched by ID, since the
+    next sync replays changes from the deltaLink on top of them.
+
+    Args:
+        from_version (int): Version the deltaLink belongs to
+        to_version (int): Version of the derived snapshot
+        state_file (str): Path to the delta state file
+    """
+    delta_link = _load_delta_link(state_file, from_version)
+    if delta_link:
+        save_users_delta_link(delta_link, to_version, state_file)
+
+def _apply_user_changes(users_data, changes):
+    """
+    Apply /users/delta change records to an existing user set.
+
+    Delta responses carry only the properties that changed and never include
+    group memberships or sign-in activity, so updated users keep their existing
+    "Groups" and newly added users start with "No groups" until the next full
+    fetch. sync_users refreshes the last sign-in columns separately.
+
+    Args:
+        users_data (list): Existing user data dictionaries
+        changes (list): Raw user objects from /users/delta
+
+    Returns:
+        tuple: (updated user list, added count, updated count, removed count)
+    """
+    users_by_id = {user["User ID"]: user for user in users_data}
+    added = updated = removed = 0
+    for change in changes:
+        user_id = change.get("id")
+        if not user_id:
+            continue
+        if "@removed" in change:
+            if users_by_id.pop(user_id, None) is not None:
+                removed += 1
+            continue
+        parsed = _parse_user(change)
+        existing = users_by_id.get(user_id)
+        if existing is None:
+            users_by_id[user_id] = parsed
+            added += 1
+        else:
+            existing = dict(existing)
+            for field, column in USER_FIELD_COLUMNS.items():
+                if field in change:
+                    existing[column] = parsed[column]
+            users_by_id[user_id] = existing
+            updated += 1
+    return list(users_by_id.values()), added, updated, removed
+
+def _fetch_signin_activity(headers, token_provider):
+    """
+    Fetch the signInActivity of every user in a separate paged pass.
+
+    /users/delta cannot return signInActivity, so incremental syncs refresh
+    the last sign-in columns with this pass instead.
+
+    Args:
+        headers (dict): Request headers
+        token_provider (TokenProvider): Supplies the bearer token for every request
+
+    Returns:
+        dict: User ID -> {"Last Sign-In": str, "Last Non-Interactive Sign-In": str}
+    """
+    activity = {}
+    url = "https://graph.microsoft.com/v1.0/users"
+    params = {"$select": "id,signInActivity"}
+    page_count = 0
+    while url:
+        page_count += 1
+        logger.debug(f"Fetching page {page_count} of user sign-in activity: {url}")
+        response = get_graph_client().get(url, headers=headers, params=params, token_provider=token_provider)
+        if response.status_code != 200:
+            raise RuntimeError(f"Error fetching user sign-in activity: {response.status_code} - {response.text}")
+        users, url, _ = decode_page(response)
+        for user in users:
+            user_row = _parse_user(user, include_signin_activity=True)
+            activity[user_row["User ID"]] = {column: user_row[column] for column in SIGNIN_ACTIVITY_COLUMNS}
+        params = None
+    logger.debug(f"Fetched sign-in activity for {len(activity)} users in {page_count} pages")
+    return activity
+
+def _apply_signin_activity(users_data, activity):
+    """
+    Replace the last sign-in columns of a user set.
+
+    Args:
+        users_data (list): User data dictionaries
+        activity (dict): User ID -> last sign-in columns from _fetch_signin_activity, or None
+            to drop the columns so values older than the user sync are not used
+
+    Returns:
+        list: User data dictionaries with fresh last sign-in columns, or none at all
+    """
+    if activity is None:
+        return [
+            {column: value for column, value in user.items() if column not in SIGNIN_ACTIVITY_COLUMNS}
+            for user in users_data
+        ]
+    no_activity = dict.fromkeys(SIGNIN_ACTIVITY_COLUMNS, "N/A")
+    return [{**user, **activity.get(user["User ID"], no_activity)} for user in users_data]
+
+def sync_users(tenant_id, client_id, client_secret, users_data, state_file=USERS_DELTA_STATE_FILE,
+               partitions=1, max_workers=DEFAULT_MAX_WORKERS, include_signin_activity=False, expand_groups=True):
+    """
+    Incrementally sync users with Microsoft Graph using /users/delta.
+
+    Without an existing user set or a deltaLink stored for its snapshot
+    version this performs a full fetch_users, capturing a fresh deltaLink
+    first so changes made while the full fetch runs are replayed on the next
+    sync. Failures return None rather than the existing users, so callers
+    never mistake them for a sync.
+
+    The new deltaLink is returned rather than stored: the caller stores it
+    with save_users_delta_link once the users are published, so it is only
+    ever applied to the snapshot it was synced onto.
+
+    Delta responses never carry signInActivity, so with include_signin_activity
+    an incremental sync refreshes the last sign-in columns with a separate
+    paged pass; without it, those columns are dropped rather than left at the
+    values of the last full fetch.
+    
+    Args:
+        tenant_id (str): Azure tenant ID
+        client_id (str): Azure client ID
+        client_secret (str): Azure client secret
+        users_data (UserTable): Published snapshot to apply changes to
+        state_file (str): Path to the file holding the persisted deltaLink
+        partitions (int): Partitions for the full fetch fallback
+        max_workers (int): Maximum parallel requests for the full fetch fallback
+        include_signin_activity (bool): Request signInActivity with the users
+        expand_groups (bool): Expand memberOf in the full fetch fallback
+    
+    Returns:
+        tuple: (updated list of user data dictionaries, deltaLink to store with them or None),
+            or (None, None) if failed
+    """
+    token = get_access_token(tenant_id, client_id, client_secret)
+    if not token:
+        logger.error("Failed to obtain access token for user sync")
+        st.error("Failed to obtain access token.")
+        return None, None
+
+    headers = {"Content-Type": "application/json"}
+    token_provider = get_token_provider(tenant_id, client_id, client_secret)
+    base_url = "https://graph.microsoft.com/v1.0"
+    delta_link = _load_delta_link(state_file, getattr(users_data, "version", None)) if users_data else None
+    try:
+        if delta_link:
+            changes = []
+            next_link = delta_link
+            page_count = 0
+            new_delta_link = None
+            while next_link:
+                page_count += 1
+                logger.debug(f"Fetching page {page_count} of user changes: {next_link}")
+                response = get_graph_client().get(next_link, headers=headers, token_provider=token_provider)
+                if response.status_code == 410:
+                    logger.warning("Users deltaLink expired, falling back to a full fetch")
+                    st.warning("Stored sync state has expired. Performing a full user fetch.")
+                    delta_link = None
+                    break
+                if response.status_code != 200:
+                    logger.error(f"Error fetching user changes: {response.status_code} - {response.text}")
+                    st.error(f"Error fetching user changes: {response.status_code} - {response.text}")
+                    return None, None
+                page_changes, next_link, new_delta_link = decode_page(response)
+                changes.extend(page_changes)
+            if delta_link:
+                updated_users, added, updated, removed = _apply_user_changes(users_data, changes)
+                if include_signin_activity:
+                    updated_users = _apply_signin_activity(updated_users, _fetch_signin_activity(headers, token_provider))
+                elif any(SIGNIN_ACTIVITY_COLUMNS[0] in user for user in updated_users):
+                    updated_users = _apply_signin_activity(updated_users, None)
+                logger.info(f"Synced users: {added} added, {updated} updated, {removed} removed ({len(updated_users)} total)")
+                st.success(f"Synced users: {added} added, {updated} updated, {removed} removed.")
+                return updated_users, new_delta_link
+
+        # No usable sync state: capture a deltaLink, then do a full fetch
+        params = {"$select": USER_SELECT_FIELDS, "$deltatoken": "latest"}
+        logger.debug(f"Sending request to {base_url}/users/delta with params: {params}")
+        response = get_graph_client().get(f"{base_url}/users/delta", headers=headers, params=params, token_provider=token_provider)
+        latest_delta_link = None
+        if response.status_code == 200:
+            latest_delta_link = decode_page(response)[2]
+        else:
+            logger.warning(f"Could not initialize user delta sync: {response.status_code} - {response.text}")
+        full_users = fetch_users(
+            tenant_id, client_id, client_secret,
+            partitions=partitions,
+            max_workers=max_workers,
+            include_signin_activity=include_signin_activity,
+            expand_groups=expand_groups
+        )
+        if full_users is None:
+            return None, None
+        return full_users, latest_delta_link
+    except Exception as e:
+        logger.error(f"Exception when syncing users: {str(e)}")
+        st.error(f"Exception when syncing users: {str(e)}")
+        return None, None
+
+def _group_members_url(group_id):
+    """
+    Build the relative URL listing a group's direct user members.
+
+    The microsoft.graph.user cast skips nested groups, devices and service
+    principals.
+
+    Args:
+        group_id (str): Group object ID
+
+    Returns:
+        str: URL relative to the Graph v1.0 root
+    """
+    return f"/groups/{group_id}/members/microsoft.graph.user?$select=id&$top=999"
+
+def _fetch_group_members(headers, token_provider, group_id, url):
+    """
+    Walk the remaining pages of one group's user members.
+
+    Runs on a worker thread, so errors are raised rather than reported
+    through Streamlit.
+
+    Args:
+        headers (dict): Request headers
+        token_provider (TokenProvider): Supplies the bearer token for every request
+        group_id (str): Group object ID
+        url (str): Absolute URL of the next page to fetch
+
+    Returns:
+        list: Member user IDs, or None if the group was deleted while paging
+    """
+    member_ids = []
+    while url:
+        response = get_graph_client().get(url, headers=headers, token_provider=token_provider)
+        if response.status_code == 404:
+            logger.info(f"Group {group_id} was deleted while fetching its members")
+            return None
+        if response.status_code != 200:
+            raise RuntimeError(f"Error fetching members of group {group_id}: {response.status_code} - {response.text}")
+        members, url, _ = decode_page(response)
+        member_ids.extend(member["id"] for member in members if member.get("id"))
+    return member_ids
+
+def fetch_group_memberships(tenant_id, client_id, client_secret, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Fetch group memberships group-first and build a membership index.
+
+    Enumerates /groups, then fetches each group's direct user members
+    through $batch, following any further member pages concurrently. This avoids the per-user memberOf expansion, which makes
+    every users page heavy and is capped by Graph's $expand limits.
+    Groups deleted between the listing and their member lookups (404) are
+    left out of the index; any other failed lookup fails the fetch.
+    
+    Args:
+        tenant_id (str): Azure tenant ID
+        client_id (str): Azure client ID
+        client_secret (str): Azure client secret
+        max_workers (int): Maximum number of groups fetched concurrently
+    
+    Returns:
+        MembershipIndex: Membership index, or None if failed
+    """
+    token = get_access_token(tenant_id, client_id, client_secret)
+    if not token:
+        logger.error("Failed to obtain access token for group memberships")
+        st.error("Failed to obtain access token for group memberships.")
+        return None
+
+    headers = {"Content-Type": "application/json"}
+    token_provider = get_token_provider(tenant_id, client_id, client_secret)
+    base_url = "https://graph.microsoft.com/v1.0"
+    try:
+        group_ids = []
+        group_names = []
+        url = f"{base_url}/groups"
+        params = {"$select": "id,displayName", "$top": 999}
+        page_count = 0
+        while url:
+            page_count += 1
+            logger.debug(f"Fetching page {page_count} of groups: {url}")
+            response = get_graph_client().get(url, headers=headers, params=params, token_provider=token_provider)
+            if response.status_code != 200:
+                logger.error(f"Error fetching groups: {response.status_code} - {response.text}")
+                st.error(f"Error fetching groups: {response.status_code} - {response.text}")
+                return None
+            groups, url, _ = decode_page(response)
+            for group in groups:
+                group_ids.append(group["id"])
+                group_names.append(group.get("displayName") or group["id"])
+            params = None
+        logger.info(f"Fetching members of {len(group_ids)} groups with up to {max_workers} workers")
+
+        # First member page of every group via $batch, then follow any remaining pages per group
+        first_pages = batch_get(
+            headers, token_provider,
+            {index: _group_members_url(group_id) for index, group_id in enumerate(group_ids)},
+            max_workers=max_workers
+        )
+        group_members = [[] for _ in group_ids]
+        remaining = {}
+        deleted = set()
+        for index, result in first_pages.items():
+            if result["status"] == 404:
+                deleted.add(index)
+                continue
+            if result["status"] != 200:
+                raise RuntimeError(f"Error fetching members of group {group_ids[index]}: {result['status']} - {result['body']}")
+            group_members[index].extend(member["id"] for member in result["body"].get("value", []) if member.get("id"))
+            if result["body"].get("@odata.nextLink"):
+                remaining[index] = result["body"]["@odata.nextLink"]
+        if remaining:
+            logger.debug(f"Following additional member pages for {len(remaining)} groups")
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(_fetch_group_members, headers, token_provider, group_ids[index], url): index
+                    for index, url in remaining.items()
+                }
+                for future in as_completed(futures):
+                    member_ids = future.result()
+                    if member_ids is None:
+                        deleted.add(futures[future])
+                    else:
+                        group_members[futures[future]].extend(member_ids)
+
+        if deleted:
+            logger.info(f"Skipping {len(deleted)} groups deleted during the fetch")
+        kept = [position for position in range(len(group_ids)) if position not in deleted]
+        index = MembershipIndex(
+            [group_ids[position] for position in kept],
+            [group_names[position] for position in kept],
+            [group_members[position] for position in kept]
+        )
+        logger.info(f"Built membership index: {index.group_count} groups, {len(index.user_groups)} users with memberships")
+        st.success(f"Fetched memberships for {index.group_count} groups.")
+        return index
+    except Exception as e:
+        logger.error(f"Exception when fetching group memberships: {str(e)}")
+        st.error(f"Exception when fetching group memberships: {str(e)}")
+        return None
+
+def _send_batch(headers, token_provider, chunk):
+    """
+    Send one JSON $batch request.
+
+    Runs on a worker thread, so errors are returned as sub-request results
+    rather than reported through Streamlit.
+
+    Args:
+        headers (dict): Request headers
+        token_provider (TokenProvider): Supplies the bearer token for every request
+        chunk (list): (key, relative URL) pairs, at most GRAPH_BATCH_LIMIT long
+
+    Returns:
+        list: (key, status, body, retry-after seconds or None) tuples, one per sub-request
+    """
+    base_url = "https://graph.microsoft.com/v1.0"
+    body = {"requests": [{"id": str(position), "method": "GET", "url": url} for position, (_, url) in enumerate(chunk)]}
+    response = get_graph_client().post(f"{base_url}/$batch", headers=headers, json=body, token_provider=token_provider)
+    if response.status_code != 200:
+        return [(key, response.status_code, {"error": response.text}, None) for key, _ in chunk]
+    results = []
+    for sub_response in loads(response.content).get("responses", []):
+        key = chunk[int(sub_response["id"])][0]
+        retry_after = (sub_response.get("headers") or {}).get("Retry-After")
+        try:
+            retry_after = float(retry_after) if retry_after is not None else None
+        except ValueError:
+            retry_after = None
+        results.append((key, sub_response.get("status", 0), sub_response.get("body") or {}, retry_after))
+    return results
+
+def batch_get(headers, token_provider, requests_by_key, max_workers=DEFAULT_MAX_WORKERS, max_retries=DEFAULT_MAX_RETRIES):
+    """
+    Run many small Graph GET lookups through JSON $batch.
+
+    Lookups are packed GRAPH_BATCH_LIMIT to a call and the calls run
+    concurrently. Sub-requests that come back throttled or with a server error
+    are retried on their own, honoring Retry-After, while successful ones are
+    kept. Results are keyed by the caller's keys. Lookups still unanswered
+    after the last round come back with status None, so every key is present.
+    
+    Args:
+        headers (dict): Request headers
+        token_provider (TokenProvider): Supplies the bearer token for every request
+        requests_by_key (dict): Caller key -> URL relative to the Graph v1.0 root, e.g. "/users/{id}?$select=id"
+        max_workers (int): Maximum number of batch calls in flight
+        max_retries (int): Retry rounds for failed sub-requests
+    
+    Returns:
+        dict: Caller key -> {"status": int or None, "body": dict}
+    """
+    results = {}
+    pending = dict(requests_by_key)
+    for attempt in range(max_retries + 1):
+        keys = list(pending)
+        chunks = [[(key, pending[key]) for key in keys[start:start + GRAPH_BATCH_LIMIT]]
+                  for start in range(0, len(keys), GRAPH_BATCH_LIMIT)]
+        logger.debug(f"Sending {len(keys)} lookups in {len(chunks)} batch calls (round {attempt + 1})")
+        retry_delay = 0.0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for chunk_results in executor.map(lambda chunk: _send_batch(headers, token_provider, chunk), chunks):
+                for key, status, body, retry_after in chunk_results:
+                    if status in RETRY_STATUS_CODES and attempt < max_retries:
+                        retry_delay = max(retry_delay, retry_after if retry_after is not None else backoff_seconds(attempt))
+                        continue
+                    results[key] = {"status": status, "body": body}
+                    del pending[key]
+        if not pending:
+            break
+        if attempt == max_retries:
+            break
+        logger.warning(f"Retrying {len(pending)} failed batch lookups in {retry_delay:.1f}s")
+        time.sleep(retry_delay)
+    if pending:
+        # Sub-requests missing from every batch response; report them instead of dropping them
+        logger.warning(f"{len(pending)} batch lookups got no response after {max_retries + 1} rounds")
+        for key in pending:
+            results[key] = {"status": None, "body": {}}
+    return results
+
+def fetch_users_by_id(tenant_id, client_id, client_secret, user_ids, include_signin_activity=False,
+                      max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Fetch a set of users by ID through $batch.
+
+    Group memberships are not requested, so the returned rows carry
+    "No groups"; callers refreshing existing rows should keep their groups.
+    
+    Args:
+        tenant_id (str): Azure tenant ID
+        client_id (str): Azure client ID
+        client_secret (str): Azure client secret
+        user_ids (list): User object IDs to fetch
+        include_signin_activity (bool): Also request signInActivity for each user
+        max_workers (int): Maximum number of batch calls in flight
+    
+    Returns:
+        dict or None: User ID -> user data dictionary for every user that was found,
+            or None if any lookup failed or got no response, so callers do not treat
+            the missing users as unchanged
+    """
+    token = get_access_token(tenant_id, client_id, client_secret)
+    if not token:
+        logger.error("Failed to obtain access token for user lookups")
+        st.error("Failed to obtain access token.")
+        return None
+
+    headers = {"Content-Type": "application/json"}
+    token_provider = get_token_provider(tenant_id, client_id, client_secret)
+    select = USER_SELECT_FIELDS + (",signInActivity" if include_signin_activity else "")
+    try:
+        results = batch_get(
+            headers, token_provider,
+            {user_id: f"/users/{user_id}?$select={select}" for user_id in user_ids},
+            max_workers=max_workers
+        )
+        users = {}
+        failed = 0
+        for user_id, result in results.items():
+            if result["status"] == 200:
+                users[user_id] = _parse_user(result["body"], include_signin_activity)
+            elif result["status"] != 404:
+                failed += 1
+                logger.error(f"Error fetching user {user_id}: {result['status']} - {result['body']}")
+        if failed:
+            logger.error(f"{failed} of {len(user_ids)} user lookups failed")
+            st.error(f"{failed} of {len(user_ids)} user lookups failed. No users were updated.")
+            return None
+        logger.info(f"Fetched {len(users)} of {len(user_ids)} users by ID")
+        return users
+    except Exception as e:
+        logger.error(f"Exception when fetching users by ID: {str(e)}")
+        st.error(f"Exception when fetching users by ID: {str(e)}")
+        return None
@@ -0,0 +1,80 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from utils.logger import setup_logger
+
+# Setup logger
+logger = setup_logger("fetch_orchestrator", "logs/app.log")
+
+# How often the calling thread redraws combined progress while fetches run
+PROGRESS_INTERVAL_SECONDS = 0.5
+
+def run_fetches(tasks, progress_callback=None):
+    """
+    Run independent fetch pipelines concurrently and wait for all of them.
+
+    Each task runs on its own thread attached to the calling script run, so
+    the st.success/st.error messages the fetch functions emit still reach the
+    page. Progress is only ever reported from the calling thread: tasks update
+    their own status line through the report function they are given, and
+    progress_callback receives a snapshot of all of them.
+
+    Args:
+        tasks (dict): Task name -> callable taking a report(message) function and returning the task result
+        progress_callback (callable, optional): Called from the calling thread with a list of
+            {"task", "status", "detail", "seconds"} dictionaries
+
+    Returns:
+        dict: Task name -> result, or None for tasks that raised
+    """
+    lock = threading.Lock()
+    started = time.perf_counter()
+    progress = {name: {"task": name, "status": "running", "detail": "", "seconds": 0.0} for name in tasks}
+    ctx = get_script_run_ctx()
+
+    def attach_context():
+        add_script_run_ctx(threading.current_thread(), ctx)
+
+    def run(name, task):
+        def report(message):
+            with lock:
+                progress[name]["detail"] = message
+        try:
+            return task(report)
+        finally:
+            with lock:
+                progress[name]["seconds"] = time.perf_counter() - started
+
+    def snapshot():
+        with lock:
+            for entry in progress.values():
+                if entry["status"] == "running":
+                    entry["seconds"] = time.perf_counter() - started
+            return [dict(entry) for entry in progress.values()]
+
+    results = {}
+    logger.info(f"Running {len(tasks)} fetches concurrently: {', '.join(tasks)}")
+    with ThreadPoolExecutor(max_workers=len(tasks), initializer=attach_context) as executor:
+        futures = {executor.submit(run, name, task): name for name, task in tasks.items()}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=PROGRESS_INTERVAL_SECONDS, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = futures[future]
+                try:
+                    results[name] = future.result()
+                    status = "done"
+                except Exception as e:
+                    logger.error(f"Fetch {name} failed: {str(e)}")
+                    st.error(f"Fetch {name} failed: {str(e)}")
+                    results[name] = None
+                    status = "failed"
+                with lock:
+                    progress[name]["status"] = status
+                logger.info(f"Fetch {name} {status} after {progress[name]['seconds']:.1f}s")
+            if progress_callback:
+                progress_callback(snapshot())
+    logger.info(f"All fetches finished in {time.perf_counter() - started:.1f}s")
+    return results
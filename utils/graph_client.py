@@ -0,0 +1,342 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from utils.logger import setup_logger
+
+# Setup logger
+logger = setup_logger("graph_client", "logs/app.log")
+
+GRAPH_BASE_URL = "https://graph.microsoft.com/v1.0"
+# Connections kept open per host; should be at least the largest fetch parallelism
+DEFAULT_POOL_SIZE = 16
+DEFAULT_TIMEOUT = 60
+# Number of recent request timings kept for get_stats()
+TIMING_HISTORY = 1000
+# Responses retried at the request level; 429 and 503 also count as throttling
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+THROTTLE_STATUS_CODES = {429, 503}
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+# Consecutive successful requests before the concurrency limit is raised by one
+CONCURRENCY_INCREASE_AFTER = 20
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Concurrency limit that adapts to Graph throttling.
+
+    Works like a semaphore whose size follows an additive-increase,
+    multiplicative-decrease rule: a throttled response halves the limit, and
+    every CONCURRENCY_INCREASE_AFTER consecutive successes raise it by one, up
+    to max_limit.
+    """
+
+    def __init__(self, max_limit, min_limit=1, increase_after=CONCURRENCY_INCREASE_AFTER):
+        """
+        Create a limiter.
+
+        Args:
+            max_limit (int): Upper bound on concurrent requests
+            min_limit (int): Lower bound the limit never drops below
+            increase_after (int): Consecutive successes needed to raise the limit
+        """
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.increase_after = increase_after
+        self.limit = max_limit
+        self.active = 0
+        self.throttled = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        with self._condition:
+            while self.active >= self.limit:
+                self._condition.wait()
+            self.active += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+        return False
+
+    def record_success(self):
+        """Count a successful request, raising the limit after a run of successes."""
+        with self._condition:
+            self._successes += 1
+            if self._successes >= self.increase_after and self.limit < self.max_limit:
+                self.limit += 1
+                self._successes = 0
+                logger.debug(f"Raised Graph concurrency limit to {self.limit}")
+                self._condition.notify_all()
+
+    def record_throttle(self):
+        """Count a throttled request and halve the limit."""
+        with self._condition:
+            self.throttled += 1
+            self._successes = 0
+            new_limit = max(self.min_limit, self.limit // 2)
+            if new_limit != self.limit:
+                logger.warning(f"Graph throttling detected, lowering concurrency limit from {self.limit} to {new_limit}")
+                self.limit = new_limit
+
+def _retry_after_seconds(response):
+    """
+    Read the Retry-After header of a response.
+
+    Args:
+        response: requests or httpx response object
+
+    Returns:
+        float: Seconds to wait, or None if the header is missing or invalid
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_seconds(attempt):
+    """
+    Exponential backoff with full jitter.
+
+    Args:
+        attempt (int): Zero-based retry attempt
+
+    Returns:
+        float: Seconds to wait
+    """
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+class GraphClient:
+    """
+    Shared HTTP client for Microsoft Graph.
+
+    Keeps a pool of keep-alive connections so pages after the first skip the
+    TCP and TLS handshakes, asks for gzip-compressed responses, and records the
+    duration of every request. HTTP/2 is used when requested and the optional
+    httpx[http2] extra is installed; otherwise a requests.Session is used.
+
+    Throttled (429/503), server-error and connection-failure requests are
+    retried individually, honoring Retry-After and otherwise backing off
+    exponentially with jitter, while an AdaptiveConcurrencyLimiter lowers or
+    raises the number of requests in flight based on observed throttling.
+
+    The client is shared by every tenant, so credentials are passed per
+    request: with a token provider the Authorization header is set from its
+    current token on every attempt, and a 401 is retried once with a freshly
+    requested token.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, http2=False, timeout=DEFAULT_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES, max_concurrency=None):
+        """
+        Create a Graph client.
+
+        Args:
+            pool_size (int): Maximum number of pooled connections
+            http2 (bool): Use HTTP/2 via httpx when available
+            timeout (int): Request timeout in seconds
+            max_retries (int): Retries per request before the last response or error is returned
+            max_concurrency (int, optional): Upper bound on requests in flight (default: pool_size)
+        """
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.limiter = AdaptiveConcurrencyLimiter(max_concurrency or pool_size)
+        self._transport_errors = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+        self.http2 = False
+        self._timings = deque(maxlen=TIMING_HISTORY)
+        self._lock = threading.Lock()
+        default_headers = {"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"}
+        if http2:
+            try:
+                import httpx
+                self._client = httpx.Client(
+                    http2=True,
+                    timeout=timeout,
+                    headers=default_headers,
+                    limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+                )
+                self._transport_errors = (httpx.TransportError,)
+                self.http2 = True
+            except ImportError as e:
+                logger.warning(f"HTTP/2 requested but unavailable, using HTTP/1.1: {str(e)}")
+        if not self.http2:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.headers.update(default_headers)
+            self._client = session
+        logger.info(f"Created Graph client (pool size {pool_size}, {'HTTP/2' if self.http2 else 'HTTP/1.1'})")
+
+    def get(self, url, headers=None, params=None, token_provider=None):
+        """
+        Send a GET request over the pooled connections.
+
+        Args:
+            url (str): Absolute request URL, e.g. an @odata.nextLink
+            headers (dict, optional): Request headers
+            params (dict, optional): Query parameters
+            token_provider (TokenProvider, optional): Supplies the bearer token for every attempt
+
+        Returns:
+            Response: requests or httpx response object
+        """
+        return self._send("GET", url, token_provider, headers=headers, params=params)
+
+    def post(self, url, headers=None, json=None, token_provider=None):
+        """
+        Send a POST request with a JSON body over the pooled connections.
+
+        Args:
+            url (str): Absolute request URL
+            headers (dict, optional): Request headers
+            json (dict, optional): JSON request body
+            token_provider (TokenProvider, optional): Supplies the bearer token for every attempt
+
+        Returns:
+            Response: requests or httpx response object
+        """
+        return self._send("POST", url, token_provider, headers=headers, json=json)
+
+    def _send(self, method, url, token_provider=None, headers=None, **kwargs):
+        """
+        Send a request, retrying throttled and transient failures.
+
+        Args:
+            method (str): HTTP method
+            url (str): Absolute request URL
+            token_provider (TokenProvider, optional): Supplies the bearer token for every attempt
+            headers (dict, optional): Request headers
+            **kwargs: Extra arguments for the underlying client
+
+        Returns:
+            Response: Final requests or httpx response object
+        """
+        path = urlsplit(url).path
+        token = None
+        auth_retried = False
+        attempt = 0
+        while True:
+            if token_provider is not None:
+                token = token_provider.get_token()
+                headers = dict(headers or {}, Authorization=f"Bearer {token}")
+            start = time.perf_counter()
+            try:
+                with self.limiter:
+                    response = self._client.request(method, url, timeout=self.timeout, headers=headers, **kwargs)
+            except self._transport_errors as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = backoff_seconds(attempt)
+                logger.warning(f"{method} {path} failed ({str(e)}), retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._timings.append({
+                    "method": method,
+                    "path": path,
+                    "status": response.status_code,
+                    "seconds": elapsed,
+                    "bytes": len(response.content),
+                })
+            logger.debug(f"{method} {path} -> {response.status_code} in {elapsed * 1000:.0f} ms")
+            if response.status_code == 401 and token_provider is not None and not auth_retried:
+                # The token expired or was revoked mid-fetch; retry once with a new one
+                logger.warning(f"{method} {path} returned 401, retrying with a refreshed access token")
+                token_provider.get_token(rejected_token=token)
+                auth_retried = True
+                continue
+            if response.status_code not in RETRY_STATUS_CODES:
+                self.limiter.record_success()
+                return response
+            if response.status_code in THROTTLE_STATUS_CODES:
+                self.limiter.record_throttle()
+            if attempt >= self.max_retries:
+                break
+            delay = _retry_after_seconds(response)
+            if delay is None:
+                delay = backoff_seconds(attempt)
+            logger.warning(f"{method} {path} returned {response.status_code}, retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+            time.sleep(delay)
+            attempt += 1
+        logger.error(f"{method} {path} still failing after {self.max_retries} retries: {response.status_code}")
+        return response
+
+    def get_timings(self):
+        """
+        Get the most recent per-request timings.
+
+        Returns:
+            list: Timing dictionaries with method, path, status, seconds and bytes
+        """
+        with self._lock:
+            return list(self._timings)
+
+    def get_stats(self):
+        """
+        Summarize recent request timings.
+
+        The first request pays for connection setup, so comparing it with the
+        mean of the rest shows the savings from connection reuse.
+
+        Returns:
+            dict: Request count, total/mean/first/mean-after-first seconds, bytes received,
+                  throttled responses and the current concurrency limit
+        """
+        timings = self.get_timings()
+        if not timings:
+            return {"requests": 0, "total_seconds": 0.0, "mean_seconds": 0.0,
+                    "first_seconds": 0.0, "mean_after_first_seconds": 0.0, "bytes": 0,
+                    "throttled": self.limiter.throttled, "concurrency_limit": self.limiter.limit}
+        durations = [timing["seconds"] for timing in timings]
+        rest = durations[1:]
+        return {
+            "requests": len(durations),
+            "total_seconds": sum(durations),
+            "mean_seconds": sum(durations) / len(durations),
+            "first_seconds": durations[0],
+            "mean_after_first_seconds": sum(rest) / len(rest) if rest else 0.0,
+            "bytes": sum(timing["bytes"] for timing in timings),
+            "throttled": self.limiter.throttled,
+            "concurrency_limit": self.limiter.limit,
+        }
+
+    def close(self):
+        """Close all pooled connections."""
+        self._client.close()
+
+_graph_client = None
+_graph_client_lock = threading.Lock()
+
+def get_graph_client():
+    """
+    Get the process-wide Graph client, creating it on first use.
+
+    HTTP/2 is enabled by setting GRAPH_HTTP2=true in the environment.
+
+    Returns:
+        GraphClient: Shared Graph client
+    """
+    global _graph_client
+    with _graph_client_lock:
+        if _graph_client is None:
+            http2 = os.getenv("GRAPH_HTTP2", "false").lower() == "true"
+            _graph_client = GraphClient(http2=http2)
+        return _graph_client
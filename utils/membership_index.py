@@ -0,0 +1,143 @@
+import json
+import os
+import streamlit as st
+from utils.logger import setup_logger
+
+# Setup logger
+logger = setup_logger("membership_index", "logs/app.log")
+
+# Local file holding the membership index of the latest user snapshot
+MEMBERSHIP_INDEX_FILE = "group_memberships.json"
+
+class MembershipIndex:
+    """
+    Compact two-way index of user group memberships.
+
+    Groups are stored once as parallel lists of IDs and display names and
+    referenced everywhere else by their integer position, so each user maps to
+    a tuple of small ints and each group to a tuple of user IDs.
+    """
+
+    def __init__(self, group_ids, group_names, group_members):
+        """
+        Build the index from group-centric data.
+
+        Args:
+            group_ids (list): Group object IDs
+            group_names (list): Group display names, parallel to group_ids
+            group_members (list): Tuples of member user IDs, parallel to group_ids
+        """
+        self.group_ids = list(group_ids)
+        self.group_names = list(group_names)
+        self.group_members = [tuple(members) for members in group_members]
+        user_groups = {}
+        for group_index, members in enumerate(self.group_members):
+            for user_id in members:
+                user_groups.setdefault(user_id, []).append(group_index)
+        self.user_groups = {user_id: tuple(indices) for user_id, indices in user_groups.items()}
+
+    @property
+    def group_count(self):
+        """int: Number of groups in the index."""
+        return len(self.group_ids)
+
+    def groups_for_user(self, user_id):
+        """
+        Get the display names of the groups a user belongs to.
+
+        Args:
+            user_id (str): User object ID
+
+        Returns:
+            list: Group display names
+        """
+        return [self.group_names[index] for index in self.user_groups.get(user_id, ())]
+
+    def groups_string(self, user_id):
+        """
+        Format a user's groups the way the "Groups" column of users_data does.
+
+        Args:
+            user_id (str): User object ID
+
+        Returns:
+            str: Comma-separated group names, or "No groups"
+        """
+        groups = self.groups_for_user(user_id)
+        return ", ".join(groups) if groups else "No groups"
+
+    def save(self, snapshot_version, path=MEMBERSHIP_INDEX_FILE):
+        """
+        Persist the index to a local JSON file.
+
+        Args:
+            snapshot_version (int): Version of the user snapshot the index belongs to
+            path (str): Output file path
+        """
+        tmp_file = f"{path}.tmp"
+        with open(tmp_file, mode="w", encoding="utf-8") as file:
+            json.dump({
+                "snapshotVersion": snapshot_version,
+                "groupIds": self.group_ids,
+                "groupNames": self.group_names,
+                "groupMembers": self.group_members,
+            }, file)
+        os.replace(tmp_file, path)
+        logger.info(f"Saved membership index with {self.group_count} groups for user snapshot v{snapshot_version} to {path}")
+
+    @classmethod
+    def load(cls, snapshot_version, path=MEMBERSHIP_INDEX_FILE):
+        """
+        Load a persisted index.
+
+        Args:
+            snapshot_version (int): Version of the user snapshot the index must belong to
+            path (str): Index file path
+
+        Returns:
+            MembershipIndex: Loaded index, or None if the file does not exist, is unreadable
+                or belongs to another snapshot version
+        """
+        try:
+            with open(path, mode="r", encoding="utf-8") as file:
+                data = json.load(file)
+            if data.get("snapshotVersion") != snapshot_version:
+                logger.info(
+                    f"Ignoring membership index for user snapshot v{data.get('snapshotVersion')}, "
+                    f"session uses v{snapshot_version}"
+                )
+                return None
+            return cls(data["groupIds"], data["groupNames"], data["groupMembers"])
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, OSError) as e:
+            logger.warning(f"Ignoring unreadable membership index {path}: {str(e)}")
+            return None
+
+def clear_membership_index(path=MEMBERSHIP_INDEX_FILE):
+    """
+    Delete the persisted index, e.g. when a snapshot takes its groups from memberOf.
+
+    Args:
+        path (str): Index file path
+    """
+    if os.path.exists(path):
+        os.remove(path)
+        logger.info(f"Removed membership index {path}")
+
+def get_membership_index():
+    """
+    Get the membership index shared by the pages of this session.
+
+    Loads the persisted index on first use in a session, if it belongs to the
+    session's user snapshot version.
+
+    Returns:
+        MembershipIndex: Index, or None if group memberships have not been fetched for the snapshot
+    """
+    if "membership_index" not in st.session_state:
+        snapshot_version = getattr(st.session_state.get("users_data"), "version", None)
+        st.session_state.membership_index = MembershipIndex.load(snapshot_version) if snapshot_version is not None else None
+        if st.session_state.membership_index is not None:
+            logger.debug(f"Loaded membership index with {st.session_state.membership_index.group_count} groups")
+    return st.session_state.membership_index
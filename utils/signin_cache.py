@@ -0,0 +1,191 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from types import MappingProxyType
+import streamlit as st
+from utils.logger import setup_logger
+
+# Setup logger
+logger = setup_logger("signin_cache", "logs/app.log")
+
+# Parsed sign-in maps kept per process; the least recently used version is evicted first
+SIGNIN_CACHE_VERSIONS = 4
+# Bytes read per step while hashing a sign-in file
+HASH_CHUNK_BYTES = 4 * 1024 * 1024
+
+def file_stat(path):
+    """
+    Get the cheap identity of a file.
+
+    Args:
+        path (str): File path
+
+    Returns:
+        tuple: (absolute path, size in bytes, mtime in nanoseconds)
+    """
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+def file_content_hash(path):
+    """
+    Hash the content of a file.
+
+    Args:
+        path (str): File path
+
+    Returns:
+        str: Hex BLAKE2b digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, mode="rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def directory_signature(root):
+    """
+    Get the identity of every file under a directory.
+
+    Args:
+        root (str): Directory path
+
+    Returns:
+        tuple: Sorted (relative path, size, mtime in nanoseconds) of each file
+    """
+    signature = []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            stat = os.stat(path)
+            signature.append((os.path.relpath(path, root), stat.st_size, stat.st_mtime_ns))
+    return tuple(sorted(signature))
+
+class SignInCache:
+    """
+    Process-wide LRU cache of parsed per-user last sign-in maps.
+
+    Entries are keyed on the identity of the data they were parsed from, so
+    a file or store rewritten by the fetcher gets a new key and is parsed
+    again, while every session reading unchanged data shares one read-only
+    map. Files are identified by path, size and mtime; when those change,
+    the content hash decides whether the file really differs, so a file
+    rewritten with identical content is not parsed again.
+
+    Parsing runs outside the cache lock: concurrent misses on the same key
+    wait for the one parse in flight, while other keys stay available.
+    """
+
+    def __init__(self, max_versions=SIGNIN_CACHE_VERSIONS):
+        """
+        Create an empty cache.
+
+        Args:
+            max_versions (int): Number of parsed versions to keep
+        """
+        self.max_versions = max_versions
+        self._entries = OrderedDict()
+        self._file_keys = {}
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, loader):
+        """
+        Get a parsed map, loading and caching it on a miss.
+
+        Loader errors propagate, also to callers waiting for the same key,
+        and nothing is cached for the key.
+
+        Args:
+            key (tuple): Identity of the source data
+            loader (callable): Returns the {user ID: datetime} map for key
+
+        Returns:
+            MappingProxyType: Read-only mapping of user IDs to their latest sign-in times
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            future = self._loading.get(key)
+            if future is None:
+                future = self._loading[key] = Future()
+                self.misses += 1
+                loading = True
+            else:
+                self.hits += 1
+                loading = False
+        if not loading:
+            return future.result()
+        try:
+            signin_data = MappingProxyType(loader())
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._loading[key]
+            self._entries[key] = signin_data
+            while len(self._entries) > self.max_versions:
+                evicted, _ = self._entries.popitem(last=False)
+                # Cache keys start with the file key, followed by the loader params
+                self._file_keys = {
+                    stat: file_key for stat, file_key in self._file_keys.items()
+                    if any(cached[:len(file_key)] == file_key for cached in self._entries)
+                }
+                logger.debug(f"Evicted parsed sign-ins for {evicted[0]}")
+            logger.info(f"Parsed sign-ins for {len(signin_data)} users from {key[0]} ({self.hits} hits, {self.misses} misses)")
+        future.set_result(signin_data)
+        return signin_data
+
+    def get_file(self, path, loader, *params):
+        """
+        Get the parsed map of a file, keyed on its path, size, mtime and content hash.
+
+        Args:
+            path (str): File path
+            loader (callable): Called as loader(path, *params) on a miss
+            *params: Extra loader arguments, also part of the key
+
+        Returns:
+            MappingProxyType: Read-only mapping of user IDs to their latest sign-in times
+        """
+        stat = file_stat(path)
+        with self._lock:
+            file_key = self._file_keys.get(stat)
+        if file_key is None:
+            file_key = (stat[0], stat[1], file_content_hash(path))
+            with self._lock:
+                # Only the current identity of a path is looked up again
+                self._file_keys = {known: key for known, key in self._file_keys.items() if known[0] != stat[0]}
+                self._file_keys[stat] = file_key
+        return self.get(file_key + params, lambda: loader(path, *params))
+
+    def get_directory(self, root, loader, *params):
+        """
+        Get the parsed map of a directory of write-once files, keyed on each file's path, size and mtime.
+
+        Args:
+            root (str): Directory path
+            loader (callable): Called as loader(*params) on a miss
+            *params: Extra loader arguments, also part of the key
+
+        Returns:
+            MappingProxyType: Read-only mapping of user IDs to their latest sign-in times
+        """
+        return self.get((os.path.abspath(root), directory_signature(root)) + params, lambda: loader(*params))
+
+@st.cache_resource
+def get_signin_cache():
+    """
+    Get the sign-in cache shared by every session of this server process.
+
+    Returns:
+        SignInCache: Shared cache
+    """
+    return SignInCache()
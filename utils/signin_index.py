@@ -0,0 +1,119 @@
+import time
+import numpy as np
+import pandas as pd
+from utils.logger import setup_logger
+
+# Setup logger
+logger = setup_logger("signin_index", "logs/app.log")
+
+SECONDS_PER_DAY = 86400
+# Thresholds covered by the inactivity curve, in days
+CURVE_MAX_DAYS = 90
+# Integer representation of NaT, used for users without any recorded sign-in
+NAT_SECONDS = np.iinfo(np.int64).min
+
+class LastSignInIndex:
+    """
+    Users sorted by last sign-in, for answering any inactivity threshold.
+
+    Last sign-ins are held as a datetime64[s] array in ascending order, with
+    users who never signed in stored as NaT at the end, and user IDs and
+    display names in parallel arrays. "Inactive for at least N days" is a
+    binary search for the threshold plus a slice, and days inactive are
+    computed for the whole slice in one array operation, so no per-user
+    Python work happens after the index is built.
+    """
+
+    def __init__(self, users_data, signin_data):
+        """
+        Build the index.
+
+        Args:
+            users_data (list): User data dictionaries
+            signin_data (Mapping): User IDs mapped to their latest aware sign-in datetimes
+        """
+        user_ids = []
+        display_names = []
+        last_signins = []
+        for user in users_data:
+            user_id = user["User ID"]
+            last_signin = signin_data.get(user_id)
+            user_ids.append(user_id)
+            display_names.append(user["Display Name"])
+            last_signins.append(NAT_SECONDS if last_signin is None else int(last_signin.timestamp()))
+        last_signins = np.array(last_signins, dtype=np.int64).view("datetime64[s]")
+        # NaT sorts after every timestamp
+        order = np.argsort(last_signins, kind="stable")
+        self.last_signins = last_signins[order]
+        self.user_ids = np.array(user_ids, dtype=object)[order]
+        self.display_names = np.array(display_names, dtype=object)[order]
+        self.signed_in_count = int(np.count_nonzero(~np.isnat(self.last_signins)))
+        logger.debug(
+            f"Indexed {self.signed_in_count} users with a sign-in and "
+            f"{len(self.last_signins) - self.signed_in_count} without"
+        )
+
+    def __len__(self):
+        return len(self.last_signins)
+
+    def _cutoff(self, inactivity_days, now):
+        """Position of the first user who signed in within the last inactivity_days days."""
+        thresholds = np.asarray(now - np.asarray(inactivity_days) * SECONDS_PER_DAY).astype(np.int64).view("datetime64[s]")
+        return np.searchsorted(self.last_signins[:self.signed_in_count], thresholds, side="left")
+
+    def inactive_count(self, inactivity_days, now=None):
+        """
+        Count users with no sign-in in the last inactivity_days days.
+
+        Args:
+            inactivity_days (int): Inactivity threshold in days
+            now (float, optional): Reference POSIX time (default: current time)
+
+        Returns:
+            int: Number of inactive users, including users who never signed in
+        """
+        now = time.time() if now is None else now
+        return int(self._cutoff(inactivity_days, now)) + len(self) - self.signed_in_count
+
+    def inactive_users(self, inactivity_days, now=None):
+        """
+        Get users with no sign-in in the last inactivity_days days.
+
+        Args:
+            inactivity_days (int): Inactivity threshold in days
+            now (float, optional): Reference POSIX time (default: current time)
+
+        Returns:
+            pandas.DataFrame: "User ID", "Display Name", "Last Sign-In" (datetime64, NaT if
+                none is recorded) and "Days Since Last Sign-In" (Int64, <NA> if no sign-in is
+                recorded), longest inactive first, then users who never signed in
+        """
+        now = time.time() if now is None else now
+        cutoff = int(self._cutoff(inactivity_days, now))
+        rows = np.r_[0:cutoff, self.signed_in_count:len(self)]
+        signed_in = self.last_signins[:cutoff]
+        days = np.zeros(len(rows), dtype=np.int64)
+        days[:cutoff] = (np.datetime64(int(now), "s") - signed_in) // np.timedelta64(1, "D")
+        last_signins = self.last_signins[rows]
+        return pd.DataFrame({
+            "User ID": self.user_ids[rows],
+            "Display Name": self.display_names[rows],
+            "Last Sign-In": pd.to_datetime(last_signins).tz_localize("UTC"),
+            "Days Since Last Sign-In": pd.arrays.IntegerArray(days, np.isnat(last_signins)),
+        })
+
+    def threshold_curve(self, max_days=CURVE_MAX_DAYS, now=None):
+        """
+        Count inactive users for every threshold from 1 to max_days days.
+
+        Args:
+            max_days (int): Largest threshold in days
+            now (float, optional): Reference POSIX time (default: current time)
+
+        Returns:
+            pandas.DataFrame: "Inactive Users" indexed by "Inactivity Days"
+        """
+        now = time.time() if now is None else now
+        thresholds = np.arange(1, max_days + 1)
+        counts = self._cutoff(thresholds, now) + len(self) - self.signed_in_count
+        return pd.DataFrame({"Inactive Users": counts}, index=pd.Index(thresholds, name="Inactivity Days"))
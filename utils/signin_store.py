@@ -0,0 +1,256 @@
+import os
+import shutil
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+from utils.logger import setup_logger
+
+# Setup logger
+logger = setup_logger("signin_store", "logs/app.log")
+
+# Directory holding the sign-in store, one date=YYYY-MM-DD partition per sign-in day
+SIGNIN_STORE_DIR = "signin_store"
+# User IDs and names repeat across sign-ins, so they are dictionary-encoded
+SIGNIN_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("userId", pa.dictionary(pa.int32(), pa.string())),
+    ("userDisplayName", pa.dictionary(pa.int32(), pa.string())),
+    ("signInDateTime", pa.timestamp("ns", tz="UTC")),
+    ("collectionDate", pa.timestamp("ns", tz="UTC")),
+])
+# Column types used when staging CSV rows are converted; dictionary encoding is applied afterwards
+SIGNIN_CSV_TYPES = {
+    "id": pa.string(),
+    "userId": pa.string(),
+    "userDisplayName": pa.string(),
+    "signInDateTime": pa.timestamp("ns", tz="UTC"),
+    "collectionDate": pa.timestamp("ns", tz="UTC"),
+}
+# Bytes of CSV converted per batch while ingesting staged rows
+INGEST_BLOCK_BYTES = 16 * 1024 * 1024
+PARTITIONING = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+
+class SignInStore:
+    """
+    Columnar sign-in store, partitioned by sign-in date.
+
+    Sign-ins are kept as Parquet files under date=YYYY-MM-DD directories with
+    dictionary-encoded user columns and native UTC timestamp columns. Readers
+    load only the partitions inside the requested window, and retention drops
+    whole partitions. CSV is supported for ingesting staged rows and for
+    export.
+    """
+
+    def __init__(self, root=SIGNIN_STORE_DIR):
+        """
+        Create a store handle.
+
+        Args:
+            root (str): Store directory
+        """
+        self.root = root
+
+    def exists(self):
+        """
+        Check whether the store holds any partitions.
+
+        Returns:
+            bool: True if at least one partition exists
+        """
+        return bool(self.partitions())
+
+    def partitions(self):
+        """
+        List the sign-in dates present in the store.
+
+        Returns:
+            list: Partition dates as "YYYY-MM-DD" strings, oldest first
+        """
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name[len("date="):] for name in os.listdir(self.root) if name.startswith("date="))
+
+    def append_csv(self, csv_file, run_id):
+        """
+        Add the rows of a sign-in CSV to the store.
+
+        The file is converted in blocks, so memory stays bounded by the block
+        size rather than the file size.
+
+        Args:
+            csv_file (str): CSV with SIGNIN_SCHEMA columns and a header row
+            run_id (str): Unique name for the files written by this call
+
+        Returns:
+            int: Number of rows added
+        """
+        counter = {"rows": 0}
+        self._write(self._csv_batches(csv_file, counter), self.root, run_id)
+        logger.info(f"Added {counter['rows']} sign-ins from {csv_file} to {self.root}")
+        return counter["rows"]
+
+    def replace_from_csv(self, csv_file, run_id):
+        """
+        Replace the whole store with the rows of a sign-in CSV.
+
+        The new store is written next to the old one and swapped in once
+        complete, so readers never see a half-written store.
+
+        Args:
+            csv_file (str): CSV with SIGNIN_SCHEMA columns and a header row
+            run_id (str): Unique name for the files written by this call
+
+        Returns:
+            int: Number of rows written
+        """
+        new_root = f"{self.root}.new"
+        old_root = f"{self.root}.old"
+        for path in (new_root, old_root):
+            shutil.rmtree(path, ignore_errors=True)
+        counter = {"rows": 0}
+        self._write(self._csv_batches(csv_file, counter), new_root, run_id)
+        if os.path.isdir(self.root):
+            os.replace(self.root, old_root)
+        if os.path.isdir(new_root):
+            os.replace(new_root, self.root)
+        shutil.rmtree(old_root, ignore_errors=True)
+        logger.info(f"Replaced {self.root} with {counter['rows']} sign-ins from {csv_file}")
+        return counter["rows"]
+
+    def expire(self, before):
+        """
+        Drop partitions whose sign-in date is entirely before a cutoff.
+
+        Args:
+            before (datetime): Naive UTC cutoff; the partition containing it is kept
+
+        Returns:
+            int: Number of partitions removed
+        """
+        cutoff = before.strftime("%Y-%m-%d")
+        expired = [date for date in self.partitions() if date < cutoff]
+        for date in expired:
+            shutil.rmtree(os.path.join(self.root, f"date={date}"))
+        if expired:
+            logger.info(f"Expired {len(expired)} sign-in partitions before {cutoff}")
+        return len(expired)
+
+    def read(self, start=None, end=None, columns=None):
+        """
+        Read sign-ins, loading only the partitions inside a window.
+
+        Args:
+            start (datetime, optional): Naive UTC window start
+            end (datetime, optional): Naive UTC window end
+            columns (list, optional): Columns to load (default: all of SIGNIN_SCHEMA)
+
+        Returns:
+            pyarrow.Table: Matching sign-ins
+        """
+        columns = columns or SIGNIN_SCHEMA.names
+        if not self.exists():
+            return SIGNIN_SCHEMA.empty_table().select(columns)
+        condition = None
+        if start is not None:
+            condition = ds.field("date") >= start.strftime("%Y-%m-%d")
+        if end is not None:
+            end_condition = ds.field("date") <= end.strftime("%Y-%m-%d")
+            condition = end_condition if condition is None else condition & end_condition
+        dataset = ds.dataset(self.root, schema=SIGNIN_SCHEMA.append(pa.field("date", pa.string())),
+                             format="parquet", partitioning=PARTITIONING)
+        table = dataset.to_table(columns=columns, filter=condition)
+        logger.debug(f"Read {table.num_rows} sign-ins from {self.root}")
+        return table
+
+    def latest_signins(self, start=None, end=None):
+        """
+        Get the latest sign-in of every user inside a window.
+
+        Args:
+            start (datetime, optional): Naive UTC window start
+            end (datetime, optional): Naive UTC window end
+
+        Returns:
+            pyarrow.Table: Columns "userId" and "signInDateTime", one row per user
+        """
+        table = self.read(start, end, columns=["userId", "signInDateTime"])
+        table = table.set_column(0, "userId", pc.cast(table["userId"], pa.string()))
+        latest = table.group_by("userId").aggregate([("signInDateTime", "max")])
+        return latest.rename_columns(["userId", "signInDateTime"])
+
+    def export_csv(self, csv_file, start=None, end=None):
+        """
+        Export sign-ins to a CSV file with the historical signin_logs.csv columns.
+
+        Args:
+            csv_file (str): Output file path
+            start (datetime, optional): Naive UTC window start
+            end (datetime, optional): Naive UTC window end
+
+        Returns:
+            int: Number of rows exported
+        """
+        table = self.read(start, end)
+        columns = []
+        for name in SIGNIN_SCHEMA.names:
+            column = table[name]
+            if pa.types.is_timestamp(column.type):
+                column = pc.strftime(pc.cast(column, pa.timestamp("s", tz="UTC"), safe=False), format="%Y-%m-%dT%H:%M:%SZ")
+            else:
+                column = pc.cast(column, pa.string())
+            columns.append(column)
+        tmp_file = f"{csv_file}.tmp"
+        pa_csv.write_csv(pa.table(columns, names=SIGNIN_SCHEMA.names), tmp_file)
+        os.replace(tmp_file, csv_file)
+        logger.info(f"Exported {table.num_rows} sign-ins to {csv_file}")
+        return table.num_rows
+
+    def _csv_batches(self, csv_file, counter):
+        """
+        Convert a sign-in CSV into store batches with a "date" partition column.
+
+        Args:
+            csv_file (str): CSV with SIGNIN_SCHEMA columns and a header row
+            counter (dict): Running {"rows": int} count of converted rows
+
+        Yields:
+            pyarrow.RecordBatch: Batch with SIGNIN_SCHEMA columns plus "date"
+        """
+        reader = pa_csv.open_csv(
+            csv_file,
+            read_options=pa_csv.ReadOptions(block_size=INGEST_BLOCK_BYTES),
+            convert_options=pa_csv.ConvertOptions(
+                column_types=SIGNIN_CSV_TYPES,
+                include_columns=SIGNIN_SCHEMA.names,
+                strings_can_be_null=False,
+            ),
+        )
+        for batch in reader:
+            columns = [
+                pc.dictionary_encode(batch.column(name)) if pa.types.is_dictionary(SIGNIN_SCHEMA.field(name).type)
+                else batch.column(name)
+                for name in SIGNIN_SCHEMA.names
+            ]
+            dates = pc.strftime(batch.column("signInDateTime"), format="%Y-%m-%d")
+            counter["rows"] += batch.num_rows
+            yield pa.RecordBatch.from_arrays(columns + [dates], names=SIGNIN_SCHEMA.names + ["date"])
+
+    def _write(self, batches, root, run_id):
+        """
+        Write batches into date partitions under root.
+
+        Args:
+            batches (iterable): Batches from _csv_batches
+            root (str): Store directory
+            run_id (str): Unique file name prefix, so existing partition files are kept
+        """
+        schema = SIGNIN_SCHEMA.append(pa.field("date", pa.string()))
+        ds.write_dataset(
+            pa.RecordBatchReader.from_batches(schema, batches),
+            root,
+            format="parquet",
+            partitioning=PARTITIONING,
+            basename_template=f"part-{run_id}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
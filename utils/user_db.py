@@ -0,0 +1,402 @@
+import glob
+import os
+import re
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import timezone
+from utils.logger import setup_logger
+
+# Setup logger
+logger = setup_logger("user_db", "logs/app.log")
+
+# Local SQLite databases holding the users, groups, memberships and last sign-ins of one user
+# snapshot each, named by snapshot version and content fingerprint so sessions on different
+# snapshots never read each other's rows
+USER_DB_FILE_PATTERN = "users_v{version}_{fingerprint}.db"
+# Characters of the snapshot fingerprint used in database file names
+USER_DB_FINGERPRINT_LENGTH = 16
+# users_data column -> users table column
+USER_COLUMNS = {
+    "User ID": "id",
+    "User Principal Name": "upn",
+    "Display Name": "display_name",
+    "Job Title": "job_title",
+    "Department": "department",
+    "Account Enabled": "account_enabled",
+    "User Type": "user_type",
+    "Groups": "groups",
+}
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    upn TEXT,
+    display_name TEXT,
+    job_title TEXT,
+    department TEXT,
+    account_enabled TEXT,
+    user_type TEXT,
+    groups TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_users_upn ON users (upn COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_users_department ON users (department);
+CREATE TABLE IF NOT EXISTS groups (
+    idx INTEGER PRIMARY KEY,
+    id TEXT,
+    name TEXT
+);
+CREATE TABLE IF NOT EXISTS memberships (
+    user_id TEXT NOT NULL,
+    group_idx INTEGER NOT NULL,
+    PRIMARY KEY (user_id, group_idx)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_memberships_group ON memberships (group_idx);
+CREATE TABLE IF NOT EXISTS signins (
+    source TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    last_signin TEXT NOT NULL,
+    PRIMARY KEY (source, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_signins_last_signin ON signins (source, last_signin);
+"""
+# Timestamps are stored as ISO 8601 UTC text, which sorts chronologically
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+# Sign-in map last written to each (database, source) by this process; maps are shared
+# read-only across sessions, so a new session with the same map does not rewrite the table
+_written_signins = {}
+_written_signins_lock = threading.Lock()
+
+def database_path(dataset_version):
+    """
+    Get the database file of a user snapshot.
+
+    Args:
+        dataset_version (DatasetVersion): Snapshot version and content fingerprint
+
+    Returns:
+        str: Database file path
+    """
+    return USER_DB_FILE_PATTERN.format(
+        version=dataset_version.version,
+        fingerprint=dataset_version.fingerprint[:USER_DB_FINGERPRINT_LENGTH]
+    )
+
+def prune_databases(keep_versions):
+    """
+    Remove the databases of snapshots no session uses any more.
+
+    Args:
+        keep_versions (iterable): Snapshot versions whose databases are kept
+    """
+    keep_versions = {str(version) for version in keep_versions}
+    for path in glob.glob(USER_DB_FILE_PATTERN.format(version="*", fingerprint="*")):
+        match = re.fullmatch(r"users_v([^_]+)_[^_]+\.db", os.path.basename(path))
+        if match and match.group(1) not in keep_versions:
+            try:
+                os.remove(path)
+                with _written_signins_lock:
+                    for key in [key for key in _written_signins if key[0] == os.path.abspath(path)]:
+                        del _written_signins[key]
+                logger.debug(f"Removed unused user database {path}")
+            except OSError as e:
+                logger.warning(f"Could not remove unused user database {path}: {str(e)}")
+
+def connect(path):
+    """
+    Open the user database, creating the schema if needed.
+
+    Args:
+        path (str): Database file path
+
+    Returns:
+        sqlite3.Connection: Connection whose rows can be read by column name
+    """
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+    return connection
+
+def exists(path):
+    """
+    Check whether users have been written to the database.
+
+    Args:
+        path (str): Database file path
+
+    Returns:
+        bool: True if the database holds at least one user
+    """
+    if not os.path.exists(path):
+        return False
+    with closing(connect(path)) as connection:
+        return connection.execute("SELECT 1 FROM users LIMIT 1").fetchone() is not None
+
+def format_timestamp(value):
+    """
+    Format an aware datetime the way the signins table stores it.
+
+    Args:
+        value (datetime): Aware datetime
+
+    Returns:
+        str: ISO 8601 UTC timestamp
+    """
+    return value.astimezone(timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+def write_users(users_data, membership_index=None):
+    """
+    Write a published user snapshot's users, groups and memberships to its database.
+
+    Groups come from the membership index when one was fetched, otherwise
+    from the comma-separated "Groups" column of users_data.
+
+    Args:
+        users_data (UserTable): Published snapshot users
+        membership_index (MembershipIndex, optional): Group-centric membership index
+
+    Returns:
+        str: Database file path
+    """
+    path = database_path(users_data.dataset_version)
+    rows = [tuple(user.get(column) for column in USER_COLUMNS) for user in users_data]
+    if membership_index is not None:
+        groups = list(enumerate(zip(membership_index.group_ids, membership_index.group_names)))
+        memberships = [
+            (user_id, group_index)
+            for user_id, group_indices in membership_index.user_groups.items()
+            for group_index in group_indices
+        ]
+    else:
+        positions = {}
+        memberships = set()
+        for user in users_data:
+            groups_string = user.get("Groups")
+            if not groups_string or groups_string == "No groups":
+                continue
+            for name in groups_string.split(", "):
+                memberships.add((user["User ID"], positions.setdefault(name, len(positions))))
+        groups = [(index, (name, name)) for name, index in positions.items()]
+    with closing(connect(path)) as connection, connection:
+        connection.execute("DELETE FROM users")
+        connection.execute("DELETE FROM groups")
+        connection.execute("DELETE FROM memberships")
+        connection.executemany(f"INSERT OR REPLACE INTO users VALUES ({', '.join('?' * len(USER_COLUMNS))})", rows)
+        connection.executemany("INSERT INTO groups VALUES (?, ?, ?)", [(index, group_id, name) for index, (group_id, name) in groups])
+        connection.executemany("INSERT OR IGNORE INTO memberships VALUES (?, ?)", memberships)
+    logger.info(f"Wrote {len(rows)} users, {len(groups)} groups and {len(memberships)} memberships to {path}")
+    return path
+
+def ensure_users(users_data, membership_index=None):
+    """
+    Get the database of a session's user snapshot, writing it if it does not exist yet.
+
+    Args:
+        users_data (UserTable): Published snapshot users
+        membership_index (MembershipIndex, optional): Group-centric membership index
+
+    Returns:
+        str: Database file path
+    """
+    path = database_path(users_data.dataset_version)
+    if not exists(path):
+        write_users(users_data, membership_index)
+    return path
+
+def write_signins(path, signin_data, source):
+    """
+    Replace the last sign-ins read from one source.
+
+    Args:
+        path (str): Database file path
+        signin_data (dict): Mapping of user IDs to their latest aware sign-in datetimes
+        source (str): Sign-in source the data was read from, e.g. "audit_log"
+    """
+    with closing(connect(path)) as connection, connection:
+        connection.execute("DELETE FROM signins WHERE source = ?", (source,))
+        connection.executemany(
+            "INSERT INTO signins VALUES (?, ?, ?)",
+            ((source, user_id, format_timestamp(signin_date)) for user_id, signin_date in signin_data.items() if signin_date)
+        )
+    logger.debug(f"Wrote {source} last sign-ins for {len(signin_data)} users to {path}")
+
+def sync_signins(path, signin_data, source):
+    """
+    Write the last sign-ins read from one source unless this same map was already written.
+
+    Args:
+        path (str): Database file path
+        signin_data (Mapping): Shared read-only mapping of user IDs to their latest aware sign-in datetimes
+        source (str): Sign-in source the data was read from, e.g. "audit_log"
+
+    Returns:
+        bool: True if the sign-ins were written
+    """
+    key = (os.path.abspath(path), source)
+    with _written_signins_lock:
+        if _written_signins.get(key) is signin_data:
+            return False
+        write_signins(path, signin_data, source)
+        _written_signins[key] = signin_data
+    return True
+
+def query(path, sql, params=()):
+    """
+    Run a read-only query against a user database.
+
+    Args:
+        path (str): Database file path
+        sql (str): SQL statement
+        params (tuple or dict): Statement parameters
+
+    Returns:
+        list: Result rows as dictionaries
+    """
+    with closing(connect(path)) as connection:
+        return [dict(row) for row in connection.execute(sql, params)]
+
+def count_users(path, account_enabled=None):
+    """
+    Count users, optionally by account state.
+
+    Args:
+        path (str): Database file path
+        account_enabled (bool, optional): Count only enabled (True) or disabled (False) accounts
+
+    Returns:
+        int: Number of users
+    """
+    if account_enabled is None:
+        return query(path, "SELECT COUNT(*) AS n FROM users")[0]["n"]
+    return query(path, "SELECT COUNT(*) AS n FROM users WHERE account_enabled = ?",
+                 ("true" if account_enabled else "false",))[0]["n"]
+
+def count_groups(path):
+    """
+    Count groups.
+
+    Args:
+        path (str): Database file path
+
+    Returns:
+        int: Number of groups
+    """
+    return query(path, "SELECT COUNT(*) AS n FROM groups")[0]["n"]
+
+def departments(path):
+    """
+    List the distinct departments, excluding missing values.
+
+    Args:
+        path (str): Database file path
+
+    Returns:
+        list: Department names, sorted
+    """
+    rows = query(
+        path,
+        "SELECT DISTINCT department FROM users WHERE department IS NOT NULL AND department NOT IN ('', 'N/A') ORDER BY department"
+    )
+    return [row["department"] for row in rows]
+
+def department_of(path, user_ids):
+    """
+    Look up the department of a set of users.
+
+    Args:
+        path (str): Database file path
+        user_ids (list): User IDs
+
+    Returns:
+        dict: User ID -> department
+    """
+    with closing(connect(path)) as connection:
+        connection.execute("CREATE TEMP TABLE wanted (user_id TEXT PRIMARY KEY)")
+        connection.executemany("INSERT OR IGNORE INTO wanted VALUES (?)", ((user_id,) for user_id in user_ids))
+        rows = connection.execute(
+            "SELECT users.id, COALESCE(users.department, 'N/A') AS department FROM wanted JOIN users ON users.id = wanted.user_id"
+        )
+        return {row["id"]: row["department"] for row in rows}
+
+def job_titles(path):
+    """
+    List the distinct job titles.
+
+    Args:
+        path (str): Database file path
+
+    Returns:
+        list: Job titles, sorted
+    """
+    rows = query(path, "SELECT DISTINCT job_title FROM users WHERE job_title IS NOT NULL ORDER BY job_title")
+    return [row["job_title"] for row in rows]
+
+def users(path, columns="*"):
+    """
+    Read every user.
+
+    Args:
+        path (str): Database file path
+        columns (str): Comma-separated users table columns
+
+    Returns:
+        list: User rows as dictionaries
+    """
+    return query(path, f"SELECT {columns} FROM users ORDER BY rowid")
+
+def search_users(path, term, source):
+    """
+    Find users whose userPrincipalName contains a term, with their last sign-in.
+
+    Args:
+        path (str): Database file path
+        term (str): Case-insensitive search term
+        source (str): Sign-in source to join
+
+    Returns:
+        list: User rows with a "last_signin" column (None if no sign-in is recorded)
+    """
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return query(
+        path,
+        "SELECT users.*, signins.last_signin FROM users "
+        "LEFT JOIN signins ON signins.source = ? AND signins.user_id = users.id "
+        "WHERE users.upn LIKE ? ESCAPE '\\' ORDER BY users.upn",
+        (source, f"%{escaped}%")
+    )
+
+def inactive_users(path, threshold, source):
+    """
+    Find users with no sign-in since a threshold.
+
+    Args:
+        path (str): Database file path
+        threshold (datetime): Aware datetime; users whose last sign-in is earlier, or missing, are returned
+        source (str): Sign-in source to join
+
+    Returns:
+        list: User rows with a "last_signin" column (None if no sign-in is recorded)
+    """
+    return query(
+        path,
+        "SELECT users.*, signins.last_signin FROM users "
+        "LEFT JOIN signins ON signins.source = ? AND signins.user_id = users.id "
+        "WHERE signins.last_signin IS NULL OR signins.last_signin < ? ORDER BY users.rowid",
+        (source, format_timestamp(threshold))
+    )
+
+def count_signed_in_since(path, since, source):
+    """
+    Count users whose last sign-in is at or after a time.
+
+    Args:
+        path (str): Database file path
+        since (datetime): Aware datetime
+        source (str): Sign-in source to count
+
+    Returns:
+        int: Number of users
+    """
+    return query(
+        path, "SELECT COUNT(*) AS n FROM signins WHERE source = ? AND last_signin >= ?", (source, format_timestamp(since))
+    )[0]["n"]
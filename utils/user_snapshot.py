@@ -0,0 +1,288 @@
+import json
+import os
+import threading
+import weakref
+from datetime import datetime, timedelta, timezone
+import streamlit as st
+from utils import user_db
+from utils.graph_json import loads
+from utils.membership_index import clear_membership_index
+from utils.user_table import UserTable
+from utils.logger import setup_logger
+
+# Setup logger
+logger = setup_logger("user_snapshot", "logs/app.log")
+
+# Local file holding the last fetched users_data with its version and save time
+USER_SNAPSHOT_FILE = "users_snapshot.json"
+# Suffix of the small file next to a snapshot holding only its metadata
+SNAPSHOT_METADATA_SUFFIX = ".meta.json"
+# Snapshots older than this are shown as stale
+SNAPSHOT_STALE_AFTER = timedelta(hours=24)
+# Page that refreshes the snapshot
+FETCH_PAGE = "pages/1_Fetch_Data.py"
+# Session state derived from users_data, cleared when a session switches snapshots
+DERIVED_SESSION_KEYS = ("inactive_users", "nlp_inactive_users", "membership_index", "last_analysis_params", "analysis_metrics", "signin_index", "signin_index_params")
+
+class SnapshotRegistry:
+    """
+    Process-wide registry of immutable user snapshots shared by all sessions.
+
+    Sessions hold a reference to a frozen UserTable from the registry instead
+    of building their own copy. The registry keeps the latest version alive
+    and tracks older versions only weakly, so an old snapshot is released as
+    soon as the last session using it switches or ends.
+    """
+
+    def __init__(self):
+        """Create an empty registry."""
+        self._lock = threading.Lock()
+        # Held while a new version is allocated and written, so concurrent publishes never share a version
+        self._publish_lock = threading.Lock()
+        self._snapshots = weakref.WeakValueDictionary()
+        self._latest = None
+        self._latest_metadata = None
+
+    def latest(self):
+        """
+        Get the latest snapshot, loading the persisted one on first use.
+
+        Returns:
+            tuple: (UserTable, metadata), or (None, None) if no snapshot has been saved
+        """
+        with self._lock:
+            if self._latest is None:
+                users_data, metadata = load_user_snapshot()
+                if users_data is not None:
+                    self._register(UserTable.from_users(users_data), metadata)
+            return self._latest, self._latest_metadata
+
+    def latest_version(self):
+        """
+        Get the latest snapshot version without loading anything.
+
+        Returns:
+            int: Latest version, or None if no snapshot has been registered yet
+        """
+        metadata = self._latest_metadata
+        return metadata["version"] if metadata else None
+
+    def publish(self, users_data, membership_index=None):
+        """
+        Save users as the next snapshot version and register it as the latest.
+
+        The version is allocated, and the snapshot and membership index are
+        written, under a process-wide lock, so two sessions publishing at once
+        get distinct versions and each index is tagged with its own users.
+
+        Args:
+            users_data (UserTable): Snapshot users; frozen by this call
+            membership_index (MembershipIndex, optional): Group-centric membership index
+
+        Returns:
+            dict: Snapshot metadata from save_user_snapshot
+        """
+        with self._publish_lock:
+            metadata = save_user_snapshot(users_data)
+            if membership_index is not None:
+                membership_index.save(metadata["version"])
+            else:
+                clear_membership_index()
+            with self._lock:
+                self._register(users_data, metadata)
+        return metadata
+
+    def versions(self):
+        """
+        List the snapshot versions still referenced by the registry or a session.
+
+        Returns:
+            list: Versions, oldest first
+        """
+        return sorted(self._snapshots.keys())
+
+    def _register(self, users_data, metadata):
+        """Freeze a snapshot and make it the latest version; the caller holds the lock."""
+        dataset_version = users_data.freeze(metadata["version"])
+        if metadata.get("fingerprint", dataset_version.fingerprint) != dataset_version.fingerprint:
+            logger.warning(f"User snapshot v{metadata['version']} content does not match its saved fingerprint")
+        self._snapshots[metadata["version"]] = users_data
+        self._latest = users_data
+        self._latest_metadata = metadata
+        logger.info(f"Registered user snapshot v{metadata['version']}; versions in use: {self.versions()}")
+
+@st.cache_resource
+def get_snapshot_registry():
+    """
+    Get the snapshot registry shared by every session of this server process.
+
+    Returns:
+        SnapshotRegistry: Shared registry
+    """
+    return SnapshotRegistry()
+
+def save_user_snapshot(users_data, path=USER_SNAPSHOT_FILE):
+    """
+    Persist users_data as the next snapshot version.
+
+    The metadata is also written to a small file next to the snapshot, so
+    the next save reads the previous version without parsing every user.
+    It is written first: if the snapshot write is interrupted, a version
+    number is skipped rather than reused.
+
+    Args:
+        users_data (list or UserTable): User data dictionaries
+        path (str): Snapshot file path
+
+    Returns:
+        dict: Snapshot metadata with "version", "savedAt" (UTC), "userCount" and,
+            for a UserTable, the content "fingerprint"
+    """
+    previous = load_snapshot_metadata(path)
+    metadata = {
+        "version": (previous["version"] if previous else 0) + 1,
+        "savedAt": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "userCount": len(users_data),
+    }
+    if isinstance(users_data, UserTable):
+        metadata["fingerprint"] = users_data.fingerprint
+    metadata_file = f"{path}{SNAPSHOT_METADATA_SUFFIX}"
+    with open(f"{metadata_file}.tmp", mode="w", encoding="utf-8") as file:
+        json.dump(metadata, file)
+    os.replace(f"{metadata_file}.tmp", metadata_file)
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, mode="w", encoding="utf-8") as file:
+        json.dump({**metadata, "users": [dict(user) for user in users_data]}, file)
+    os.replace(tmp_file, path)
+    logger.info(f"Saved user snapshot v{metadata['version']} with {len(users_data)} users to {path}")
+    return metadata
+
+def load_snapshot_metadata(path=USER_SNAPSHOT_FILE):
+    """
+    Load the metadata of the persisted user snapshot without reading its users.
+
+    Snapshots saved before metadata files existed are read in full once.
+
+    Args:
+        path (str): Snapshot file path
+
+    Returns:
+        dict: Snapshot metadata, or None if no snapshot has been saved
+    """
+    try:
+        with open(f"{path}{SNAPSHOT_METADATA_SUFFIX}", mode="rb") as file:
+            return loads(file.read())
+    except FileNotFoundError:
+        return load_user_snapshot(path)[1]
+    except (ValueError, OSError) as e:
+        logger.warning(f"Ignoring unreadable user snapshot metadata for {path}: {str(e)}")
+        return load_user_snapshot(path)[1]
+
+def load_user_snapshot(path=USER_SNAPSHOT_FILE):
+    """
+    Load the persisted user snapshot.
+
+    Args:
+        path (str): Snapshot file path
+
+    Returns:
+        tuple: (users_data, metadata), or (None, None) if the file does not exist or is unreadable
+    """
+    try:
+        with open(path, mode="rb") as file:
+            data = loads(file.read())
+        users_data = data.pop("users")
+        return users_data, data
+    except FileNotFoundError:
+        return None, None
+    except (ValueError, KeyError, OSError) as e:
+        logger.warning(f"Ignoring unreadable user snapshot {path}: {str(e)}")
+        return None, None
+
+def _use_snapshot(users_data, metadata):
+    """
+    Point this session at a snapshot, dropping results derived from the previous one.
+
+    Args:
+        users_data (UserTable): Snapshot users
+        metadata (dict): Snapshot metadata, or None for an unsaved snapshot
+    """
+    for key in DERIVED_SESSION_KEYS:
+        st.session_state.pop(key, None)
+    st.session_state.users_data = users_data
+    st.session_state.user_snapshot = metadata
+
+def get_users_data():
+    """
+    Get the users_data of this session, using the latest shared snapshot on first use.
+
+    Returns:
+        UserTable: Users of the session (empty if no snapshot has been saved)
+    """
+    if not st.session_state.get("users_data"):
+        users_data, metadata = get_snapshot_registry().latest()
+        st.session_state.users_data = users_data if users_data is not None else UserTable()
+        st.session_state.user_snapshot = metadata
+        if metadata:
+            logger.debug(f"Using user snapshot v{metadata['version']} with {len(users_data)} users")
+    return st.session_state.users_data
+
+def publish_users(users_data, membership_index=None):
+    """
+    Save and share fetched users as a new snapshot, then make it this session's data.
+
+    The membership index is saved tagged with the new snapshot version, or
+    removed when the users carry their own groups, so no session pairs a
+    snapshot with the index of another. The session only switches once the
+    snapshot is saved, and drops results derived from its previous users.
+    The snapshot gets its own user database, and databases of snapshots no
+    session uses are removed.
+
+    Args:
+        users_data (iterable): User data dictionaries (or records of another table)
+        membership_index (MembershipIndex, optional): Group-centric membership index
+
+    Returns:
+        UserTable: New snapshot users
+    """
+    table = UserTable.from_users(users_data, membership_index)
+    registry = get_snapshot_registry()
+    metadata = registry.publish(table, membership_index)
+    _use_snapshot(table, metadata)
+    st.session_state.membership_index = membership_index
+    user_db.write_users(table, membership_index)
+    user_db.prune_databases(registry.versions())
+    return table
+
+def show_snapshot_freshness(refresh_link=True):
+    """
+    Show the version and age of the session's user snapshot.
+
+    Args:
+        refresh_link (bool): Add a link to the Fetch Data page to refresh the snapshot
+    """
+    metadata = st.session_state.get("user_snapshot")
+    if not metadata:
+        return
+    saved_at = datetime.strptime(metadata["savedAt"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+    age = datetime.now(timezone.utc) - saved_at
+    if age >= timedelta(days=1):
+        age_text = f"{age.days} day(s) ago"
+    elif age >= timedelta(hours=1):
+        age_text = f"{age.seconds // 3600} hour(s) ago"
+    else:
+        age_text = f"{age.seconds // 60} minute(s) ago"
+    message = f"User snapshot v{metadata['version']}: {metadata['userCount']} users saved {metadata['savedAt']} ({age_text})"
+    if age > SNAPSHOT_STALE_AFTER:
+        st.warning(f"⚠️ {message}. The data may be out of date.")
+    else:
+        st.caption(message)
+    registry = get_snapshot_registry()
+    latest_version = registry.latest_version()
+    if latest_version is not None and latest_version > metadata["version"]:
+        st.info(f"A newer user snapshot (v{latest_version}) was saved by another session.")
+        if st.button("Use latest user snapshot"):
+            _use_snapshot(*registry.latest())
+            st.rerun()
+    if refresh_link:
+        st.page_link(FETCH_PAGE, label="Refresh user data", icon="🔄")
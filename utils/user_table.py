@@ -0,0 +1,294 @@
+import hashlib
+import sys
+from collections.abc import MutableMapping, Sequence
+from utils.logger import setup_logger
+
+# Setup logger
+logger = setup_logger("user_table", "logs/app.log")
+
+# users_data column -> UserRecord attribute, in users_data column order
+RECORD_COLUMNS = {
+    "User ID": "id",
+    "User Principal Name": "upn",
+    "Display Name": "display_name",
+    "Job Title": "job_title",
+    "Department": "department",
+    "Account Enabled": "account_enabled",
+    "User Type": "user_type",
+    "Groups": "group_indices",
+}
+# Columns present only when users were fetched with signInActivity
+OPTIONAL_COLUMNS = {
+    "Last Sign-In": "last_signin",
+    "Last Non-Interactive Sign-In": "last_non_interactive_signin",
+}
+# Low-cardinality attributes whose strings are interned and shared between records
+INTERNED_ATTRIBUTES = {"job_title", "department", "user_type"}
+# Value of the "Groups" column for users without memberships
+NO_GROUPS = "No groups"
+# Record fingerprints are summed modulo this, so the table fingerprint ignores row order
+FINGERPRINT_MODULUS = 1 << 128
+
+def _format_account_enabled(value):
+    """Render an accountEnabled boolean the way the "Account Enabled" column does."""
+    if value is None:
+        return "n/a"
+    return "true" if value else "false"
+
+def _parse_account_enabled(value):
+    """Parse an "Account Enabled" column value into a boolean, or None if unknown."""
+    if isinstance(value, bool):
+        return value
+    return {"true": True, "false": False}.get(str(value).lower())
+
+class DatasetVersion:
+    """
+    Identity of a users_data snapshot, cheap to store and compare.
+
+    Combines the monotonic snapshot version with a fingerprint of the table
+    content, so caches keyed on it are invalidated by any new snapshot and
+    comparisons are O(1) regardless of tenant size.
+    """
+
+    __slots__ = ("version", "fingerprint")
+
+    def __init__(self, version, fingerprint):
+        """
+        Create a dataset version.
+
+        Args:
+            version (int): Monotonic snapshot version, or None for an unpublished table
+            fingerprint (str): Hex content fingerprint from UserTable
+        """
+        self.version = version
+        self.fingerprint = fingerprint
+
+    def __eq__(self, other):
+        if not isinstance(other, DatasetVersion):
+            return NotImplemented
+        return self.version == other.version and self.fingerprint == other.fingerprint
+
+    def __hash__(self):
+        return hash((self.version, self.fingerprint))
+
+    def __repr__(self):
+        return f"DatasetVersion(v{self.version}, {self.fingerprint[:12]})"
+
+def _record_fingerprint(record):
+    """Hash one record's users_data columns into an int."""
+    row = "\x1f".join(f"{column}\x1e{record[column]}" for column in record)
+    return int.from_bytes(hashlib.blake2b(row.encode("utf-8"), digest_size=16).digest(), "big")
+
+class UserRecord(MutableMapping):
+    """
+    One user of a UserTable.
+
+    Attributes are kept in slots, with accountEnabled as a boolean and groups
+    as a tuple of indices into the table's group names. The record also acts
+    as a users_data dictionary, rendering and parsing the original column
+    values on access, so existing code can keep using user["Department"],
+    user.get(...) and user.update(...).
+    """
+
+    __slots__ = ("table", *RECORD_COLUMNS.values(), *OPTIONAL_COLUMNS.values())
+
+    def __init__(self, table, user):
+        """
+        Build a record from a users_data row.
+
+        Args:
+            table (UserTable): Table owning the group names
+            user (Mapping): User data dictionary
+        """
+        self.table = table
+        for column in RECORD_COLUMNS:
+            self[column] = user.get(column)
+        for column in OPTIONAL_COLUMNS:
+            if column in user:
+                self[column] = user[column]
+
+    def __getitem__(self, column):
+        if column == "Account Enabled":
+            return _format_account_enabled(self.account_enabled)
+        if column == "Groups":
+            return self.table.groups_string(self.group_indices)
+        attribute = RECORD_COLUMNS.get(column) or OPTIONAL_COLUMNS.get(column)
+        if attribute is None:
+            raise KeyError(column)
+        try:
+            return getattr(self, attribute)
+        except AttributeError:
+            raise KeyError(column) from None
+
+    def __setitem__(self, column, value):
+        if self.table.frozen:
+            raise TypeError("Records of a shared user snapshot are read-only; build a new UserTable instead")
+        if column == "Account Enabled":
+            self.account_enabled = _parse_account_enabled(value)
+        elif column == "Groups":
+            self.group_indices = self.table.group_indices(value)
+        else:
+            attribute = RECORD_COLUMNS.get(column) or OPTIONAL_COLUMNS.get(column)
+            if attribute is None:
+                raise KeyError(f"Unknown users_data column: {column}")
+            if attribute in INTERNED_ATTRIBUTES and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, attribute, value)
+
+    def __delitem__(self, column):
+        if self.table.frozen:
+            raise TypeError("Records of a shared user snapshot are read-only; build a new UserTable instead")
+        attribute = OPTIONAL_COLUMNS.get(column)
+        if attribute is None or not hasattr(self, attribute):
+            raise KeyError(column)
+        delattr(self, attribute)
+
+    def __iter__(self):
+        yield from RECORD_COLUMNS
+        for column, attribute in OPTIONAL_COLUMNS.items():
+            if hasattr(self, attribute):
+                yield column
+
+    def __len__(self):
+        return len(RECORD_COLUMNS) + sum(hasattr(self, attribute) for attribute in OPTIONAL_COLUMNS.values())
+
+    def __repr__(self):
+        return f"UserRecord({dict(self)!r})"
+
+class UserTable(Sequence):
+    """
+    Compact, read-mostly replacement for the users_data list of dictionaries.
+
+    Holds one UserRecord per user and the group display names they refer to,
+    each stored once. Supports len(), indexing and iteration like the list it
+    replaces, and every record behaves like a users_data dictionary.
+    """
+
+    def __init__(self, group_names=()):
+        """
+        Create an empty table.
+
+        Args:
+            group_names (iterable): Initial group display names, referenced by position
+        """
+        self.records = []
+        self.frozen = False
+        self.version = None
+        self._fingerprint = 0
+        self.group_names = list(group_names)
+        self._group_positions = {}
+        for index, name in enumerate(self.group_names):
+            self._group_positions.setdefault(name, index)
+
+    @classmethod
+    def from_users(cls, users_data, membership_index=None):
+        """
+        Build a table from users_data rows.
+
+        Args:
+            users_data (iterable): User data dictionaries (or records of another table)
+            membership_index (MembershipIndex, optional): Group-centric index; when given,
+                group memberships are taken from it instead of the "Groups" column
+
+        Returns:
+            UserTable: Table holding one record per user
+        """
+        if membership_index is None:
+            table = cls()
+            for user in users_data:
+                table._append(UserRecord(table, user))
+        else:
+            table = cls(membership_index.group_names)
+            for user in users_data:
+                record = UserRecord(table, {column: user[column] for column in user if column != "Groups"})
+                record.group_indices = membership_index.user_groups.get(record.id, ())
+                table._append(record)
+        logger.debug(f"Built user table with {len(table.records)} users and {len(table.group_names)} groups")
+        return table
+
+    @property
+    def dataset_version(self):
+        """DatasetVersion: Snapshot version (None until published) and content fingerprint."""
+        return DatasetVersion(self.version, self.fingerprint)
+
+    @property
+    def fingerprint(self):
+        """str: Order-independent hex fingerprint of the table content, maintained as records are added."""
+        return f"{self._fingerprint:032x}"
+
+    @property
+    def group_count(self):
+        """int: Number of distinct group names referenced by the table."""
+        return len(self._group_positions)
+
+    def group_indices(self, groups_string):
+        """
+        Convert a "Groups" column value into group indices, adding new group names.
+
+        Args:
+            groups_string (str): Comma-separated group names, or "No groups"
+
+        Returns:
+            tuple: Indices into group_names
+        """
+        if not groups_string or groups_string == NO_GROUPS:
+            return ()
+        indices = []
+        for name in groups_string.split(", "):
+            index = self._group_positions.get(name)
+            if index is None:
+                index = self._group_positions[name] = len(self.group_names)
+                self.group_names.append(name)
+            indices.append(index)
+        return tuple(indices)
+
+    def groups_string(self, group_indices):
+        """
+        Format group indices the way the "Groups" column of users_data does.
+
+        Args:
+            group_indices (tuple): Indices into group_names
+
+        Returns:
+            str: Comma-separated group names, or "No groups"
+        """
+        if not group_indices:
+            return NO_GROUPS
+        return ", ".join(self.group_names[index] for index in group_indices)
+
+    def freeze(self, version):
+        """
+        Make the table's records read-only, so it can be shared between sessions.
+
+        Args:
+            version (int): Snapshot version the table is published as
+
+        Returns:
+            DatasetVersion: Version and content fingerprint of the frozen table
+        """
+        self.frozen = True
+        self.version = version
+        return self.dataset_version
+
+    def _append(self, record):
+        """Add a record while the table is being built, folding it into the fingerprint."""
+        self.records.append(record)
+        self._fingerprint = (self._fingerprint + _record_fingerprint(record)) % FINGERPRINT_MODULUS
+
+    def to_dicts(self):
+        """
+        Convert the table back to users_data dictionaries.
+
+        Returns:
+            list: List of user data dictionaries
+        """
+        return [dict(record) for record in self.records]
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)